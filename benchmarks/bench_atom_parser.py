@@ -0,0 +1,78 @@
+"""Microbenchmark: AtomEntry parser (pattern fast path and pull-parser fallback) vs. the old
+decode + ET.fromstring + three .// searches.
+
+Run from the repo root: python benchmarks/bench_atom_parser.py
+"""
+import os
+import sys
+import timeit
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.atom_parser import parse_atom_payload, _pull_parse
+
+PUSH = b"""<?xml version='1.0' encoding='UTF-8'?>
+<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns="http://www.w3.org/2005/Atom">
+ <link rel="hub" href="https://pubsubhubbub.appspot.com"/>
+ <link rel="self" href="https://www.youtube.com/xml/feeds/videos.xml?channel_id=UCxxxxxxxxxxxxxxxxxxxxxx"/>
+ <title>YouTube video feed</title>
+ <updated>2025-03-01T12:00:05.123456+00:00</updated>
+ <entry>
+  <id>yt:video:dQw4w9WgXcQ</id>
+  <yt:videoId>dQw4w9WgXcQ</yt:videoId>
+  <yt:channelId>UCxxxxxxxxxxxxxxxxxxxxxx</yt:channelId>
+  <title>A brand new video with a reasonably long title for realism</title>
+  <link rel="alternate" href="https://www.youtube.com/watch?v=dQw4w9WgXcQ"/>
+  <author>
+   <name>Some Channel</name>
+   <uri>https://www.youtube.com/channel/UCxxxxxxxxxxxxxxxxxxxxxx</uri>
+  </author>
+  <published>2025-03-01T12:00:00+00:00</published>
+  <updated>2025-03-01T12:00:05.123456+00:00</updated>
+ </entry>
+</feed>
+"""
+
+DELETION = b"""<?xml version='1.0' encoding='UTF-8'?>
+<feed xmlns:at="http://purl.org/atompub/tombstones/1.0" xmlns="http://www.w3.org/2005/Atom">
+ <at:deleted-entry ref="yt:video:dQw4w9WgXcQ" when="2025-03-01T12:00:00+00:00">
+  <link href="https://www.youtube.com/watch?v=dQw4w9WgXcQ"/>
+  <at:by><name>Some Channel</name><uri>https://www.youtube.com/channel/UCxxxxxxxxxxxxxxxxxxxxxx</uri></at:by>
+ </at:deleted-entry>
+</feed>
+"""
+
+NAMESPACES = {"atom": "http://www.w3.org/2005/Atom", "yt": "http://www.youtube.com/xml/schemas/2015", "at": "http://purl.org/atompub/tombstones/1.0"}
+
+def legacy_parse(raw: bytes):
+    """The webhook's original extraction path."""
+    root = ET.fromstring(raw.decode("utf-8"))
+    if root.find(".//at:deleted-entry", NAMESPACES):
+        return None
+    video_id_elem = root.find(".//yt:videoId", NAMESPACES)
+    published_elem = root.find(".//atom:published", NAMESPACES)
+    return (
+        video_id_elem.text if video_id_elem is not None else None,
+        published_elem.text if published_elem is not None else None,
+    )
+
+def bench(label, func, payload, number=20000):
+    seconds = min(timeit.repeat(lambda: func(payload), number=number, repeat=5))
+    per_call = seconds / number * 1e6
+    print(f"{label:<28} {per_call:8.2f} us/call  {number / seconds:10.0f} calls/s")
+    return per_call
+
+if __name__ == "__main__":
+    entry = parse_atom_payload(PUSH)
+    assert entry.video_id == legacy_parse(PUSH)[0] == "dQw4w9WgXcQ"
+    assert entry == _pull_parse(PUSH)
+    assert parse_atom_payload(DELETION) == _pull_parse(DELETION)
+    assert parse_atom_payload(DELETION).deleted
+
+    for name, payload in (("push", PUSH), ("deletion", DELETION)):
+        print(f"-- {name} payload ({len(payload)} bytes)")
+        old = bench("legacy (fromstring + find)", legacy_parse, payload)
+        bench("pull parser fallback", _pull_parse, payload)
+        new = bench("parse_atom_payload", parse_atom_payload, payload)
+        print(f"speedup: {old / new:.2f}x\n")
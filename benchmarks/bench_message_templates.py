@@ -0,0 +1,100 @@
+"""Microbenchmark: compiled message templates (pre-serialized JSON, placeholders spliced in) vs. building
+the message with f-strings and json.dumps on every call.
+
+Run from the repo root: python benchmarks/bench_message_templates.py
+"""
+import json
+import os
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing the app needs its settings; point it at a throwaway data dir instead of the real one
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="ytnotis-bench-")
+os.environ.setdefault("YOUTUBE_CHANNEL_ID", "UCxxxxxxxxxxxxxxxxxxxxxx")
+os.environ.setdefault("YOUTUBE_API_KEY", "bench")
+os.environ.setdefault("DISCORD_NOTI_ROLE", "1234")
+os.environ.setdefault("DISCORD_WEBHOOK_URL", "https://discord.com/api/webhooks/1/bench")
+os.environ.setdefault("LOCAL_WEBHOOK_URL", "https://example.com")
+
+from src.channels import get_channel, load_channels
+from src.message_templates import compile_template, render, load_templates, _context, iso_to_unix, format_duration
+
+VIDEO = {
+    "title": "A brand new video with a reasonably long title for realism",
+    "url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "channelTitle": "Some Channel",
+    "thumbnail": "https://i.ytimg.com/vi/dQw4w9WgXcQ/maxresdefault.jpg",
+    "duration": "PT12M34S",
+    "liveBroadcastContent": "upcoming",
+    "scheduledStartTime": "2025-03-01T18:00:00Z",
+    "privacyStatus": "public",
+    "publishAt": None,
+}
+
+RICH = {
+    "content": "🎬 ${role_mention} New Video: ${title}!",
+    "embeds": [{
+        "title": "${title}",
+        "url": "${url}",
+        "color": 16711680,
+        "author": {"name": "${channel_name}"},
+        "image": {"url": "${thumbnail}"},
+        "fields": [{"name": "Duration", "value": "${duration}", "inline": True}],
+    }],
+}
+
+def legacy_upcoming(video_data):
+    """The pipeline's original upcoming-stream message."""
+    dt = datetime.fromisoformat(video_data["scheduledStartTime"].replace("Z", "+00:00"))
+    message = f"⭕ Livestream Scheduled!\nStarting <t:{int(dt.timestamp())}:R>!\n\n🔗 {video_data['url']}"
+    return json.dumps({"content": message})
+
+def legacy_rich(video_data, role="1234"):
+    """The same rich embed, built as a dict and serialized on every call."""
+    return json.dumps({
+        "content": f"🎬 <@&{role}> New Video: {video_data['title']}!",
+        "embeds": [{
+            "title": video_data["title"],
+            "url": video_data["url"],
+            "color": 16711680,
+            "author": {"name": video_data["channelTitle"]},
+            "image": {"url": video_data["thumbnail"]},
+            "fields": [{"name": "Duration", "value": format_duration(video_data["duration"]), "inline": True}],
+        }],
+    })
+
+def bench(label, func, number=50000):
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    per_call = seconds / number * 1e6
+    print(f"{label:<34} {per_call:8.2f} us/call  {number / seconds:10.0f} renders/s")
+    return per_call
+
+if __name__ == "__main__":
+    load_channels()
+    load_templates()
+    channel = get_channel("UCxxxxxxxxxxxxxxxxxxxxxx")
+    rich = compile_template(RICH)
+    context = _context(VIDEO, channel, "dQw4w9WgXcQ")
+
+    # Same JSON documents either way
+    assert json.loads(render("upcoming", VIDEO, channel)) == json.loads(legacy_upcoming(VIDEO))
+    assert json.loads(rich.render(context)) == json.loads(legacy_rich(VIDEO))
+    assert iso_to_unix(VIDEO["scheduledStartTime"]) == 1740852000
+
+    print("-- content-only message (upcoming stream)")
+    old = bench("legacy (fromisoformat + dumps)", lambda: legacy_upcoming(VIDEO))
+    new = bench("render (compiled template)", lambda: render("upcoming", VIDEO, channel))
+    print(f"speedup: {old / new:.2f}x\n")
+
+    print("-- rich embed (title, author, image, duration)")
+    old = bench("legacy (dict + dumps)", lambda: legacy_rich(VIDEO))
+    new = bench("render (compiled, context built)", lambda: rich.render(_context(VIDEO, channel, "dQw4w9WgXcQ")))
+    bench("render (compiled, context reused)", lambda: rich.render(context))
+    print(f"speedup: {old / new:.2f}x\n")
+
+    print("-- compiling, which happens once per template at startup")
+    bench("compile_template", lambda: compile_template(RICH), number=5000)
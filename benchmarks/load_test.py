@@ -0,0 +1,390 @@
+"""Offline load test: runs main.py against local stand-ins for the WebSub hub, the YouTube Data API
+(videos.list and the RSS feed) and a Discord webhook, then drives /webhook with signed Atom pushes.
+
+Reports push throughput, push-to-Discord latency (p50/p90/p99), and the app's thread count and RSS.
+Every stand-in has configurable latency and failure rate; Discord can also answer with 429s.
+
+Run from the repo root: python benchmarks/load_test.py --pushes 500 --rate 50
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse, urlencode
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOPIC_PREFIX = "https://www.youtube.com/xml/feeds/videos.xml?channel_id="
+VIDEO_URL_RE = re.compile(r"watch\?v=([\w-]+)")
+
+PUSH_TEMPLATE = """<?xml version='1.0' encoding='UTF-8'?>
+<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns="http://www.w3.org/2005/Atom">
+ <link rel="hub" href="https://pubsubhubbub.appspot.com"/>
+ <link rel="self" href="{topic}"/>
+ <title>YouTube video feed</title>
+ <updated>{now}</updated>
+ <entry>
+  <id>yt:video:{video_id}</id>
+  <yt:videoId>{video_id}</yt:videoId>
+  <yt:channelId>{channel_id}</yt:channelId>
+  <title>Load test video {video_id}</title>
+  <link rel="alternate" href="https://www.youtube.com/watch?v={video_id}"/>
+  <author><name>Load Test</name><uri>https://www.youtube.com/channel/{channel_id}</uri></author>
+  <published>{now}</published>
+  <updated>{now}</updated>
+ </entry>
+</feed>
+"""
+
+EMPTY_FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns="http://www.w3.org/2005/Atom"><title>Load Test</title></feed>
+"""
+
+class Behaviour:
+    """Latency and failure knobs of one stand-in server."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, fail_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: float = 1.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+
+    def delay(self):
+        seconds = self.latency + random.uniform(0, self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+class StandIn(BaseHTTPRequestHandler):
+    """Shared plumbing for the stand-in servers; subclasses set `behaviour` and `state` on the server."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # Keep the report readable
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _reply(self, status: int, body: bytes = b"", content_type: str = "application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+class HubHandler(StandIn):
+    """Accepts (un)subscribe requests and verifies intent against the callback, like the real hub (async mode)."""
+
+    def do_POST(self):
+        form = {key: values[0] for key, values in parse_qs(self._body().decode()).items()}
+        behaviour = self.server.behaviour
+        behaviour.delay()
+        if random.random() < behaviour.fail_rate:
+            self._reply(500, b"hub error", "text/plain")
+            return
+
+        self._reply(202)
+        threading.Thread(target=self._verify, args=(form,), daemon=True).start()
+
+    def _verify(self, form):
+        state = self.server.state
+        challenge = f"challenge-{random.getrandbits(32)}"
+        query = {
+            "hub.mode": form["hub.mode"],
+            "hub.topic": form["hub.topic"],
+            "hub.challenge": challenge,
+        }
+        if form["hub.mode"] == "subscribe":
+            query["hub.lease_seconds"] = form.get("hub.lease_seconds", "432000")
+
+        try:
+            callback = form["hub.callback"]
+            # The callback may carry its own query (the app's verify token), which hubs keep
+            separator = "&" if "?" in callback else "?"
+            with urllib.request.urlopen(f"{callback}{separator}{urlencode(query)}", timeout=10) as response:
+                verified = response.status == 200 and response.read().decode() == challenge
+        except urllib.error.URLError:
+            verified = False
+
+        with state["lock"]:
+            if verified and form["hub.mode"] == "subscribe":
+                state["secrets"][form["hub.topic"]] = form.get("hub.secret")
+            elif verified:
+                state["secrets"].pop(form["hub.topic"], None)
+
+class YouTubeHandler(StandIn):
+    """Serves videos.list (every ID is a public, complete video) and an empty RSS feed."""
+
+    def do_GET(self):
+        behaviour = self.server.behaviour
+        behaviour.delay()
+        parsed = urlparse(self.path)
+
+        if parsed.path.endswith("/videos.xml"):
+            self._reply(200, EMPTY_FEED, "application/atom+xml", {"ETag": '"empty"'})
+            return
+
+        if random.random() < behaviour.fail_rate:
+            self._reply(500, b'{"error": {"code": 500}}')
+            return
+
+        self.server.state["api_calls"] += 1
+        ids = parse_qs(parsed.query).get("id", [""])[0].split(",")
+        now = datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+        items = [
+            {
+                "id": video_id,
+                "snippet": {"title": f"Load test video {video_id}", "liveBroadcastContent": "none", "publishedAt": now},
+                "status": {"privacyStatus": "public"},
+                "contentDetails": {"duration": "PT4M13S"},
+            }
+            for video_id in ids if video_id
+        ]
+        self._reply(200, json.dumps({"etag": f"etag-{random.getrandbits(32)}", "items": items}).encode())
+
+class DiscordHandler(StandIn):
+    """Records when each announced video arrives; can answer with 429s and errors."""
+
+    def do_POST(self):
+        body = self._body()
+        behaviour = self.server.behaviour
+        state = self.server.state
+        behaviour.delay()
+
+        with state["lock"]:
+            state["requests"] += 1
+
+        if random.random() < behaviour.rate_limit_rate:
+            with state["lock"]:
+                state["rate_limited"] += 1
+            retry_after = behaviour.retry_after
+            self._reply(429, json.dumps({"retry_after": retry_after, "global": False}).encode(),
+                        headers={"Retry-After": str(retry_after), "X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": str(retry_after)})
+            return
+
+        if random.random() < behaviour.fail_rate:
+            self._reply(500, b'{"message": "Internal Server Error"}')
+            return
+
+        received = time.perf_counter()
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = {}
+        text = json.dumps(payload)
+        with state["lock"]:
+            for video_id in VIDEO_URL_RE.findall(text):
+                state["delivered"].setdefault(video_id, received)
+
+        self._reply(204, headers={"X-RateLimit-Remaining": "5", "X-RateLimit-Reset-After": "1"})
+
+def start_server(handler, behaviour: Behaviour, state: dict) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    server.behaviour = behaviour
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def free_port() -> int:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BaseHTTPRequestHandler)
+    port = server.server_address[1]
+    server.server_close()
+    return port
+
+def read_proc_status(pid: int) -> tuple:
+    """Returns (threads, rss_kb) of a process from /proc, or (None, None) where /proc isn't available."""
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(fields["Threads"].strip()), int(fields["VmRSS"].strip().split()[0])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+def percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def wait_for(predicate, timeout: float, interval: float = 0.1) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return predicate()
+
+def send_push(app_url: str, channel_id: str, video_id: str, secret: str) -> int:
+    now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    body = PUSH_TEMPLATE.format(topic=f"{TOPIC_PREFIX}{channel_id}", now=now, video_id=video_id, channel_id=channel_id).encode()
+    signature = "sha1=" + hmac.new(secret.encode(), body, hashlib.sha1).hexdigest()
+    request = urllib.request.Request(
+        f"{app_url}/webhook", data=body, method="POST",
+        headers={"Content-Type": "application/atom+xml", "X-Hub-Signature": signature},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except urllib.error.URLError:
+        return 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pushes", type=int, default=200, help="number of pushes (unique videos) to send")
+    parser.add_argument("--rate", type=float, default=20, help="pushes per second")
+    parser.add_argument("--channels", type=int, default=5, help="channels the pushes are spread over")
+    parser.add_argument("--senders", type=int, default=16, help="concurrent push senders")
+    parser.add_argument("--asgi", action="store_true", help="serve the app with uvicorn instead of Flask")
+    parser.add_argument("--youtube-latency", type=float, default=0.05)
+    parser.add_argument("--youtube-fail-rate", type=float, default=0.0)
+    parser.add_argument("--discord-latency", type=float, default=0.05)
+    parser.add_argument("--discord-fail-rate", type=float, default=0.0)
+    parser.add_argument("--discord-429-rate", type=float, default=0.0)
+    parser.add_argument("--discord-retry-after", type=float, default=1.0)
+    parser.add_argument("--hub-latency", type=float, default=0.01)
+    parser.add_argument("--hub-fail-rate", type=float, default=0.0)
+    parser.add_argument("--drain-timeout", type=float, default=120, help="seconds to wait for deliveries after the last push")
+    parser.add_argument("--keep-data", action="store_true", help="keep the temporary data/log directory")
+    args = parser.parse_args()
+
+    hub_state = {"lock": threading.Lock(), "secrets": {}}
+    youtube_state = {"api_calls": 0}
+    discord_state = {"lock": threading.Lock(), "requests": 0, "rate_limited": 0, "delivered": {}}
+
+    hub = start_server(HubHandler, Behaviour(args.hub_latency, fail_rate=args.hub_fail_rate), hub_state)
+    youtube = start_server(YouTubeHandler, Behaviour(args.youtube_latency, args.youtube_latency / 2, args.youtube_fail_rate), youtube_state)
+    discord = start_server(
+        DiscordHandler,
+        Behaviour(args.discord_latency, args.discord_latency / 2, args.discord_fail_rate, args.discord_429_rate, args.discord_retry_after),
+        discord_state,
+    )
+
+    port = free_port()
+    app_url = f"http://127.0.0.1:{port}"
+    channel_ids = [f"UCloadtest{i:012d}" for i in range(args.channels)]
+    workdir = tempfile.mkdtemp(prefix="ytnotis-load-")
+
+    env = dict(
+        os.environ,
+        YOUTUBE_API_KEY="load-test",
+        YOUTUBE_CHANNEL_ID=",".join(channel_ids),
+        DISCORD_NOTI_ROLE="1234",
+        DISCORD_WEBHOOK_URL=f"http://127.0.0.1:{discord.server_address[1]}/api/webhooks/1/load-test",
+        LOCAL_WEBHOOK_URL=app_url,
+        YOUTUBE_API_BASE=f"http://127.0.0.1:{youtube.server_address[1]}/youtube/v3",
+        YOUTUBE_FEED_BASE=f"http://127.0.0.1:{youtube.server_address[1]}/feeds",
+        WEBSUB_HUB_URL=f"http://127.0.0.1:{hub.server_address[1]}/subscribe",
+        DATA_DIR=os.path.join(workdir, "data"),
+        LOG_DIR=os.path.join(workdir, "logs"),
+        LOG_PAYLOAD_SAMPLE_RATE="0",
+    )
+    command = [sys.executable, "main.py", "--port", str(port)] + (["--asgi"] if args.asgi else [])
+    app = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    samples = []
+    sampling = threading.Event()
+
+    def sample_process():
+        while not sampling.wait(0.25):
+            samples.append(read_proc_status(app.pid))
+
+    try:
+        topics = [f"{TOPIC_PREFIX}{channel_id}" for channel_id in channel_ids]
+        print(f"Starting app on {app_url} with {args.channels} channels...")
+        if not wait_for(lambda: app.poll() is not None or all(topic in hub_state["secrets"] for topic in topics), 60):
+            print("Timed out waiting for the app to subscribe every channel.")
+            return 1
+        if app.poll() is not None:
+            print(f"App exited early:\n{app.stderr.read().decode(errors='replace')}")
+            return 1
+
+        idle_threads, idle_rss = read_proc_status(app.pid)
+        threading.Thread(target=sample_process, daemon=True).start()
+
+        sent_at = {}
+        statuses = {}
+        statuses_lock = threading.Lock()
+
+        def push(index: int):
+            channel_id = channel_ids[index % len(channel_ids)]
+            video_id = f"lt{index:09d}"
+            secret = hub_state["secrets"][f"{TOPIC_PREFIX}{channel_id}"]
+            sent_at[video_id] = time.perf_counter()
+            status = send_push(app_url, channel_id, video_id, secret)
+            with statuses_lock:
+                statuses[status] = statuses.get(status, 0) + 1
+
+        print(f"Sending {args.pushes} pushes at {args.rate:g}/s...")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.senders) as pool:
+            for index in range(args.pushes):
+                # Open-loop pacing: pushes go out on schedule however slowly the app answers
+                delay = start + index / args.rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(push, index)
+        push_seconds = time.perf_counter() - start
+
+        accepted = statuses.get(202, 0)
+        wait_for(lambda: len(discord_state["delivered"]) >= accepted, args.drain_timeout, 0.2)
+        total_seconds = time.perf_counter() - start
+        sampling.set()
+
+        delivered = dict(discord_state["delivered"])
+        latencies = [(delivered[video_id] - sent) * 1000 for video_id, sent in sent_at.items() if video_id in delivered]
+        threads = [sample[0] for sample in samples if sample[0] is not None]
+        rss = [sample[1] for sample in samples if sample[1] is not None]
+
+        print()
+        print(f"push responses        {dict(sorted(statuses.items()))}")
+        print(f"push throughput       {args.pushes / push_seconds:8.1f} pushes/s ({push_seconds:.1f} s)")
+        print(f"delivered             {len(delivered)}/{accepted} accepted in {total_seconds:.1f} s "
+              f"({len(delivered) / total_seconds:.1f} videos/s)")
+        print(f"push->discord p50     {percentile(latencies, 0.50):8.1f} ms")
+        print(f"push->discord p90     {percentile(latencies, 0.90):8.1f} ms")
+        print(f"push->discord p99     {percentile(latencies, 0.99):8.1f} ms")
+        print(f"youtube api calls     {youtube_state['api_calls']}")
+        print(f"discord requests      {discord_state['requests']} ({discord_state['rate_limited']} answered 429)")
+        if threads:
+            print(f"threads               idle {idle_threads}, peak {max(threads)}")
+            print(f"rss                   idle {idle_rss / 1024:.1f} MiB, peak {max(rss) / 1024:.1f} MiB")
+        return 0 if len(delivered) >= accepted else 2
+
+    finally:
+        sampling.set()
+        if app.poll() is None:
+            app.send_signal(signal.SIGTERM)
+            try:
+                app.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                app.kill()
+        for server in (hub, youtube, discord):
+            server.shutdown()
+        if args.keep_data:
+            print(f"data and logs kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
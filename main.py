@@ -1,46 +1,125 @@
-import threading
+import argparse
+import json
+import os
 import signal
 import sys
-from flask import Flask
-from src.token_manager import rotate_token, unsubscribe_websub, get_current_token
-from src.webhook_handler import youtube_webhook
-from src.video_rechecks import resume_scheduled_tasks
-from src.config import HOST, PORT
+import time
+
+# Startup phases are timed from here (see mark_startup in src/services.py)
+STARTED_AT = time.perf_counter()
+
+# Only the config is imported up front; the pipeline is imported by the mode that needs it
+from src.config import HOST, PORT, ASGI_WORKERS, CHANNEL_IDS, CHANNELS_FILE, TEMPLATES_FILE, DB_FILE, DATABASE_URL, SHARED_DATABASE, find_config_problems
 from src.logger import log_message
 
-app = Flask(__name__)
+def create_app():
+  """Builds the Flask app serving /webhook, /stats and /metrics."""
+  from flask import Flask, jsonify
+  from src.webhook_handler import youtube_webhook
+  from src.atom_parser import MAX_PAYLOAD_BYTES
+  from src.services import get_stats
+  from src.metrics import render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+
+  app = Flask(__name__)
+  app.config["MAX_CONTENT_LENGTH"] = MAX_PAYLOAD_BYTES  # Oversized pushes get a 413 before the body is read
+
+  # Register the webhook route
+  app.add_url_rule('/webhook', 'youtube_webhook', youtube_webhook, methods=['GET', 'POST'])
+
+  def stats():
+    """Returns the pipeline, HTTP, channel and readiness stats as JSON."""
+    return jsonify(get_stats())
+
+  app.add_url_rule('/stats', 'stats', stats, methods=['GET'])
 
-# Register the webhook route
-app.add_url_rule('/webhook', 'youtube_webhook', youtube_webhook, methods=['GET', 'POST'])
+  def metrics():
+    """Returns the counters and latency histograms in the Prometheus text format."""
+    return render_metrics(), 200, {"Content-Type": METRICS_CONTENT_TYPE}
 
-def start_token_rotation():
-  """Starts the token rotation in a separate thread."""
-  token_thread = threading.Thread(target=rotate_token, daemon=True)
-  token_thread.start()
+  app.add_url_rule('/metrics', 'metrics', metrics, methods=['GET'])
+  return app
 
 def graceful_shutdown(signal_received, frame):
-    """Handles shutdown signal (SIGTERM) and unsubscribes before exiting."""
-    log_message("⚠️ Received termination signal. Unsubscribing from WebSub...")
-
-    current_token = get_current_token()
-    if current_token:
-        unsubscribe_websub(current_token)
-        log_message("✅ Successfully unsubscribed from WebSub.")
-    
+    """Handles shutdown signal (SIGTERM) and stops the background services before exiting."""
+    from src.services import stop_background_services
+
+    log_message("⚠️ Received termination signal. Stopping background services...")
+    stop_background_services()
     log_message("🔻 Shutting down gracefully.")
     sys.exit(0)  # Exit the script cleanly
 
-# Register signal handler for graceful shutdown
-signal.signal(signal.SIGTERM, graceful_shutdown)
-signal.signal(signal.SIGINT, graceful_shutdown)  # Handle Ctrl+C for local testing
+def check_config() -> int:
+  """Validates the .env settings and the optional data files without opening the database or starting anything."""
+  problems = find_config_problems()
+
+  for path, expected in ((CHANNELS_FILE, list), (TEMPLATES_FILE, dict)):
+    if not os.path.exists(path):
+      continue
+    try:
+      with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    except (OSError, ValueError) as e:
+      problems.append(f"{path} can't be read: {e}")
+      continue
+    if not isinstance(data, expected):
+      problems.append(f"{path} must hold a JSON {'list' if expected is list else 'object'}")
+
+  if problems:
+    print("❌ Configuration problems:")
+    for problem in problems:
+      print(f"   - {problem}")
+    return 1
+
+  database = "Postgres (DATABASE_URL)" if DATABASE_URL else DB_FILE
+  print(f"✅ Configuration OK: {len(CHANNEL_IDS)} channel(s) in .env, database {database}{', shared' if SHARED_DATABASE else ''}.")
+  return 0
+
+def run_asgi(workers: int, port: int):
+  """Serves the ASGI app (src/asgi_app.py) with uvicorn. Background services start in its lifespan hook."""
+  import uvicorn
+
+  # The workers share the database and elect one of them to run the background jobs
+  if workers > 1:
+    os.environ["SHARED_DATABASE"] = "1"
+
+  log_message(f"🚀 Starting YouTube Webhook Server (ASGI, {workers} worker(s))...")
+  uvicorn.run("src.asgi_app:app", host=HOST, port=port, workers=workers, lifespan="on", access_log=False)
+
+def run_server(port: int):
+  """Serves the Flask app, binding the port before the background services start."""
+  from werkzeug.serving import make_server
+  from src.services import start_background_services_async, mark_startup
+
+  app = create_app()
+  mark_startup("imported", STARTED_AT)
+
+  # Listening first means the hub's verification requests and pushes get through while the (possibly slow)
+  # leader start-up runs; pushes wait in the work queue until the workers are up
+  server = make_server(HOST, port, app, threaded=True)
+  mark_startup("listening", STARTED_AT)
+  log_message(f"🚀 YouTube Webhook Server listening on {HOST}:{port}; starting background services...")
+
+  start_background_services_async(STARTED_AT)
+  server.serve_forever()
 
 if __name__ == "__main__":
-  log_message("🚀 Starting YouTube Webhook Server...")
+  parser = argparse.ArgumentParser(description="YouTube WebSub to Discord notifier")
+  parser.add_argument("--asgi", action="store_true", help="serve with uvicorn (ASGI) instead of the Flask development server")
+  parser.add_argument("--workers", type=int, default=ASGI_WORKERS, help="uvicorn worker processes (only with --asgi)")
+  parser.add_argument("--port", type=int, default=PORT, help=f"port to listen on (default {PORT})")
+  parser.add_argument("--check-config", action="store_true", help="validate the .env settings and data files, then exit")
+  cli_args = parser.parse_args()
+
+  if cli_args.check_config:
+    sys.exit(check_config())
 
-  # Resume any scheduled rechecks from the database
-  resume_scheduled_tasks()
+  if cli_args.asgi:
+    run_asgi(cli_args.workers, cli_args.port)
+    sys.exit(0)
 
-  # Start token rotation as a background task
-  start_token_rotation()
-  
-  app.run(host=HOST, port=PORT)
\ No newline at end of file
+  # Register signal handler for graceful shutdown
+  signal.signal(signal.SIGTERM, graceful_shutdown)
+  signal.signal(signal.SIGINT, graceful_shutdown)  # Handle Ctrl+C for local testing
+
+  log_message("🚀 Starting YouTube Webhook Server...")
+  run_server(cli_args.port)
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import time
+from urllib.parse import parse_qsl
+
+# Startup phases are timed from here, before the app's modules load (see mark_startup in src/services.py)
+STARTED_AT = time.perf_counter()
+
+from src.atom_parser import MAX_PAYLOAD_BYTES
+from src.webhook_handler import handle_webhook
+from src.services import start_background_services_async, stop_background_services, mark_startup, get_stats
+from src.metrics import render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from src.logger import log_message
+
+async def _read_body(receive) -> bytes | None:
+    """Collects the request body from the ASGI receive channel. Returns None once it exceeds the payload limit."""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_PAYLOAD_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+async def _respond(send, response, status: int, content_type: str | None = None):
+    """Sends a JSON (dict) or plain text (str) response."""
+    if isinstance(response, dict):
+        body = json.dumps(response).encode("utf-8")
+        content_type = b"application/json"
+    else:
+        body = str(response).encode("utf-8")
+        content_type = (content_type or "text/plain; charset=utf-8").encode("latin-1")
+
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def _lifespan(receive, send):
+    """Starts the background services with the server and stops them on shutdown.
+
+    Startup completes right away, so uvicorn binds the port while the services start on their own thread.
+    """
+    while True:
+        message = await receive()
+
+        if message["type"] == "lifespan.startup":
+            mark_startup("imported", STARTED_AT)
+            start_background_services_async(STARTED_AT)
+            await send({"type": "lifespan.startup.complete"})
+
+        elif message["type"] == "lifespan.shutdown":
+            log_message("⚠️ ASGI server shutting down. Stopping background services...")
+            try:
+                await asyncio.to_thread(stop_background_services)
+            except Exception as e:
+                log_message(f"❌ Error while stopping background services: {e}", level="error")
+            log_message("🔻 Shutting down gracefully.")
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    """ASGI entry point serving /webhook, /stats and /metrics as coroutines."""
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+
+    if scope["type"] != "http":
+        return
+
+    path = scope["path"]
+    method = scope["method"]
+
+    if path == "/webhook" and method in ("GET", "POST"):
+        args = dict(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True))
+        headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        body = await _read_body(receive)
+        if body is None:
+            await _respond(send, {"error": "Payload too large"}, 413)
+            return
+
+        # Nothing here waits on YouTube or Discord, but recording the push (and verifying a subscription) writes
+        # to the database, so it runs on a thread to keep other requests moving while SQLite syncs
+        response, status = await asyncio.to_thread(handle_webhook, method, args, body, headers)
+        await _respond(send, response, status)
+        return
+
+    if path == "/stats" and method == "GET":
+        await _respond(send, get_stats(), 200)
+        return
+
+    if path == "/metrics" and method == "GET":
+        await _respond(send, render_metrics(), 200, METRICS_CONTENT_TYPE)
+        return
+
+    await _respond(send, {"error": "Not Found"}, 404)
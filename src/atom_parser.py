@@ -0,0 +1,159 @@
+import re
+from dataclasses import dataclass
+from xml.etree.ElementTree import XMLPullParser
+
+# WebSub pushes from YouTube are ~1 KB; anything far bigger isn't a real notification
+MAX_PAYLOAD_BYTES = 64 * 1024
+# A channel's RSS feed carries its last 15 uploads, descriptions included
+MAX_FEED_BYTES = 1024 * 1024
+# Bytes fed to the parser at a time, so parsing can stop as soon as the entry is complete
+CHUNK_SIZE = 1024
+
+_ATOM = "{http://www.w3.org/2005/Atom}"
+_YT = "{http://www.youtube.com/xml/schemas/2015}"
+_TOMBSTONE = "{http://purl.org/atompub/tombstones/1.0}"
+
+_ENTRY = _ATOM + "entry"
+_PUBLISHED = _ATOM + "published"
+_UPDATED = _ATOM + "updated"
+_VIDEO_ID = _YT + "videoId"
+_CHANNEL_ID = _YT + "channelId"
+_DELETED_ENTRY = _TOMBSTONE + "deleted-entry"
+
+# Fast path: YouTube always uses these prefixes, so when they're declared the fields can be
+# pulled straight out of the bytes with pre-compiled patterns instead of building elements
+_ATOM_DECLARATION = b'xmlns="http://www.w3.org/2005/Atom"'
+_YT_DECLARATION = b'xmlns:yt="http://www.youtube.com/xml/schemas/2015"'
+_TOMBSTONE_DECLARATION = b'xmlns:at="http://purl.org/atompub/tombstones/1.0"'
+_ENTRY_START_RE = re.compile(rb"<entry[\s>]")
+_FIELD_RE = re.compile(rb"<(yt:videoId|yt:channelId|published|updated)>([^<&]*)</\1>")
+_DELETED_ENTRY_RE = re.compile(rb"<at:deleted-entry\s([^>]*)>")
+_REF_RE = re.compile(rb'\bref="yt:video:([^"&]*)"')
+_WHEN_RE = re.compile(rb'\bwhen="([^"&]*)"')
+
+class PayloadRejected(ValueError):
+    """The payload is too large or uses XML features we refuse to parse."""
+
+@dataclass(frozen=True, slots=True)
+class AtomEntry:
+    """The fields of a WebSub push that the pipeline needs."""
+    video_id: str | None
+    channel_id: str | None
+    published: str | None
+    updated: str | None
+    deleted: bool
+
+def _check_payload(raw: bytes, max_bytes: int = MAX_PAYLOAD_BYTES):
+    """Rejects oversized payloads and any DTD, which defuses entity expansion and external entities."""
+    if len(raw) > max_bytes:
+        raise PayloadRejected(f"Payload is {len(raw)} bytes, limit is {max_bytes}")
+    if b"<!DOCTYPE" in raw or b"<!ENTITY" in raw:
+        raise PayloadRejected("DTDs and entity declarations are not allowed")
+
+def _fast_parse(raw: bytes) -> AtomEntry | None:
+    """Extracts the entry with pre-compiled patterns. Returns None if the payload isn't in YouTube's usual shape."""
+    if _ATOM_DECLARATION not in raw:
+        return None
+
+    if b"<at:deleted-entry" in raw:
+        match = _DELETED_ENTRY_RE.search(raw) if _TOMBSTONE_DECLARATION in raw else None
+        ref = _REF_RE.search(match.group(1)) if match else None
+        if ref is None:
+            return None
+        when = _WHEN_RE.search(match.group(1))
+        return AtomEntry(ref.group(1).decode() or None, None, None, when.group(1).decode() if when else None, True)
+
+    if _YT_DECLARATION not in raw:
+        return None
+    start = _ENTRY_START_RE.search(raw)
+    end = raw.find(b"</entry>", start.end()) if start else -1
+    if end == -1:
+        return None
+
+    # Only look inside the first entry, so the feed-level <updated> isn't picked up
+    fields = dict(_FIELD_RE.findall(raw, start.end(), end))
+    video_id = fields.get(b"yt:videoId")
+    if not video_id:
+        return None
+
+    def text(name):
+        value = fields.get(name)
+        return value.decode() if value is not None else None
+
+    return AtomEntry(video_id.decode(), text(b"yt:channelId"), text(b"published"), text(b"updated"), False)
+
+def _pull_parse(raw: bytes) -> AtomEntry:
+    """Extracts the first entry (or deletion) with an incremental XML parser, stopping once it's complete."""
+    parser = XMLPullParser(events=("start", "end"))
+    video_id = channel_id = published = updated = None
+    in_entry = False
+
+    for offset in range(0, len(raw), CHUNK_SIZE):
+        parser.feed(raw[offset:offset + CHUNK_SIZE])
+
+        for event, elem in parser.read_events():
+            tag = elem.tag
+
+            if event == "start":
+                if tag == _ENTRY:
+                    in_entry = True
+                elif tag == _DELETED_ENTRY:
+                    # ref looks like "yt:video:VIDEO_ID"
+                    ref = elem.get("ref", "")
+                    video_id = ref.rsplit(":", 1)[-1] or None
+                    return AtomEntry(video_id, None, None, elem.get("when"), True)
+                continue
+
+            if not in_entry:
+                continue
+            if tag == _VIDEO_ID:
+                video_id = elem.text
+            elif tag == _CHANNEL_ID:
+                channel_id = elem.text
+            elif tag == _PUBLISHED:
+                published = elem.text
+            elif tag == _UPDATED:
+                updated = elem.text
+            elif tag == _ENTRY:
+                # Only the first entry matters; skip parsing the rest of the document
+                return AtomEntry(video_id, channel_id, published, updated, False)
+
+    parser.close()  # Raises ParseError for truncated documents
+    return AtomEntry(video_id, channel_id, published, updated, False)
+
+def parse_atom_payload(raw: bytes) -> AtomEntry:
+    """Extracts the first entry (or deletion) from a WebSub Atom push in a single pass over the raw bytes.
+
+    Raises PayloadRejected for oversized/unsafe payloads and xml.etree.ElementTree.ParseError for invalid XML.
+    """
+    _check_payload(raw)
+    return _fast_parse(raw) or _pull_parse(raw)
+
+def iter_atom_entries(raw: bytes):
+    """Yields every entry of an Atom document (e.g. a channel's RSS feed) in document order.
+
+    Raises the same errors as parse_atom_payload, with the larger MAX_FEED_BYTES limit.
+    """
+    _check_payload(raw, MAX_FEED_BYTES)
+    parser = XMLPullParser(events=("start", "end"))
+    fields = {}
+
+    for offset in range(0, len(raw), CHUNK_SIZE * 16):
+        parser.feed(raw[offset:offset + CHUNK_SIZE * 16])
+
+        for event, elem in parser.read_events():
+            tag = elem.tag
+            if event == "start":
+                if tag == _ENTRY:
+                    fields = {}  # Don't let feed-level fields leak into the entry
+                continue
+            if tag in (_VIDEO_ID, _CHANNEL_ID, _PUBLISHED, _UPDATED):
+                fields[tag] = elem.text
+            elif tag == _ENTRY:
+                yield AtomEntry(fields.get(_VIDEO_ID), fields.get(_CHANNEL_ID), fields.get(_PUBLISHED), fields.get(_UPDATED), False)
+                elem.clear()  # Descriptions and thumbnails aren't needed once the entry is read
+            elif tag == _DELETED_ENTRY:
+                ref = elem.get("ref", "")
+                yield AtomEntry(ref.rsplit(":", 1)[-1] or None, None, None, elem.get("when"), True)
+
+    parser.close()
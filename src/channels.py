@@ -0,0 +1,111 @@
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+
+from src.database import store_channels, get_channels
+from src.config import CHANNEL_IDS, CHANNELS_FILE, DISCORD_WEBHOOK_URL, DISCORD_NOTI_ROLE
+from src.logger import log_message
+
+TOPIC_PREFIX = "https://www.youtube.com/xml/feeds/videos.xml?channel_id="
+
+@dataclass(frozen=True, slots=True)
+class Channel:
+    """A watched YouTube channel and where its announcements go."""
+    channel_id: str
+    discord_webhook_url: str
+    discord_role: str
+
+    @property
+    def topic(self) -> str:
+        return f"{TOPIC_PREFIX}{self.channel_id}"
+
+# channel_id -> Channel, loaded from the channels table at startup (see start_background_services)
+_channels = {}
+_loaded = False
+_footprint = {"channels": 0, "bytes_per_channel": 0, "load_ms": 0.0}
+
+def _read_channels_file() -> list | None:
+    """Returns the optional channels file's entries: [] if there is none, None if it can't be read."""
+    if not os.path.exists(CHANNELS_FILE):
+        return []
+
+    try:
+        with open(CHANNELS_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        log_message(f"❌ Could not read {CHANNELS_FILE}: {e}", level="error")
+        return None
+
+def _configured_channels(entries: list):
+    """Yields (channel_id, webhook_url, role) rows from the .env and the channels file's entries."""
+    for channel_id in CHANNEL_IDS:
+        yield channel_id, DISCORD_WEBHOOK_URL, DISCORD_NOTI_ROLE
+
+    for entry in entries:
+        channel_id = entry.get("channel_id")
+        if not channel_id:
+            log_message(f"⚠️ Skipping channels.json entry without a channel_id: {entry}", level="warning")
+            continue
+        yield (
+            channel_id,
+            entry.get("discord_webhook_url") or DISCORD_WEBHOOK_URL,
+            str(entry.get("discord_role") or DISCORD_NOTI_ROLE),
+        )
+
+def _measure_footprint() -> int:
+    """Approximates the bytes held per registered channel (record, strings and dict slot)."""
+    if not _channels:
+        return 0
+
+    total = sys.getsizeof(_channels)
+    for channel in _channels.values():
+        total += sys.getsizeof(channel)
+        total += sum(sys.getsizeof(value) for value in (channel.channel_id, channel.discord_webhook_url, channel.discord_role))
+    return total // len(_channels)
+
+def load_channels():
+    """Syncs configured channels into the registry table and loads the registry into memory.
+
+    Channels no longer configured are dropped from the registry, unless the channels file couldn't be read.
+    """
+    start = time.perf_counter()
+    entries = _read_channels_file()
+    removed = store_channels(_configured_channels(entries or []), prune=entries is not None)
+    if removed:
+        log_message(f"🗑️ Removed {removed} channels that are no longer configured.")
+
+    global _loaded
+    _channels.clear()
+    for channel_id, webhook_url, role in get_channels():
+        # Identical webhook URLs and roles are shared between channels instead of copied
+        _channels[channel_id] = Channel(sys.intern(channel_id), sys.intern(webhook_url), sys.intern(role))
+    _loaded = True
+
+    _footprint["channels"] = len(_channels)
+    _footprint["bytes_per_channel"] = _measure_footprint()
+    _footprint["load_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    log_message(f"📡 Loaded {len(_channels)} channels (~{_footprint['bytes_per_channel']} bytes each, {_footprint['load_ms']} ms).")
+
+def get_channel(channel_id: str | None) -> Channel | None:
+    """Returns the registered channel with the given ID, if any."""
+    return _channels.get(channel_id) if channel_id else None
+
+def is_loaded() -> bool:
+    """Returns True once the registry was loaded, so a missing channel really is unknown."""
+    return _loaded
+
+def get_all_channels() -> list:
+    """Returns every registered channel."""
+    return list(_channels.values())
+
+def channel_id_from_topic(topic: str | None) -> str | None:
+    """Extracts the channel ID from a WebSub topic URL."""
+    if topic and topic.startswith(TOPIC_PREFIX):
+        return topic[len(TOPIC_PREFIX):]
+    return None
+
+def get_channel_stats() -> dict:
+    """Returns the registry size and its measured per-channel cost."""
+    return dict(_footprint)
@@ -1,91 +1,938 @@
-import sqlite3
+import json
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
 
-from src.config import DB_FILE
+from src.db_backend import get_backend, DatabaseError
+from src.video_archive import is_archived
+from src.config import SHARED_DATABASE
+from src.metrics import Histogram
 from src.logger import log_message
 
-def initialize_database():
-    """Creates the database and videos table if they don't exist."""
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS videos (
-                video_id TEXT PRIMARY KEY,
-                publishAt TEXT,
-                discordPosted BOOLEAN DEFAULT 0
-            )
-            """
+# Schema migrations, applied in order. The backend stores how many have run (PRAGMA user_version on SQLite).
+# A new Postgres database starts from POSTGRES_SCHEMA instead, so migrations after POSTGRES_SCHEMA_VERSION
+# run on both backends and must stick to SQL they share (e.g. DOUBLE PRECISION rather than REAL for timestamps).
+MIGRATIONS = [
+    # 1: Original tables
+    [
+        """
+        CREATE TABLE IF NOT EXISTS videos (
+            video_id TEXT PRIMARY KEY,
+            publishAt TEXT,
+            discordPosted BOOLEAN DEFAULT 0
         )
-        conn.commit()
-        conn.close()
-        log_message("📂 Database initialized successfully.")
-    except sqlite3.Error as e:
-        log_message(f"❌ Database initialization failed: {e}", level="error")
-
-def store_video_id(video_id: str, publish_at: str = "", discord_posted: bool = False):
-    """Insert or update video entry in the database."""
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO videos (video_id, publishAt, discordPosted)
-            VALUES (?, ?, ?)
-            ON CONFLICT(video_id) DO UPDATE SET
-                publishAt = excluded.publishAt,
-                discordPosted = excluded.discordPosted
-            """,
-            (video_id, publish_at, int(discord_posted))
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS scheduled_jobs (
+            job_key TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            target TEXT NOT NULL,
+            due_at REAL NOT NULL
+        )
+        """,
+    ],
+    # 2: Index for the scheduled videos query
+    [
+        "CREATE INDEX IF NOT EXISTS idx_videos_pending ON videos (discordPosted, publishAt)",
+    ],
+    # 3: Channel registry, and the channel each video belongs to
+    [
+        """
+        CREATE TABLE IF NOT EXISTS channels (
+            channel_id TEXT PRIMARY KEY,
+            discord_webhook_url TEXT NOT NULL,
+            discord_role TEXT NOT NULL
+        )
+        """,
+        "ALTER TABLE videos ADD COLUMN channel_id TEXT",
+    ],
+    # 4: Durable outbox of Discord messages waiting to be delivered
+    [
+        """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            webhook_url TEXT NOT NULL,
+            video_id TEXT,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            next_attempt_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)",
+    ],
+    # 5: Optional on-disk tier of the video metadata cache
+    [
+        """
+        CREATE TABLE IF NOT EXISTS video_cache (
+            video_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            etag TEXT,
+            expires_at REAL NOT NULL
+        )
+        """,
+    ],
+    # 6: WebSub subscription leases and secrets, and small named state values
+    [
+        """
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            topic TEXT PRIMARY KEY,
+            channel_id TEXT NOT NULL,
+            secret TEXT,
+            pending_secret TEXT,
+            previous_secret TEXT,
+            previous_until REAL NOT NULL DEFAULT 0,
+            lease_seconds INTEGER NOT NULL DEFAULT 0,
+            expires_at REAL NOT NULL DEFAULT 0,
+            verified_at REAL NOT NULL DEFAULT 0,
+            unsubscribing INTEGER NOT NULL DEFAULT 0
         )
-        conn.commit()
-        log_message(f"💽 Video stored: ID={video_id}, publishAt={publish_at}, discordPosted={discord_posted}")
-    except sqlite3.Error as e:
-        log_message(f"❌ Database error while storing video ID {video_id}: {e}", level="error")
-    finally:
-        conn.close()
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """,
+    ],
+    # 7: Conditional-GET validators and poll interval of each channel's RSS feed
+    [
+        """
+        CREATE TABLE IF NOT EXISTS feed_state (
+            channel_id TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            poll_interval REAL NOT NULL
+        )
+        """,
+    ],
+    # 8: Per-video notification state machine (see VIDEO_STATES)
+    [
+        "ALTER TABLE videos ADD COLUMN state TEXT NOT NULL DEFAULT 'seen'",
+        "ALTER TABLE videos ADD COLUMN state_changed_at REAL NOT NULL DEFAULT 0",
+        "ALTER TABLE videos ADD COLUMN first_seen_at REAL NOT NULL DEFAULT 0",
+        "ALTER TABLE videos ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE videos ADD COLUMN updated TEXT",
+        "ALTER TABLE videos ADD COLUMN metadata TEXT",
+        """
+        UPDATE videos SET
+            state = CASE
+                WHEN discordPosted = 1 THEN 'posted'
+                WHEN publishAt IS NOT NULL AND publishAt != '' THEN 'scheduled'
+                ELSE 'ignored'
+            END,
+            state_changed_at = CAST(strftime('%s', 'now') AS REAL),
+            first_seen_at = CAST(strftime('%s', 'now') AS REAL)
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_videos_state ON videos (state)",
+    ],
+    # 9: Scheduled livestreams followed until they go live (see src/livestreams.py)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS livestreams (
+            video_id TEXT PRIMARY KEY,
+            channel_id TEXT NOT NULL,
+            scheduled_start REAL,
+            announced_start REAL,
+            status TEXT NOT NULL DEFAULT 'upcoming',
+            actual_start REAL,
+            updated_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_livestreams_status ON livestreams (status)",
+    ],
+    # 10: Leases for electing the one node that runs the background jobs
+    [
+        """
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at DOUBLE PRECISION NOT NULL
+        )
+        """,
+    ],
+    # 11: Random token in a subscription's callback URL, fixed for its lifetime; the hub's verifications must echo it
+    [
+        "ALTER TABLE subscriptions ADD COLUMN verify_token TEXT",
+    ],
+    # 12: When a channel's feed was first polled; only videos published after it are backfilled
+    [
+        "ALTER TABLE feed_state ADD COLUMN backfill_after DOUBLE PRECISION",
+    ],
+]
+
+# The schema as of migration POSTGRES_SCHEMA_VERSION, in Postgres' dialect
+POSTGRES_SCHEMA_VERSION = 10
+POSTGRES_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS videos (
+        video_id TEXT PRIMARY KEY,
+        publishAt TEXT,
+        discordPosted INTEGER DEFAULT 0,
+        channel_id TEXT,
+        state TEXT NOT NULL DEFAULT 'seen',
+        state_changed_at DOUBLE PRECISION NOT NULL DEFAULT 0,
+        first_seen_at DOUBLE PRECISION NOT NULL DEFAULT 0,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        updated TEXT,
+        metadata TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_videos_pending ON videos (discordPosted, publishAt)",
+    "CREATE INDEX IF NOT EXISTS idx_videos_state ON videos (state)",
+    """
+    CREATE TABLE IF NOT EXISTS scheduled_jobs (
+        job_key TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        target TEXT NOT NULL,
+        due_at DOUBLE PRECISION NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS channels (
+        channel_id TEXT PRIMARY KEY,
+        discord_webhook_url TEXT NOT NULL,
+        discord_role TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS outbox (
+        id BIGSERIAL PRIMARY KEY,
+        webhook_url TEXT NOT NULL,
+        video_id TEXT,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at DOUBLE PRECISION NOT NULL,
+        next_attempt_at DOUBLE PRECISION NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)",
+    """
+    CREATE TABLE IF NOT EXISTS video_cache (
+        video_id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        etag TEXT,
+        expires_at DOUBLE PRECISION NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS subscriptions (
+        topic TEXT PRIMARY KEY,
+        channel_id TEXT NOT NULL,
+        secret TEXT,
+        pending_secret TEXT,
+        previous_secret TEXT,
+        previous_until DOUBLE PRECISION NOT NULL DEFAULT 0,
+        lease_seconds INTEGER NOT NULL DEFAULT 0,
+        expires_at DOUBLE PRECISION NOT NULL DEFAULT 0,
+        verified_at DOUBLE PRECISION NOT NULL DEFAULT 0,
+        unsubscribing INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS state (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        updated_at DOUBLE PRECISION NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS feed_state (
+        channel_id TEXT PRIMARY KEY,
+        etag TEXT,
+        last_modified TEXT,
+        poll_interval DOUBLE PRECISION NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS livestreams (
+        video_id TEXT PRIMARY KEY,
+        channel_id TEXT NOT NULL,
+        scheduled_start DOUBLE PRECISION,
+        announced_start DOUBLE PRECISION,
+        status TEXT NOT NULL DEFAULT 'upcoming',
+        actual_start DOUBLE PRECISION,
+        updated_at DOUBLE PRECISION NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_livestreams_status ON livestreams (status)",
+    """
+    CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,
+        holder TEXT NOT NULL,
+        expires_at DOUBLE PRECISION NOT NULL
+    )
+    """,
+]
+
+# Video lifecycle: seen (push accepted) -> fetching -> scheduled (members-first, waiting for publishAt)
+# -> notifying (message in the outbox) -> posted. Videos needing no announcement end as ignored;
+# give-ups end as failed. Both can be reopened by a push carrying a newer <updated>.
+VIDEO_STATES = ("seen", "fetching", "scheduled", "notifying", "posted", "ignored", "failed")
+# Not stored: reported for videos whose rows were moved to the archive (see src/video_archive.py)
+ARCHIVED = "archived"
+# States a new push leaves alone: the video is scheduled, being announced, done or long archived
+SETTLED_STATES = ("scheduled", "notifying", "posted", ARCHIVED)
+
+# Statements are kept as constants so sqlite3's statement cache reuses the compiled versions
+RECORD_SEEN_SQL = """
+    INSERT INTO videos (video_id, publishAt, discordPosted, channel_id, state, state_changed_at, first_seen_at, updated)
+    VALUES (?, '', 0, ?, 'seen', ?, ?, ?)
+    ON CONFLICT(video_id) DO UPDATE SET
+        state = 'seen',
+        state_changed_at = excluded.state_changed_at,
+        attempts = 0,
+        updated = excluded.updated,
+        channel_id = COALESCE(excluded.channel_id, videos.channel_id)
+    WHERE videos.state IN ('ignored', 'failed') AND excluded.updated IS NOT NULL
+        AND (videos.updated IS NULL OR videos.updated < excluded.updated)
+"""
+BEGIN_NOTIFY_SQL = """
+    INSERT INTO videos (video_id, publishAt, discordPosted, channel_id, state, state_changed_at, first_seen_at)
+    VALUES (?, '', 0, ?, 'notifying', ?, ?)
+    ON CONFLICT(video_id) DO UPDATE SET
+        state = 'notifying',
+        state_changed_at = excluded.state_changed_at,
+        channel_id = COALESCE(excluded.channel_id, videos.channel_id)
+    WHERE videos.state NOT IN ('notifying', 'posted')
+"""
+UPSERT_CHANNEL_SQL = """
+    INSERT INTO channels (channel_id, discord_webhook_url, discord_role)
+    VALUES (?, ?, ?)
+    ON CONFLICT(channel_id) DO UPDATE SET
+        discord_webhook_url = excluded.discord_webhook_url,
+        discord_role = excluded.discord_role
+"""
+UPSERT_JOB_SQL = """
+    INSERT INTO scheduled_jobs (job_key, kind, target, due_at)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(job_key) DO UPDATE SET due_at = excluded.due_at
+"""
+SUBSCRIPTION_COLUMNS = (
+    "topic, channel_id, secret, pending_secret, previous_secret, previous_until, lease_seconds, expires_at, verified_at, unsubscribing, verify_token"
+)
+UPSERT_SUBSCRIPTION_SQL = f"""
+    INSERT INTO subscriptions ({SUBSCRIPTION_COLUMNS})
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(topic) DO UPDATE SET
+        channel_id = excluded.channel_id, secret = excluded.secret, pending_secret = excluded.pending_secret,
+        previous_secret = excluded.previous_secret, previous_until = excluded.previous_until,
+        lease_seconds = excluded.lease_seconds, expires_at = excluded.expires_at,
+        verified_at = excluded.verified_at, unsubscribing = excluded.unsubscribing, verify_token = excluded.verify_token
+"""
+LIVESTREAM_COLUMNS = "video_id, channel_id, scheduled_start, announced_start, status, actual_start"
+UPSERT_LIVESTREAM_SQL = f"""
+    INSERT INTO livestreams ({LIVESTREAM_COLUMNS}, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(video_id) DO UPDATE SET
+        channel_id = excluded.channel_id, scheduled_start = excluded.scheduled_start,
+        announced_start = excluded.announced_start, status = excluded.status,
+        actual_start = excluded.actual_start, updated_at = excluded.updated_at
+"""
+ARCHIVE_COLUMNS = "video_id, channel_id, state, publishAt, first_seen_at, state_changed_at, updated, metadata"
+# Finished videos untouched since the cutoff; a stream still being followed keeps its row
+ARCHIVABLE_VIDEOS_SQL = f"""
+    SELECT {ARCHIVE_COLUMNS} FROM videos
+    WHERE video_id > ? AND state IN ('posted', 'ignored', 'failed') AND state_changed_at < ?
+        AND video_id NOT IN (SELECT video_id FROM livestreams WHERE status = 'upcoming')
+    ORDER BY video_id LIMIT ?
+"""
+# The same conditions again, so a video that changed after it was archived keeps its row
+DELETE_ARCHIVED_SQL = "DELETE FROM videos WHERE video_id = ? AND state IN ('posted', 'ignored', 'failed') AND state_changed_at < ?"
+# Takes the lease if it's free, expired or already ours; rowcount 0 means another holder still has it
+ACQUIRE_LEASE_SQL = """
+    INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+    ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+    WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+"""
+UPSERT_STATE_SQL = """
+    INSERT INTO state (key, value, updated_at)
+    VALUES (?, ?, ?)
+    ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+"""
+
+# SQLite file or Postgres, see src/db_backend.py
+_backend = get_backend()
+# One long-lived connection shared by every thread, serialized by this lock
+_conn = None
+_lock = threading.RLock()
+
+# video_id -> state of every video in the table, so duplicate checks never touch disk
+_video_states = {}
+# Shares one string object per state name across the map
+_STATE_NAMES = {state: state for state in VIDEO_STATES}
+
+DB_SECONDS = Histogram("ytnotis_db_seconds", "SQLite call latency, including waiting for the shared connection.", ("call",))
+
+def _timed_db(func):
+    """Records the wrapped database call's latency under its function name."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - start, func.__name__)
+    return wrapper
+
+def get_connection():
+    """Returns the shared connection. The first call opens it and initializes the database (see initialize_database)."""
+    global _conn
+    with _lock:
+        if _conn is None:
+            _conn = _backend.connect()
+            initialize_database()
+        return _conn
+
+@contextmanager
+def transaction():
+    """Runs the block in a single transaction on the shared connection, rolling back on error."""
+    with _lock:
+        conn = get_connection()
+        conn.execute(_backend.begin_sql)
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+def _run_migrations(conn):
+    """Applies any migrations newer than the database's schema version, one transaction each.
+
+    The version is read inside the transaction, under the backend's lock, so processes starting together don't both apply one.
+    """
+    while True:
+        with transaction():
+            _backend.lock_schema(conn)
+            version = _backend.get_schema_version(conn)
+            if version >= len(MIGRATIONS):
+                return
+
+            if _backend.name == "postgres" and version == 0:
+                statements, number = POSTGRES_SCHEMA, POSTGRES_SCHEMA_VERSION
+            else:
+                statements, number = MIGRATIONS[version], version + 1
+
+            for statement in statements:
+                conn.execute(statement)
+            _backend.set_schema_version(conn, number)
+        log_message(f"🧱 Applied database migration {number} ({_backend.name}).")
+
+def initialize_database():
+    """Brings the schema up to date and loads the known video IDs. Runs when the connection is first opened."""
+    try:
+        with _lock:
+            conn = get_connection()
+            _run_migrations(conn)
+            _video_states.clear()
+            _video_states.update((video_id, _STATE_NAMES.get(state, state)) for video_id, state in conn.execute("SELECT video_id, state FROM videos"))
+        log_message(f"📂 Database initialized successfully ({_backend.name}, {len(_video_states)} known videos).")
+    except DatabaseError as e:
+        log_message(f"❌ Database initialization failed: {e}", level="error")
 
 def is_video_in_db(video_id: str) -> bool:
-    """Check if the video ID already exists in the database."""
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1 FROM videos WHERE video_id = ?", (video_id,))
-        result = cursor.fetchone()
-        return bool(result)
-    except sqlite3.Error as e:
-        log_message(f"❌ Database error while checking video ID {video_id}: {e}", level="error")
+    """Check if the video ID already exists in the database (answered from memory)."""
+    return get_video_state(video_id) is not None
+
+def get_video_state(video_id: str) -> str | None:
+    """Returns the video's state (see VIDEO_STATES), ARCHIVED, or None if it was never seen. Answered from memory.
+
+    With SHARED_DATABASE, other processes add videos too, so a miss is looked up in the database.
+    """
+    if _conn is None:
+        get_connection()  # The known videos are loaded along with the connection
+    state = _video_states.get(video_id)
+    if state is None and SHARED_DATABASE:
+        state = _load_video_state(video_id)
+    if state is None and is_archived(video_id):
+        return ARCHIVED
+    return state
+
+@_timed_db
+def _load_video_state(video_id: str) -> str | None:
+    """Reads a video's state from the database into the memory map."""
+    try:
+        with _lock:
+            row = get_connection().execute("SELECT state FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+            if row is None:
+                return None
+            _video_states[video_id] = _STATE_NAMES.get(row[0], row[0])
+            return _video_states[video_id]
+    except DatabaseError as e:
+        log_message(f"❌ Database error while reading the state of video {video_id}: {e}", level="error")
+        return None
+
+@_timed_db
+def record_seen(video_id: str, channel_id: str | None, updated: str | None = None) -> bool:
+    """Records an accepted push before it's queued, so a crash can't lose it.
+
+    Returns True if the video is new, or was ignored/failed and this push carries a newer <updated> (reopened).
+    """
+    now = time.time()
+    try:
+        # The memory map is updated under the same lock, so it never disagrees with the table's order of events
+        with _lock:
+            with transaction() as conn:
+                changed = conn.execute(RECORD_SEEN_SQL, (video_id, channel_id, now, now, updated)).rowcount == 1
+            if changed:
+                _video_states[video_id] = "seen"
+        return changed
+    except DatabaseError as e:
+        log_message(f"❌ Database error while recording video {video_id}: {e}", level="error")
         return False
-    finally:
-        conn.close()
-
-def was_posted(video_id: str) -> bool:
-    """Check if the video has already been posted to Discord."""
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT discordPosted FROM videos WHERE video_id = ?", (video_id,))
-        result = cursor.fetchone()
-        return bool(result and result[0])
-    except sqlite3.Error as e:
-        log_message(f"❌ Database error while checking if video {video_id} was posted: {e}", level="error")
+
+@_timed_db
+def transition_video(video_id: str, state: str, from_states, add_attempt: bool = False, **changes) -> bool:
+    """Atomically moves a video to `state` if it's currently in one of `from_states`. Returns False if it wasn't.
+
+    changes may set publishAt, metadata (a dict, stored as JSON) or updated alongside the state.
+    """
+    assignments = ["state = ?", "state_changed_at = ?", "discordPosted = ?", "attempts = attempts + ?"]
+    params = [state, time.time(), int(state == "posted"), int(add_attempt)]
+    for column in ("publishAt", "metadata", "updated"):
+        if column in changes:
+            value = changes[column]
+            assignments.append(f"{column} = ?")
+            params.append(json.dumps(value) if column == "metadata" and value is not None else value)
+
+    from_states = tuple(from_states)
+    sql = f"UPDATE videos SET {', '.join(assignments)} WHERE video_id = ? AND state IN ({', '.join('?' * len(from_states))})"
+    try:
+        with _lock:
+            with transaction() as conn:
+                changed = conn.execute(sql, (*params, video_id, *from_states)).rowcount == 1
+            if changed:
+                _video_states[video_id] = _STATE_NAMES[state]
+            elif SHARED_DATABASE:
+                # Another process may have moved it; the memory map would otherwise keep the old state
+                _load_video_state(video_id)
+        return changed
+    except DatabaseError as e:
+        log_message(f"❌ Database error while moving video {video_id} to {state}: {e}", level="error")
         return False
-    finally:
-        conn.close()
 
+@_timed_db
+def get_videos_in_state(states, since: float = 0.0):
+    """Retrieve (video_id, channel_id, first_seen_at) of videos in any of the states, first seen after `since`."""
+    states = tuple(states)
+    try:
+        with _lock:
+            return get_connection().execute(
+                f"SELECT video_id, channel_id, first_seen_at FROM videos WHERE state IN ({', '.join('?' * len(states))}) AND first_seen_at >= ?",
+                (*states, since)
+            ).fetchall()
+    except DatabaseError as e:
+        log_message(f"❌ Database error while fetching videos in state {states}: {e}", level="error")
+        return []
+
+@_timed_db
+def get_video_channel(video_id: str) -> str | None:
+    """Returns the channel a stored video belongs to, if known."""
+    try:
+        with _lock:
+            result = get_connection().execute("SELECT channel_id FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+        return result[0] if result else None
+    except DatabaseError as e:
+        log_message(f"❌ Database error while looking up the channel of video {video_id}: {e}", level="error")
+        return None
+
+@_timed_db
 def get_scheduled_videos():
-    """Retrieve videos that need rechecking (have publishAt but no discordPosted)."""
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT video_id, publishAt FROM videos WHERE publishAt IS NOT NULL AND discordPosted = 0")
-        videos = cursor.fetchall()
-        return videos
-    except sqlite3.Error as e:
+    """Retrieve members-first videos waiting for their recheck as (video_id, publishAt) rows."""
+    try:
+        with _lock:
+            return get_connection().execute(
+                "SELECT video_id, publishAt FROM videos WHERE state = 'scheduled' AND publishAt IS NOT NULL AND publishAt != ''"
+            ).fetchall()
+    except DatabaseError as e:
         log_message(f"❌ Database error while fetching scheduled videos: {e}", level="error")
         return []
-    finally:
-        conn.close()
 
-# Ensure the database is set up when the script runs
-initialize_database()
\ No newline at end of file
+@_timed_db
+def store_channels(channels, prune: bool = True) -> int:
+    """Insert or update (channel_id, discord_webhook_url, discord_role) entries in one transaction.
+
+    With prune, channels missing from the entries are deleted in the same transaction. Returns how many were.
+    """
+    channels = list(channels)
+    try:
+        with transaction() as conn:
+            conn.executemany(UPSERT_CHANNEL_SQL, channels)
+            if not prune:
+                return 0
+            configured = {row[0] for row in channels}
+            removed = [(row[0],) for row in conn.execute("SELECT channel_id FROM channels").fetchall() if row[0] not in configured]
+            conn.executemany("DELETE FROM channels WHERE channel_id = ?", removed)
+            return len(removed)
+    except DatabaseError as e:
+        log_message(f"❌ Database error while storing channels: {e}", level="error")
+        return 0
+
+@_timed_db
+def get_channels():
+    """Retrieve every registered channel as (channel_id, discord_webhook_url, discord_role) rows."""
+    try:
+        with _lock:
+            return get_connection().execute("SELECT channel_id, discord_webhook_url, discord_role FROM channels").fetchall()
+    except DatabaseError as e:
+        log_message(f"❌ Database error while fetching channels: {e}", level="error")
+        return []
+
+@_timed_db
+def queue_outbox_message(webhook_url: str, payload: str, video_id: str | None = None, channel_id: str | None = None) -> bool:
+    """Adds a Discord message to the outbox and, in the same transaction, moves its video to notifying.
+
+    Returns False (queueing nothing) if the video is already notifying or posted, so it's never announced twice.
+    """
+    now = time.time()
+    try:
+        with _lock:
+            with transaction() as conn:
+                if video_id and conn.execute(BEGIN_NOTIFY_SQL, (video_id, channel_id, now, now)).rowcount != 1:
+                    log_message(f"🔁 Video {video_id} is already being announced or posted. Not queueing it again.")
+                    return False
+                conn.execute(
+                    "INSERT INTO outbox (webhook_url, video_id, payload, created_at, next_attempt_at) VALUES (?, ?, ?, ?, ?)",
+                    (webhook_url, video_id, payload, now, now)
+                )
+            if video_id:
+                _video_states[video_id] = "notifying"
+        return True
+    except DatabaseError as e:
+        log_message(f"❌ Database error while queueing Discord message for {video_id}: {e}", level="error")
+        return False
+
+@_timed_db
+def get_due_outbox_messages(limit: int = 100):
+    """Retrieve pending outbox messages that are due, oldest first, as (id, webhook_url, video_id, payload, attempts, created_at) rows."""
+    try:
+        with _lock:
+            return get_connection().execute(
+                """
+                SELECT id, webhook_url, video_id, payload, attempts, created_at FROM outbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY id LIMIT ?
+                """,
+                (time.time(), limit)
+            ).fetchall()
+    except DatabaseError as e:
+        log_message(f"❌ Database error while fetching the Discord outbox: {e}", level="error")
+        return []
+
+@_timed_db
+def get_next_outbox_due_time() -> float | None:
+    """Returns when the next pending outbox message becomes due, if any."""
+    try:
+        with _lock:
+            result = get_connection().execute("SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending'").fetchone()
+        return result[0] if result else None
+    except DatabaseError as e:
+        log_message(f"❌ Database error while checking the Discord outbox: {e}", level="error")
+        return None
+
+@_timed_db
+def update_outbox_messages(message_ids, status: str, next_attempt_at: float | None = None, add_attempt: bool = True):
+    """Sets the status (and optionally the next attempt time) of outbox messages.
+
+    Sent and failed messages move their notifying videos to posted/failed in the same transaction.
+    """
+    message_ids = list(message_ids)
+    rows = [(status, next_attempt_at, int(add_attempt), message_id) for message_id in message_ids]
+    video_state = {"sent": "posted", "failed": "failed"}.get(status)
+    now = time.time()
+    try:
+        with _lock:
+            with transaction() as conn:
+                conn.executemany(
+                    """
+                    UPDATE outbox SET status = ?, next_attempt_at = COALESCE(?, next_attempt_at), attempts = attempts + ?
+                    WHERE id = ?
+                    """,
+                    rows
+                )
+                if not video_state or not message_ids:
+                    return
+                video_ids = [
+                    row[0] for row in conn.execute(
+                        f"SELECT video_id FROM outbox WHERE id IN ({', '.join('?' * len(message_ids))}) AND video_id IS NOT NULL",
+                        message_ids
+                    )
+                ]
+                conn.executemany(
+                    "UPDATE videos SET state = ?, state_changed_at = ?, discordPosted = ? WHERE video_id = ? AND state = 'notifying'",
+                    [(video_state, now, int(video_state == "posted"), video_id) for video_id in video_ids]
+                )
+            for video_id in video_ids:
+                if _video_states.get(video_id) == "notifying":
+                    _video_states[video_id] = video_state
+    except DatabaseError as e:
+        log_message(f"❌ Database error while updating {len(rows)} outbox messages: {e}", level="error")
+
+@_timed_db
+def get_cached_video(video_id: str):
+    """Retrieve a cached API response as (data_json, etag, expires_at), if any."""
+    try:
+        with _lock:
+            return get_connection().execute("SELECT data, etag, expires_at FROM video_cache WHERE video_id = ?", (video_id,)).fetchone()
+    except DatabaseError as e:
+        log_message(f"❌ Database error while reading cached video {video_id}: {e}", level="error")
+        return None
+
+@_timed_db
+def save_cached_video(video_id: str, data_json: str, etag: str | None, expires_at: float):
+    """Insert or update a cached API response."""
+    try:
+        with transaction() as conn:
+            conn.execute(
+                """
+                INSERT INTO video_cache (video_id, data, etag, expires_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(video_id) DO UPDATE SET data = excluded.data, etag = excluded.etag, expires_at = excluded.expires_at
+                """,
+                (video_id, data_json, etag, expires_at)
+            )
+    except DatabaseError as e:
+        log_message(f"❌ Database error while caching video {video_id}: {e}", level="error")
+
+@_timed_db
+def save_scheduled_job(job_key: str, kind: str, target: str, due_at: float):
+    """Insert or update a scheduler job so it survives restarts."""
+    try:
+        with transaction() as conn:
+            conn.execute(UPSERT_JOB_SQL, (job_key, kind, target, due_at))
+    except DatabaseError as e:
+        log_message(f"❌ Database error while saving scheduled job {job_key}: {e}", level="error")
+
+@_timed_db
+def delete_scheduled_job(job_key: str):
+    """Remove a scheduler job once it has run or been cancelled."""
+    try:
+        with transaction() as conn:
+            conn.execute("DELETE FROM scheduled_jobs WHERE job_key = ?", (job_key,))
+    except DatabaseError as e:
+        log_message(f"❌ Database error while deleting scheduled job {job_key}: {e}", level="error")
+
+@_timed_db
+def delete_scheduled_jobs(job_keys):
+    """Remove several scheduler jobs in one transaction."""
+    try:
+        with transaction() as conn:
+            conn.executemany("DELETE FROM scheduled_jobs WHERE job_key = ?", [(job_key,) for job_key in job_keys])
+    except DatabaseError as e:
+        log_message(f"❌ Database error while deleting {len(job_keys)} scheduled jobs: {e}", level="error")
+
+@_timed_db
+def get_scheduled_jobs():
+    """Retrieve all persisted scheduler jobs as (kind, target, due_at) rows."""
+    try:
+        with _lock:
+            return get_connection().execute("SELECT kind, target, due_at FROM scheduled_jobs").fetchall()
+    except DatabaseError as e:
+        log_message(f"❌ Database error while fetching scheduled jobs: {e}", level="error")
+        return []
+
+@_timed_db
+def get_subscription(topic: str):
+    """Retrieve one subscription row (SUBSCRIPTION_COLUMNS order), or None."""
+    try:
+        with _lock:
+            return get_connection().execute(f"SELECT {SUBSCRIPTION_COLUMNS} FROM subscriptions WHERE topic = ?", (topic,)).fetchone()
+    except DatabaseError as e:
+        log_message(f"❌ Database error while fetching subscription {topic}: {e}", level="error")
+        return None
+
+@_timed_db
+def get_subscriptions():
+    """Retrieve every WebSub subscription row, columns in SUBSCRIPTION_COLUMNS order."""
+    try:
+        with _lock:
+            return get_connection().execute(f"SELECT {SUBSCRIPTION_COLUMNS} FROM subscriptions").fetchall()
+    except DatabaseError as e:
+        log_message(f"❌ Database error while fetching subscriptions: {e}", level="error")
+        return []
+
+@_timed_db
+def save_subscription(row) -> bool:
+    """Insert or replace a subscription row (columns in SUBSCRIPTION_COLUMNS order)."""
+    try:
+        with transaction() as conn:
+            conn.execute(UPSERT_SUBSCRIPTION_SQL, tuple(row))
+        return True
+    except DatabaseError as e:
+        log_message(f"❌ Database error while saving subscription {row[0]}: {e}", level="error")
+        return False
+
+@_timed_db
+def delete_subscription(topic: str):
+    """Remove a subscription once the hub confirmed the unsubscribe."""
+    try:
+        with transaction() as conn:
+            conn.execute("DELETE FROM subscriptions WHERE topic = ?", (topic,))
+    except DatabaseError as e:
+        log_message(f"❌ Database error while deleting subscription {topic}: {e}", level="error")
+
+@_timed_db
+def get_state(key: str):
+    """Returns a named state value and when it was last set as (value, updated_at), or None."""
+    try:
+        with _lock:
+            return get_connection().execute("SELECT value, updated_at FROM state WHERE key = ?", (key,)).fetchone()
+    except DatabaseError as e:
+        log_message(f"❌ Database error while reading state {key}: {e}", level="error")
+        return None
+
+@_timed_db
+def set_state(key: str, value: str) -> bool:
+    """Stores a named state value."""
+    try:
+        with transaction() as conn:
+            conn.execute(UPSERT_STATE_SQL, (key, value, time.time()))
+        return True
+    except DatabaseError as e:
+        log_message(f"❌ Database error while saving state {key}: {e}", level="error")
+        return False
+
+@_timed_db
+def get_feed_states():
+    """Retrieve every channel's (channel_id, etag, last_modified, poll_interval, backfill_after) feed row."""
+    try:
+        with _lock:
+            return get_connection().execute("SELECT channel_id, etag, last_modified, poll_interval, backfill_after FROM feed_state").fetchall()
+    except DatabaseError as e:
+        log_message(f"❌ Database error while fetching feed state: {e}", level="error")
+        return []
+
+@_timed_db
+def save_feed_state(channel_id: str, etag: str | None, last_modified: str | None, poll_interval: float, backfill_after: float | None = None):
+    """Insert or update a channel's feed validators, poll interval and backfill cutoff."""
+    try:
+        with transaction() as conn:
+            conn.execute(
+                """
+                INSERT INTO feed_state (channel_id, etag, last_modified, poll_interval, backfill_after) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(channel_id) DO UPDATE SET
+                    etag = excluded.etag, last_modified = excluded.last_modified, poll_interval = excluded.poll_interval,
+                    backfill_after = excluded.backfill_after
+                """,
+                (channel_id, etag, last_modified, poll_interval, backfill_after)
+            )
+    except DatabaseError as e:
+        log_message(f"❌ Database error while saving feed state for {channel_id}: {e}", level="error")
+
+@_timed_db
+def get_livestreams(status: str = "upcoming"):
+    """Retrieve livestream rows in the given status, columns in LIVESTREAM_COLUMNS order."""
+    try:
+        with _lock:
+            return get_connection().execute(f"SELECT {LIVESTREAM_COLUMNS} FROM livestreams WHERE status = ?", (status,)).fetchall()
+    except DatabaseError as e:
+        log_message(f"❌ Database error while fetching livestreams: {e}", level="error")
+        return []
+
+@_timed_db
+def save_livestreams(rows, messages=()) -> bool:
+    """Insert or replace livestream rows (LIVESTREAM_COLUMNS order) and queue (webhook_url, payload) outbox messages, in one transaction.
+
+    Saving a stream's new status together with its announcement means a crash can neither lose it nor post it twice.
+    """
+    now = time.time()
+    try:
+        with transaction() as conn:
+            conn.executemany(UPSERT_LIVESTREAM_SQL, [(*row, now) for row in rows])
+            # Not tied to the video's state: the stream's status is what guards these against repeats
+            conn.executemany(
+                "INSERT INTO outbox (webhook_url, video_id, payload, created_at, next_attempt_at) VALUES (?, NULL, ?, ?, ?)",
+                [(webhook_url, payload, now, now) for webhook_url, payload in messages]
+            )
+        return True
+    except DatabaseError as e:
+        log_message(f"❌ Database error while saving {len(rows)} livestreams: {e}", level="error")
+        return False
+
+@_timed_db
+def acquire_lease(name: str, holder: str, ttl: float) -> bool:
+    """Takes or renews a named lease for `holder` until now + ttl. Returns False while another holder has it."""
+    now = time.time()
+    try:
+        with transaction() as conn:
+            return conn.execute(ACQUIRE_LEASE_SQL, (name, holder, now + ttl, now)).rowcount == 1
+    except DatabaseError as e:
+        log_message(f"❌ Database error while acquiring lease {name}: {e}", level="error")
+        return False
+
+@_timed_db
+def release_lease(name: str, holder: str):
+    """Gives up a lease if `holder` has it, so another node can take over right away."""
+    try:
+        with transaction() as conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+    except DatabaseError as e:
+        log_message(f"❌ Database error while releasing lease {name}: {e}", level="error")
+
+@_timed_db
+def get_archivable_videos(cutoff: float, after_id: str = "", limit: int = 1000):
+    """Retrieve up to `limit` finished videos (ARCHIVE_COLUMNS) unchanged since the cutoff, ordered by ID after after_id."""
+    try:
+        with _lock:
+            return get_connection().execute(ARCHIVABLE_VIDEOS_SQL, (after_id, cutoff, limit)).fetchall()
+    except DatabaseError as e:
+        log_message(f"❌ Database error while fetching archivable videos: {e}", level="error")
+        return []
+
+@_timed_db
+def delete_archived_videos(video_ids, cutoff: float) -> int:
+    """Deletes the rows of archived videos, and their in-memory states. Returns how many were deleted."""
+    try:
+        with _lock:
+            with transaction() as conn:
+                deleted = [video_id for video_id in video_ids if conn.execute(DELETE_ARCHIVED_SQL, (video_id, cutoff)).rowcount]
+            for video_id in deleted:
+                _video_states.pop(video_id, None)
+        return len(deleted)
+    except DatabaseError as e:
+        log_message(f"❌ Database error while deleting {len(video_ids)} archived videos: {e}", level="error")
+        return 0
+
+@_timed_db
+def prune_outbox(before: float) -> int:
+    """Deletes sent and given-up Discord messages queued before the given time. Returns how many were deleted."""
+    try:
+        with transaction() as conn:
+            return conn.execute("DELETE FROM outbox WHERE status IN ('sent', 'failed') AND created_at < ?", (before,)).rowcount
+    except DatabaseError as e:
+        log_message(f"❌ Database error while pruning the outbox: {e}", level="error")
+        return 0
+
+@_timed_db
+def prune_livestreams(before: float) -> int:
+    """Deletes livestreams no longer followed (live, ended or dropped) since before the given time."""
+    try:
+        with transaction() as conn:
+            return conn.execute("DELETE FROM livestreams WHERE status != 'upcoming' AND updated_at < ?", (before,)).rowcount
+    except DatabaseError as e:
+        log_message(f"❌ Database error while pruning livestreams: {e}", level="error")
+        return 0
+
+@_timed_db
+def prune_video_cache(before: float) -> int:
+    """Deletes cached API responses that expired before the given time. Returns how many were deleted."""
+    try:
+        with transaction() as conn:
+            return conn.execute("DELETE FROM video_cache WHERE expires_at < ?", (before,)).rowcount
+    except DatabaseError as e:
+        log_message(f"❌ Database error while pruning the video cache: {e}", level="error")
+        return 0
+
+@_timed_db
+def compact_database() -> int:
+    """Gives free space back and refreshes the query planner's statistics (see the backend's compact). Returns the bytes freed."""
+    try:
+        with _lock:
+            return _backend.compact(get_connection())
+    except DatabaseError as e:
+        log_message(f"❌ Database error while compacting: {e}", level="error")
+        return 0
@@ -0,0 +1,109 @@
+import sqlite3
+from functools import lru_cache
+
+from src.config import DB_FILE, DATABASE_URL
+
+try:
+    import psycopg  # Optional, only needed for DATABASE_URL=postgresql://...
+except ImportError:
+    psycopg = None
+
+# What database.py catches around every call, whichever backend is in use
+DatabaseError = (sqlite3.Error,) if psycopg is None else (sqlite3.Error, psycopg.Error)
+
+class SQLiteBackend:
+    """The default: one SQLite file, which several processes on the same host may share (WAL + file locks)."""
+    name = "sqlite"
+    # Takes the write lock up front, so two processes can't deadlock upgrading read locks
+    begin_sql = "BEGIN IMMEDIATE"
+
+    def connect(self):
+        conn = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level=None, cached_statements=256)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")  # Only applies to a new file; compact() converts older ones
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL; only the last commits can roll back on power loss
+        conn.execute("PRAGMA busy_timeout=5000")  # Waits for another process's write instead of failing
+        return conn
+
+    def get_schema_version(self, conn) -> int:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def set_schema_version(self, conn, version: int):
+        conn.execute(f"PRAGMA user_version = {int(version)}")
+
+    def lock_schema(self, conn):
+        """Serializes migrations between processes; BEGIN IMMEDIATE already holds the write lock."""
+
+    def compact(self, conn) -> int:
+        """Returns the file's free pages to the filesystem, re-runs ANALYZE and truncates the WAL. Returns the bytes freed."""
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # Files created before incremental mode need one full VACUUM to switch; after that only free pages are moved
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        else:
+            conn.executescript("PRAGMA incremental_vacuum;")  # Frees a page per step; executescript steps it to the end
+
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        # A full VACUUM can leave the file a page or two bigger than it found it; that's nothing freed, not negative
+        return max(0, pages - conn.execute("PRAGMA page_count").fetchone()[0]) * page_size
+
+@lru_cache(maxsize=512)
+def _postgres_sql(sql: str) -> str:
+    """Rewrites sqlite3's ? placeholders to psycopg's %s (our statements hold no literal ? or %)."""
+    return sql.replace("BEGIN IMMEDIATE", "BEGIN").replace("?", "%s")
+
+class _PostgresConnection:
+    """Gives a psycopg connection the part of sqlite3.Connection that database.py uses."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def execute(self, sql: str, params=()):
+        return self._conn.execute(_postgres_sql(sql), tuple(params))
+
+    def executemany(self, sql: str, seq_of_params):
+        cursor = self._conn.cursor()
+        cursor.executemany(_postgres_sql(sql), [tuple(params) for params in seq_of_params])
+        return cursor
+
+class PostgresBackend:
+    """Shared Postgres database for running several nodes. Needs the optional psycopg package."""
+    name = "postgres"
+    begin_sql = "BEGIN"
+
+    def __init__(self, url: str):
+        self.url = url
+
+    def connect(self):
+        if psycopg is None:
+            raise RuntimeError("DATABASE_URL points at Postgres, but psycopg isn't installed (pip install 'psycopg[binary]')")
+        # Autocommit, so transaction() controls BEGIN/COMMIT itself, just as with sqlite3's isolation_level=None
+        return _PostgresConnection(psycopg.connect(self.url, autocommit=True))
+
+    def get_schema_version(self, conn) -> int:
+        conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+        row = conn.execute("SELECT version FROM schema_version").fetchone()
+        return row[0] if row else 0
+
+    def set_schema_version(self, conn, version: int):
+        conn.execute("DELETE FROM schema_version")
+        conn.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+
+    def lock_schema(self, conn):
+        """Serializes migrations between nodes for the rest of the transaction."""
+        conn.execute("SELECT pg_advisory_xact_lock(7158)")
+
+    def compact(self, conn) -> int:
+        """Refreshes the planner's statistics; autovacuum already reclaims dead rows on Postgres."""
+        conn.execute("ANALYZE")
+        return 0
+
+def get_backend():
+    """Picks the backend from DATABASE_URL: Postgres for postgres:// or postgresql:// URLs, else the SQLite file."""
+    if DATABASE_URL and DATABASE_URL.startswith(("postgres://", "postgresql://")):
+        return PostgresBackend(DATABASE_URL)
+    return SQLiteBackend()
@@ -1,57 +1,229 @@
+import json
+import random
+import threading
 import time
 import requests
 from datetime import datetime, timedelta
 
-from src.config import DISCORD_WEBHOOK_URL, DISCORD_NOTI_ROLE
+from src import http_client
+from src.database import queue_outbox_message, get_due_outbox_messages, get_next_outbox_due_time, update_outbox_messages
+from src.work_queue import record_stage
+from src.leader import is_leader
+from src.metrics import Counter, Histogram
+from src.config import (
+    DISCORD_WEBHOOK_URL, DISCORD_MAX_ATTEMPTS, DISCORD_RETRY_BASE, DISCORD_RETRY_MAX, DISCORD_COALESCE,
+    DISCORD_OUTBOX_POLL, SHARED_DATABASE
+)
 from src.logger import log_message
 
-def send_discord_message(message: str, retries: int = 3) -> bool:
-    """Sends a message to Discord, with retries on failure."""
-    payload = {"content": message}
-    headers = {"Content-Type": "application/json"}
-    
-    for attempt in range(retries):
-        response = requests.post(DISCORD_WEBHOOK_URL, json=payload, headers=headers)
-        
-        if response.status_code == 204:  # Success
-            log_message("✅ Discord Message Sent Successfully")
-            return True
-        
+# Discord limits for a single webhook message
+MAX_CONTENT_LENGTH = 2000
+MAX_EMBEDS = 10
+
+class RateLimitBucket:
+    """Tracks a webhook's rate limit from Discord's X-RateLimit headers."""
+    __slots__ = ("remaining", "reset_at")
+
+    def __init__(self):
+        self.remaining = 1
+        self.reset_at = 0.0
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a request may be sent, 0 if one may be sent now."""
+        if self.remaining > 0 or now >= self.reset_at:
+            return 0.0
+        return self.reset_at - now
+
+    def update(self, response: requests.Response, now: float):
+        """Follows the rate limit headers (and retry_after on a 429) of a response."""
+        headers = response.headers
+        try:
+            if "X-RateLimit-Remaining" in headers:
+                self.remaining = int(headers["X-RateLimit-Remaining"])
+            if "X-RateLimit-Reset-After" in headers:
+                self.reset_at = now + float(headers["X-RateLimit-Reset-After"])
+
+            if response.status_code == 429:
+                retry_after = float(headers.get("Retry-After") or response.json().get("retry_after", 2))
+                self.remaining = 0
+                self.reset_at = max(self.reset_at, now + retry_after)
+        except ValueError:
+            # Malformed headers or body, back off briefly rather than hammering the webhook
+            self.remaining = 0
+            self.reset_at = max(self.reset_at, now + 2)
+
+# webhook_url -> RateLimitBucket, only touched by the sender thread
+_buckets = {}
+_wake_sender = threading.Event()
+_sender_thread = None
+
+SEND_ATTEMPTS = Counter("ytnotis_discord_send_attempts_total", "Discord webhook requests by result.", ("result",))
+SEND_SECONDS = Histogram("ytnotis_discord_send_seconds", "Discord webhook request latency.")
+RETRY_AFTER_SECONDS = Counter("ytnotis_discord_retry_after_seconds_total", "Total time Discord asked us to wait after a 429.")
+
+def queue_discord_message(payload: str, webhook_url: str = DISCORD_WEBHOOK_URL, video_id: str | None = None, channel_id: str | None = None) -> bool:
+    """Durably queues a rendered JSON payload (see message_templates.render) for the Discord sender.
+
+    Moves the video to notifying. Returns False if it couldn't be stored, or the video was already announced.
+    """
+    if not queue_outbox_message(webhook_url, payload, video_id=video_id, channel_id=channel_id):
+        return False
+
+    _wake_sender.set()
+    return True
+
+def wake_sender():
+    """Wakes the sender for messages stored in the outbox without queue_discord_message."""
+    _wake_sender.set()
+
+def send_discord_message(payload: dict, webhook_url: str = DISCORD_WEBHOOK_URL) -> requests.Response | None:
+    """Sends a single message to a Discord webhook. Returns the response, or None if the request failed."""
+    start = time.perf_counter()
+    try:
+        response = http_client.post(webhook_url, json=payload, headers={"Content-Type": "application/json"})
+    except requests.exceptions.RequestException as e:
+        log_message(f"⚠️ Discord request failed: {e}")
+        SEND_ATTEMPTS.inc("exception")
+        return None
+    finally:
+        SEND_SECONDS.observe(time.perf_counter() - start)
+
+    if 200 <= response.status_code < 300:
+        SEND_ATTEMPTS.inc("ok")
+    elif response.status_code == 429:
+        SEND_ATTEMPTS.inc("rate_limited")
+    else:
+        SEND_ATTEMPTS.inc("error")
+    return response
+
+def _coalesce(rows):
+    """Merges queued messages into as few Discord payloads as the content/embed limits allow."""
+    batches = []  # [(payload, [rows])]
+
+    for row in rows:
+        payload = json.loads(row[3])
+
+        if DISCORD_COALESCE and batches:
+            merged, merged_rows = batches[-1]
+            content = "\n\n".join(part for part in (merged.get("content"), payload.get("content")) if part)
+            embeds = merged.get("embeds", []) + payload.get("embeds", [])
+
+            if len(content) <= MAX_CONTENT_LENGTH and len(embeds) <= MAX_EMBEDS:
+                merged["content"] = content
+                if embeds:
+                    merged["embeds"] = embeds
+                merged_rows.append(row)
+                continue
+
+        batches.append((payload, [row]))
+
+    return batches
+
+def _retry_delay(attempts: int) -> float:
+    """Exponential backoff with full jitter for the given attempt count."""
+    return random.uniform(0, min(DISCORD_RETRY_MAX, DISCORD_RETRY_BASE * 2 ** attempts))
+
+def _deliver(webhook_url: str, payload: dict, rows) -> float:
+    """Sends one (possibly coalesced) payload and records the outcome. Returns how long the bucket must wait."""
+    bucket = _buckets.setdefault(webhook_url, RateLimitBucket())
+    ids = [row[0] for row in rows]
+
+    response = send_discord_message(payload, webhook_url)
+    now = time.time()
+
+    if response is not None:
+        bucket.update(response, now)
+
+        if 200 <= response.status_code < 300:
+            update_outbox_messages(ids, "sent")
+            for row in rows:
+                record_stage("discord_delivery", now - row[5])
+            log_message(f"✅ Discord Message Sent Successfully ({len(rows)} queued message(s))")
+            return bucket.wait_time(now)
+
+        if response.status_code == 429:
+            # Not the message's fault, so this doesn't count towards its attempts
+            wait = bucket.wait_time(now)
+            RETRY_AFTER_SECONDS.inc(amount=wait)
+            log_message(f"⏳ Rate-limited! Retrying in {wait:.2f} seconds...")
+            update_outbox_messages(ids, "pending", next_attempt_at=now + wait, add_attempt=False)
+            return wait
+
         log_message(f"⚠️ Discord Response ({response.status_code}): {response.text}")
-        
-        if response.status_code == 429:  # Rate-limited
-            retry_after = response.json().get("retry_after", 2000) / 1000  # Convert ms → seconds
-            log_message(f"⏳ Rate-limited! Retrying in {retry_after} seconds...")
-            time.sleep(retry_after)
-        else:
-            time.sleep(2)  # Small delay before retrying
-    
-    log_message("❌ Failed to send Discord message after retries.")
-    return False
-
-def generate_discord_message(video_data):
-    """Determines the appropriate Discord message based on video type."""
-    
-    if video_data["liveBroadcastContent"] == "upcoming":
-        scheduled_time_iso = video_data.get("scheduledStartTime")
-        if scheduled_time_iso:
-            dt = datetime.fromisoformat(scheduled_time_iso.replace("Z", "+00:00"))
-            unix_timestamp = int(dt.timestamp())
-            scheduled_time = f"<t:{unix_timestamp}:R>"
+
+        # Any other 4xx means Discord rejected the message itself (bad payload, deleted webhook), so resending can't help
+        if 400 <= response.status_code < 500:
+            if len(rows) > 1:
+                # One bad message rejects the whole coalesced payload; send them one by one so only that one fails
+                return _deliver_batches(webhook_url, [(json.loads(row[3]), [row]) for row in rows], bucket.wait_time(now))
+            log_message(f"❌ Discord rejected message {rows[0][0]} (video {rows[0][2]}). Not retrying.", level="error")
+            update_outbox_messages(ids, "failed")
+            return bucket.wait_time(now)
+
+    # Failed send (network error or 5xx): back off each message individually, giving up after too many attempts
+    for row in rows:
+        attempts = row[4] + 1
+        if attempts >= DISCORD_MAX_ATTEMPTS:
+            log_message(f"❌ Failed to send Discord message {row[0]} (video {row[2]}) after {attempts} attempts.", level="error")
+            update_outbox_messages([row[0]], "failed")
         else:
-            scheduled_time = "Unknown Time"
-        
-        return f"⭕ Livestream Scheduled!\nStarting {scheduled_time}!\n\n🔗 {video_data['url']}"
-    
-    if video_data["liveBroadcastContent"] == "live":
-        return None  # Ignoring currently live streams
-    
-    if "liveStreamingDetails" in video_data:
-        return None  # Ignoring finished livestreams
-    
-    return f"🎬 <@&{DISCORD_NOTI_ROLE}> New Video: {video_data['title']}!\n🔗 {video_data['url']}"
-
-def should_notify(published_date_str, days_threshold=7):
+            update_outbox_messages([row[0]], "pending", next_attempt_at=now + _retry_delay(attempts))
+    return bucket.wait_time(now)
+
+def _deliver_batches(webhook_url: str, batches, wait: float = 0.0) -> float:
+    """Sends payloads in order, parking the rest once the webhook's bucket runs dry. Returns how long it must wait."""
+    for i, (payload, batch_rows) in enumerate(batches):
+        if wait > 0:
+            # Park the rest of this webhook's messages until its bucket resets
+            parked = [row[0] for _, rest in batches[i:] for row in rest]
+            update_outbox_messages(parked, "pending", next_attempt_at=time.time() + wait, add_attempt=False)
+            break
+        wait = _deliver(webhook_url, payload, batch_rows)
+    return wait
+
+def _sender_loop():
+    """Drains the outbox forever, respecting each webhook's rate limit bucket. Only the leader sends."""
+    # Other processes can't wake this thread, so with a shared database the outbox is polled
+    idle_wait = DISCORD_OUTBOX_POLL if SHARED_DATABASE else 60
+
+    while True:
+        _wake_sender.clear()
+        if not is_leader():
+            _wake_sender.wait(DISCORD_OUTBOX_POLL)
+            continue
+
+        rows = get_due_outbox_messages()
+
+        # Group by webhook, keeping the queue order within each group
+        by_webhook = {}
+        for row in rows:
+            by_webhook.setdefault(row[1], []).append(row)
+
+        for webhook_url, webhook_rows in by_webhook.items():
+            bucket = _buckets.get(webhook_url)
+            wait = bucket.wait_time(time.time()) if bucket else 0.0
+            _deliver_batches(webhook_url, _coalesce(webhook_rows), wait)
+
+        if rows:
+            continue  # More may be due right away
+
+        next_due = get_next_outbox_due_time()
+        _wake_sender.wait(min(idle_wait, max(0.05, next_due - time.time())) if next_due is not None else idle_wait)
+
+def start_discord_sender():
+    """Starts the outbox sender thread (only once, on the leader). Messages left over from a previous run are sent first."""
+    global _sender_thread
+    if _sender_thread is not None:
+        return
+
+    _sender_thread = threading.Thread(target=_sender_loop, name="discord-sender", daemon=True)
+    _sender_thread.start()
+    log_message("📮 Discord outbox sender started.")
+
+# Pushes for videos published longer ago than this are edits of old content
+NOTIFY_WINDOW_DAYS = 7
+
+def should_notify(published_date_str, days_threshold=NOTIFY_WINDOW_DAYS):
     """Returns True if the video was published within the last `days_threshold` days."""
     published_date = datetime.strptime(published_date_str, "%Y-%m-%dT%H:%M:%S%z")
     current_time = datetime.now(tz=published_date.tzinfo)  # Keep timezone consistent
@@ -0,0 +1,169 @@
+import random
+import time
+from datetime import datetime
+from statistics import median
+import xml.etree.ElementTree as ET
+import requests
+
+from src import http_client, inflight
+from src.atom_parser import iter_atom_entries, PayloadRejected
+from src.channels import get_all_channels, get_channel
+from src.database import is_video_in_db, record_seen, get_feed_states, save_feed_state
+from src.discord_notifier import should_notify
+from src.pipeline import process_video
+from src.scheduler import schedule, register_handler
+from src.work_queue import enqueue_job
+from src.metrics import Counter
+from src.config import FEED_POLL_MIN, FEED_POLL_MAX, FEED_POLL_FRACTION, YOUTUBE_FEED_BASE
+from src.logger import log_message
+
+FEED_URL = f"{YOUTUBE_FEED_BASE}/videos.xml?channel_id="
+
+# channel_id -> [etag, last_modified, poll_interval, backfill_after]
+_feeds = {}
+# channel_id -> feed video IDs this process already handed to the pipeline. Videos the pipeline
+# doesn't store (private, unlisted, no action) would otherwise be re-run on every poll.
+_handed_off = {}
+
+FEED_POLLS = Counter("ytnotis_feed_polls_total", "RSS feed polls by result.", ("result",))
+FEED_BACKFILLED = Counter("ytnotis_feed_backfilled_total", "Videos found in a feed that no push had delivered.")
+
+def _poll_interval(entries) -> float:
+    """Derives a poll interval from the gaps between a feed's uploads."""
+    published = []
+    for entry in entries:
+        try:
+            published.append(datetime.fromisoformat(entry.published).timestamp())
+        except (TypeError, ValueError):
+            continue
+
+    if len(published) < 2:
+        return FEED_POLL_MAX
+
+    published.sort()
+    gaps = [later - earlier for earlier, later in zip(published, published[1:])]
+    return min(FEED_POLL_MAX, max(FEED_POLL_MIN, median(gaps) * FEED_POLL_FRACTION))
+
+def _schedule_next(channel_id: str, interval: float):
+    # A little jitter keeps channels with equal intervals from polling in lockstep
+    schedule("reconcile", channel_id, time.time() + interval * random.uniform(0.9, 1.1), persist=False)
+
+def _is_missed(entry, seen, backfill_after: float | None) -> bool:
+    """True for a recent feed entry that no push (or earlier poll) has brought in."""
+    if entry.deleted or not entry.video_id or entry.video_id in seen or is_video_in_db(entry.video_id):
+        return False
+    try:
+        if not entry.published or not should_notify(entry.published):
+            return False
+        # Uploads from before the channel's first poll predate us watching it; the hub wouldn't have pushed them either
+        return backfill_after is None or datetime.fromisoformat(entry.published).timestamp() > backfill_after
+    except ValueError:
+        return False
+
+def reconcile_channel(channel_id: str):
+    """Polls one channel's RSS feed with a conditional GET and feeds videos missing from the database into the pipeline."""
+    if get_channel(channel_id) is None:
+        _feeds.pop(channel_id, None)
+        _handed_off.pop(channel_id, None)
+        return
+
+    # A channel without feed state was just added (or this is a fresh install): its first successful poll sets the baseline
+    feed = _feeds.get(channel_id)
+    first_poll = feed is None
+    etag, last_modified, interval, backfill_after = feed or (None, None, FEED_POLL_MIN, None)
+
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    try:
+        response = http_client.get(f"{FEED_URL}{channel_id}", headers=headers)
+    except requests.exceptions.RequestException as e:
+        FEED_POLLS.inc("error")
+        log_message(f"⚠️ Feed poll for {channel_id} failed: {e}", level="warning")
+        _schedule_next(channel_id, interval)
+        return
+
+    if response.status_code == 304:
+        FEED_POLLS.inc("not_modified")
+        _schedule_next(channel_id, interval)
+        return
+
+    if response.status_code >= 400:
+        FEED_POLLS.inc("error")
+        log_message(f"⚠️ Feed poll for {channel_id} returned {response.status_code}", level="warning")
+        _schedule_next(channel_id, interval)
+        return
+
+    try:
+        entries = list(iter_atom_entries(response.content))
+    except (PayloadRejected, ET.ParseError) as e:
+        FEED_POLLS.inc("error")
+        log_message(f"❌ Could not parse the feed for {channel_id}: {e}", level="error")
+        _schedule_next(channel_id, interval)
+        return
+
+    FEED_POLLS.inc("modified")
+    interval = _poll_interval(entries)
+    if first_poll:
+        backfill_after = time.time()
+        log_message(f"📌 First feed poll for {channel_id}: only videos published from now on will be backfilled.")
+    feed = _feeds[channel_id] = [response.headers.get("ETag"), response.headers.get("Last-Modified"), interval, backfill_after]
+    save_feed_state(channel_id, *feed)
+
+    seen = _handed_off.get(channel_id, set())
+    missed = 0
+    # The feed lists newest first; backfill in upload order
+    for entry in reversed(entries):
+        if not _is_missed(entry, seen, backfill_after):
+            continue
+
+        seen.add(entry.video_id)
+        # A push for it may be in flight right now, in which case that run covers it
+        if not inflight.claim(entry.video_id):
+            continue
+        # Recorded before it's queued so a crash can't lose it; a push for it may have just done so
+        if not record_seen(entry.video_id, channel_id, entry.updated):
+            inflight.release(entry.video_id, allow_rerun=False, debounce=False)
+            continue
+        # Skips the metadata cache: a reopened video's entry is what got it ignored (new videos aren't cached anyway)
+        if not enqueue_job(process_video, entry.video_id, channel_id, 0, None, True):
+            inflight.release(entry.video_id, allow_rerun=False)
+            seen.discard(entry.video_id)
+            continue
+        missed += 1
+
+    # Only remember IDs still in the feed, so this stays at most one feed's worth per channel
+    _handed_off[channel_id] = seen & {entry.video_id for entry in entries}
+
+    if missed:
+        FEED_BACKFILLED.inc(amount=missed)
+        log_message(f"🩹 Feed reconciliation found {missed} missed video(s) for {channel_id}.")
+
+    _schedule_next(channel_id, interval)
+
+def start_reconciler():
+    """Loads stored feed validators and schedules a first poll for every channel, spread over FEED_POLL_MIN."""
+    for channel_id, etag, last_modified, interval, backfill_after in get_feed_states():
+        _feeds[channel_id] = [etag, last_modified, interval, backfill_after]
+
+    now = time.time()
+    channels = get_all_channels()
+    for channel in channels:
+        # Poll soon after a start, since that's when pushes were most likely missed
+        schedule("reconcile", channel.channel_id, now + random.uniform(0, FEED_POLL_MIN), persist=False)
+
+    log_message(f"🩹 Feed reconciliation scheduled for {len(channels)} channels.")
+
+def get_reconciler_stats() -> dict:
+    """Returns how many feeds are tracked and their current poll intervals."""
+    intervals = [feed[2] for feed in list(_feeds.values())]
+    return {
+        "feeds": len(intervals),
+        "min_interval_s": round(min(intervals), 1) if intervals else None,
+        "max_interval_s": round(max(intervals), 1) if intervals else None,
+    }
+
+register_handler("reconcile", reconcile_channel, leader_only=True)
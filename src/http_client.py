@@ -0,0 +1,77 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+
+from src.config import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_POOL_SIZE
+
+# One keep-alive session per host, so each host gets its own connection pool
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Per-host stats: host -> [requests, errors, total_seconds, max_seconds]
+_host_stats = {}
+_stats_lock = threading.Lock()
+
+def _get_session(host: str) -> requests.Session:
+    """Returns the pooled session for a host, creating it on first use."""
+    session = _sessions.get(host)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+        return session
+
+def _record(host: str, seconds: float, error: bool):
+    """Adds a request sample to the host's latency and error counters."""
+    with _stats_lock:
+        stats = _host_stats.setdefault(host, [0, 0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += int(error)
+        stats[2] += seconds
+        stats[3] = max(stats[3], seconds)
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """Sends a request over the host's pooled session with default connect/read timeouts."""
+    kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    host = urlparse(url).netloc
+    session = _get_session(host)
+
+    start = time.monotonic()
+    try:
+        response = session.request(method, url, **kwargs)
+    except requests.exceptions.RequestException:
+        _record(host, time.monotonic() - start, error=True)
+        raise
+
+    _record(host, time.monotonic() - start, error=response.status_code >= 400)
+    return response
+
+def get(url: str, **kwargs) -> requests.Response:
+    """GET through the shared client."""
+    return request("GET", url, **kwargs)
+
+def post(url: str, **kwargs) -> requests.Response:
+    """POST through the shared client."""
+    return request("POST", url, **kwargs)
+
+def get_http_stats() -> dict:
+    """Returns per-host request counts, error counts and latency."""
+    with _stats_lock:
+        return {
+            host: {
+                "requests": count,
+                "errors": errors,
+                "avg_ms": round(total / count * 1000, 2) if count else 0.0,
+                "max_ms": round(longest * 1000, 2),
+            }
+            for host, (count, errors, total, longest) in _host_stats.items()
+        }
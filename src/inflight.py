@@ -0,0 +1,89 @@
+import threading
+import time
+
+from src.scheduler import schedule
+from src.config import PUSH_DEBOUNCE_SECONDS
+
+# Scheduler job kind that runs a debounced video once its window closes (handled in src/pipeline.py)
+DEBOUNCED_KIND = "debounced"
+
+# Videos with a pipeline run queued or in progress: video_id -> pushes merged into it since it started
+_running = {}
+# Videos whose run finished recently: video_id -> finished_at (for the debounce window)
+_recent = {}
+# Videos with pushes debounced since their last run, waiting for the window to close
+_deferred = set()
+_lock = threading.Lock()
+_counters = {"runs": 0, "coalesced": 0, "debounced": 0, "reruns": 0}
+
+def _prune_recent(now: float):
+    """Drops finished runs that are past the debounce window."""
+    expired = [video_id for video_id, finished_at in _recent.items() if now - finished_at > PUSH_DEBOUNCE_SECONDS]
+    for video_id in expired:
+        del _recent[video_id]
+
+def claim(video_id: str) -> bool:
+    """Claims a pipeline run for a pushed video. Returns False if the push was merged into another run."""
+    now = time.time()
+    with _lock:
+        if video_id in _running:
+            # Remember that something changed while running, so the run is repeated once at the end
+            _running[video_id] += 1
+            _counters["coalesced"] += 1
+            return False
+
+        finished_at = _recent.get(video_id)
+        if finished_at is None or now - finished_at >= PUSH_DEBOUNCE_SECONDS:
+            if len(_recent) > 1000:
+                _prune_recent(now)
+
+            _running[video_id] = 0
+            _counters["runs"] += 1
+            return True
+
+        _counters["debounced"] += 1
+        # The push may carry a change (e.g. a video made public right after it was ignored), so it's held, not
+        # dropped: every push in the window shares one run once it closes
+        first = video_id not in _deferred
+        _deferred.add(video_id)
+
+    if first:
+        schedule(DEBOUNCED_KIND, video_id, finished_at + PUSH_DEBOUNCE_SECONDS, persist=False)
+    return False
+
+def take_deferred(video_id: str) -> bool:
+    """Returns True (once) if pushes for the video were debounced and still need their run."""
+    with _lock:
+        if video_id in _deferred:
+            _deferred.discard(video_id)
+            return True
+        return False
+
+        if len(_recent) > 1000:
+            _prune_recent(now)
+
+        _running[video_id] = 0
+        _counters["runs"] += 1
+        return True
+
+def release(video_id: str, allow_rerun: bool = True, debounce: bool = True) -> bool:
+    """Ends a run. Returns True (keeping the claim) if pushes arrived during it and it should run once more.
+
+    debounce=False drops a claim that never ran, without holding off the pushes that follow.
+    """
+    with _lock:
+        merged = _running.get(video_id, 0)
+        if allow_rerun and merged:
+            _running[video_id] = 0
+            _counters["reruns"] += 1
+            return True
+
+        _running.pop(video_id, None)
+        if debounce:
+            _recent[video_id] = time.time()
+        return False
+
+def get_inflight_stats() -> dict:
+    """Returns the number of in-flight runs and how many pushes were merged or debounced."""
+    with _lock:
+        return {"in_flight": len(_running), **_counters}
@@ -0,0 +1,96 @@
+import os
+import socket
+import threading
+import time
+import uuid
+
+from src.database import acquire_lease, release_lease
+from src.metrics import Counter, Gauge
+from src.config import LEADER_LEASE_SECONDS, LEADER_RENEW_INTERVAL
+from src.logger import log_message
+
+LEASE_NAME = "leader"
+# Unique per process, and readable in the leases table
+NODE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+# Local monotonic deadline of our lease; 0 while we're not the leader
+_lease_until = 0.0
+_lock = threading.Lock()
+_on_elected = []
+_election_thread = None
+# One leader start-up at a time, even if leadership is lost and regained while one is still running
+_startup_lock = threading.Lock()
+_stopped = threading.Event()
+
+LEADER_CHANGES = Counter("ytnotis_leader_changes_total", "Times this process became or stopped being the leader.", ("change",))
+Gauge("ytnotis_leader", "1 while this process runs the background jobs.", lambda: int(is_leader()))
+
+def is_leader() -> bool:
+    """Returns True while this process holds an unexpired leader lease."""
+    return time.monotonic() < _lease_until
+
+def on_elected(callback):
+    """Registers a function to run (on a start-up thread, in order) each time this process becomes the leader."""
+    _on_elected.append(callback)
+
+def _campaign():
+    """Takes or renews the lease once, and runs the election callbacks when leadership was just gained."""
+    global _lease_until
+    # Counted from before the call, so a slow database can only shorten our idea of the lease
+    started = time.monotonic()
+    acquired = acquire_lease(LEASE_NAME, NODE_ID, LEADER_LEASE_SECONDS)
+
+    with _lock:
+        was_leader = is_leader()
+        # A little margin, so we stop before another node can see the lease as expired
+        _lease_until = started + LEADER_LEASE_SECONDS * 0.9 if acquired else 0.0
+
+    if acquired and not was_leader:
+        LEADER_CHANGES.inc("elected")
+        log_message(f"👑 {NODE_ID} is now the leader and runs the background jobs.")
+        # Off the election thread, which has to keep renewing the lease however long the start-up takes
+        threading.Thread(target=_run_elected_callbacks, name="leader-startup", daemon=True).start()
+    elif was_leader and not acquired:
+        LEADER_CHANGES.inc("lost")
+        log_message(f"⚠️ {NODE_ID} lost the leader lease; background jobs stop here.", level="warning")
+
+def _run_elected_callbacks():
+    """Runs the election callbacks, stopping early if the lease is lost meanwhile."""
+    with _startup_lock:
+        for callback in _on_elected:
+            if not is_leader():
+                log_message(f"⚠️ Lost the leader lease during start-up; skipping {callback.__name__} and the rest.", level="warning")
+                return
+            try:
+                callback()
+            except Exception as e:
+                log_message(f"❌ Leader start-up step {callback.__name__} failed: {e}", level="error")
+
+def _election_loop():
+    while not _stopped.wait(LEADER_RENEW_INTERVAL):
+        _campaign()
+
+def start_election():
+    """Campaigns once right away (a lone process leads from the start), then keeps renewing or retrying in the background.
+
+    The leader's services start on their own thread, so this returns without waiting for them.
+    """
+    global _election_thread
+    if _election_thread is not None:
+        return
+
+    _campaign()
+    if not is_leader():
+        log_message(f"🪑 {NODE_ID} is a follower; it serves /webhook while another process runs the background jobs.")
+
+    _election_thread = threading.Thread(target=_election_loop, name="leader-election", daemon=True)
+    _election_thread.start()
+
+def resign():
+    """Stops campaigning and hands the lease back, so another process takes over without waiting for it to expire."""
+    global _lease_until
+    _stopped.set()
+    if is_leader():
+        _lease_until = 0.0
+        release_lease(LEASE_NAME, NODE_ID)
+        log_message(f"👋 {NODE_ID} resigned as leader.")
@@ -0,0 +1,230 @@
+import threading
+import time
+from dataclasses import dataclass, replace
+
+from src.database import get_livestreams, save_livestreams
+from src.youtube_api import fetch_youtube_videos_data, MAX_IDS_PER_CALL
+from src.channels import get_channel
+from src.discord_notifier import wake_sender
+from src.message_templates import render, iso_to_unix
+from src.scheduler import schedule, register_handler
+from src.leader import is_leader
+from src.metrics import Counter, Gauge
+from src.config import (
+    LIVESTREAM_TRACKING, LIVESTREAM_WAKE_BEFORE, LIVESTREAM_POLL_INTERVAL, LIVESTREAM_IDLE_INTERVAL,
+    LIVESTREAM_RESCHEDULE_MIN, LIVESTREAM_GIVE_UP
+)
+from src.logger import log_message
+
+# One job polls every due stream, so the API calls per poll grow with the streams (50 per call), not per stream
+POLL_KIND = "livestream_poll"
+POLL_TARGET = "all"
+# Seconds a push about a tracked stream waits before its poll, so pushes close together share one call
+POKE_DELAY = 5
+
+@dataclass(slots=True)
+class LiveStream:
+    """A scheduled stream followed until it goes live, mirrored in the livestreams table."""
+    video_id: str
+    channel_id: str
+    scheduled_start: float | None = None  # Latest start time YouTube reports
+    announced_start: float | None = None  # Start time the last Discord message showed
+    status: str = "upcoming"  # -> live, ended (went live and ended between polls) or dropped
+    actual_start: float | None = None
+    next_check: float = 0.0  # Not stored; worked out again on load
+
+# video_id -> LiveStream, upcoming streams only
+_streams = {}
+_lock = threading.Lock()
+# Held by the running poll; a poll that fires meanwhile is skipped and the running one reschedules
+_poll_lock = threading.Lock()
+
+LIVESTREAM_EVENTS = Counter("ytnotis_livestream_events_total", "Changes seen on tracked livestreams.", ("event",))
+Gauge("ytnotis_livestreams_tracked", "Scheduled livestreams waiting to go live.", lambda: len(_streams))
+
+def _timestamp(iso: str | None) -> int | None:
+    """Parses an API timestamp to unix time, None if it's missing or malformed."""
+    return iso_to_unix(iso) if iso else None
+
+def _row(stream: LiveStream):
+    return (stream.video_id, stream.channel_id, stream.scheduled_start, stream.announced_start, stream.status, stream.actual_start)
+
+def _next_check(stream: LiveStream, now: float) -> float:
+    """Polls often once the start is near (or past), and only now and then for reschedules before that."""
+    start = stream.scheduled_start
+    if start is None:
+        return now + LIVESTREAM_IDLE_INTERVAL
+    if start - now <= LIVESTREAM_WAKE_BEFORE:
+        return now + LIVESTREAM_POLL_INTERVAL
+    return min(now + LIVESTREAM_IDLE_INTERVAL, start - LIVESTREAM_WAKE_BEFORE)
+
+def _schedule_poll():
+    """Schedules the poll job for the stream that's due first."""
+    with _lock:
+        if not _streams:
+            return
+        due_at = min(stream.next_check for stream in _streams.values())
+    schedule(POLL_KIND, POLL_TARGET, due_at, persist=False)
+
+def track_stream(video_id: str, channel_id: str, scheduled_start: str | None):
+    """Starts following a stream whose "scheduled" announcement was just queued."""
+    if not LIVESTREAM_TRACKING:
+        return
+
+    start = _timestamp(scheduled_start)
+    stream = LiveStream(video_id, channel_id, start, start)
+    stream.next_check = _next_check(stream, time.time())
+    if not save_livestreams([_row(stream)]):
+        return
+    if not is_leader():
+        # The leader polls; it loads the stored row at its next sync
+        log_message(f"📡 Stored livestream {video_id} for the leader to follow.")
+        return
+
+    with _lock:
+        _streams[video_id] = stream
+    _schedule_poll()
+    log_message(f"📡 Following livestream {video_id} until it goes live.")
+
+def is_tracked(video_id: str) -> bool:
+    """Returns True if the stream is being followed."""
+    return video_id in _streams
+
+def poke(video_id: str):
+    """Polls a tracked stream soon, e.g. because a push says it changed."""
+    with _lock:
+        stream = _streams.get(video_id)
+        if stream is None:
+            return
+        stream.next_check = min(stream.next_check, time.time() + POKE_DELAY)
+    _schedule_poll()
+
+def _check(stream: LiveStream, video_data, now: float):
+    """Works out what changed from fresh video data.
+
+    Returns (updated copy, (webhook_url, rendered payload) or None, event), or None if nothing did.
+    """
+    channel = get_channel(stream.channel_id)
+    if channel is None:
+        return replace(stream, status="dropped"), None, "unregistered"
+
+    # Past the give-up time without going live (or without YouTube returning it at all)
+    start = _timestamp(video_data.get("scheduledStartTime")) if video_data else None
+    latest_start = start or stream.scheduled_start
+    gave_up = latest_start is not None and now - latest_start > LIVESTREAM_GIVE_UP
+
+    if not video_data:
+        # Deleted, made private, or the call failed; keep trying until the give-up time
+        return (replace(stream, status="dropped"), None, "gave_up") if gave_up else None
+
+    actual_start = _timestamp(video_data.get("actualStartTime"))
+    broadcast = video_data.get("liveBroadcastContent")
+
+    if actual_start is not None:
+        if broadcast == "live":
+            message = render("live", video_data, channel, stream.video_id)
+            return replace(stream, status="live", actual_start=actual_start), (channel.discord_webhook_url, message), "live"
+        # Started and ended between two polls; too late to ping anyone
+        return replace(stream, status="ended", actual_start=actual_start), None, "ended"
+
+    if broadcast != "upcoming":
+        return replace(stream, status="dropped"), None, "cancelled"
+
+    if gave_up:
+        return replace(stream, status="dropped"), None, "gave_up"
+
+    if start is not None and (stream.announced_start is None or abs(start - stream.announced_start) >= LIVESTREAM_RESCHEDULE_MIN):
+        message = render("rescheduled", video_data, channel, stream.video_id)
+        return replace(stream, scheduled_start=start, announced_start=start), (channel.discord_webhook_url, message), "rescheduled"
+
+    if start != stream.scheduled_start and start is not None:
+        # Moved a little: not worth a message, but it shifts when to wake up
+        return replace(stream, scheduled_start=start), None, "moved"
+
+    return None
+
+def poll_streams(_target: str = POLL_TARGET):
+    """Scheduler handler: polls every due stream in batched videos.list calls and announces what changed."""
+    if not _poll_lock.acquire(blocking=False):
+        return
+    try:
+        _poll()
+    finally:
+        _poll_lock.release()
+        _schedule_poll()
+
+def _poll():
+    now = time.time()
+    with _lock:
+        streams = sorted(_streams.values(), key=lambda stream: stream.next_check)
+
+    due = [stream for stream in streams if stream.next_check <= now + LIVESTREAM_POLL_INTERVAL / 2]
+    if not due:
+        return
+    # Fill the last call's spare IDs with the streams due next; they cost no extra quota
+    due = streams[:len(due) + (-len(due) % MAX_IDS_PER_CALL)]
+
+    results = fetch_youtube_videos_data([stream.video_id for stream in due])
+    changes = []
+    for stream in due:
+        change = _check(stream, results.get(stream.video_id), now)
+        if change:
+            changes.append(change)
+
+    messages = [message for _, message, _ in changes if message]
+
+    if changes and not save_livestreams([_row(updated) for updated, _, _ in changes], messages):
+        # Nothing was stored or announced; try these again at the normal interval
+        changes, messages = [], []
+
+    with _lock:
+        for stream in due:
+            stream.next_check = _next_check(stream, now)
+        for updated, _, event in changes:
+            LIVESTREAM_EVENTS.inc(event)
+            if updated.status == "upcoming":
+                updated.next_check = _next_check(updated, now)
+                _streams[updated.video_id] = updated
+            else:
+                _streams.pop(updated.video_id, None)
+
+    for updated, _, event in changes:
+        if event in ("live", "rescheduled"):
+            log_message(f"📡 Livestream {updated.video_id} {event}; queued a Discord notification.")
+        elif updated.status != "upcoming":
+            log_message(f"📡 Stopped following livestream {updated.video_id} ({event}).")
+
+    if messages:
+        wake_sender()
+
+def start_livestreams():
+    """Loads the stored streams still waiting to go live and schedules the next poll. Runs on the leader.
+
+    Repeated at each cluster sync to pick up streams other processes stored; streams already followed are kept as they are.
+    """
+    now = time.time()
+    added = 0
+    with _lock:
+        for row in get_livestreams("upcoming"):
+            if row[0] in _streams:
+                continue
+            stream = LiveStream(*row)
+            stream.next_check = _next_check(stream, now)
+            _streams[stream.video_id] = stream
+            added += 1
+        count = len(_streams)
+
+    _schedule_poll()
+    if added:
+        log_message(f"📡 Following {count} scheduled livestreams ({added} newly loaded).")
+
+def get_livestream_stats() -> dict:
+    """Returns how many streams are followed and when the next one is polled."""
+    with _lock:
+        next_checks = [stream.next_check for stream in _streams.values()]
+    return {
+        "tracked": len(next_checks),
+        "next_poll_in_s": round(max(0.0, min(next_checks) - time.time()), 1) if next_checks else None,
+    }
+
+register_handler(POLL_KIND, poll_streams, leader_only=True)
@@ -1,36 +1,111 @@
 import os
+import re
+import gzip
+import json
+import shutil
+import queue
+import atexit
+import random
 import logging
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
 
 # Set the Log Dir / filename
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-LOGS_DIR = os.path.join(BASE_DIR, "logs")
+LOGS_DIR = os.getenv("LOG_DIR") or os.path.join(BASE_DIR, "logs")
 os.makedirs(LOGS_DIR, exist_ok=True)
 LOG_FILE = os.path.join(LOGS_DIR, "ytnotis.log")
 
-# Create a TimedRotatingFileHandler
+# Fraction of webhook payloads dumped to the log (0 disables, 1 logs every one)
+PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))
+
+# Field names whose values are never written to the log
+SECRET_FIELDS = {"token", "hub.secret", "key", "x-hub-signature"}
+
+# Secrets that can show up inside free text (URLs, dict reprs)
+REDACTIONS = [
+    (re.compile(r"([?&](?:token|key|hub\.secret)=)[^&\s'\"]+"), r"\1[REDACTED]"),
+    (re.compile(r"(['\"](?:token|key|hub\.secret)['\"]:\s*['\"])[^'\"]+"), r"\1[REDACTED]"),
+    (re.compile(r"(/api/webhooks/\d+/)[\w-]+"), r"\1[REDACTED]"),
+]
+
+def redact(text: str) -> str:
+    """Masks tokens, API keys and webhook secrets in a string."""
+    for pattern, replacement in REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+def _scrub(value):
+    """Redacts a structured field value, masking secret keys in mappings."""
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", errors="replace")
+    if isinstance(value, str):
+        return redact(value)
+    if isinstance(value, dict):
+        return {k: "[REDACTED]" if str(k).lower() in SECRET_FIELDS else _scrub(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_scrub(v) for v in value]
+    return value
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, with secrets redacted."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "msg": redact(record.getMessage()),
+        }
+        for name, value in getattr(record, "fields", {}).items():
+            entry[name] = _scrub(value)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class LazyQueueHandler(QueueHandler):
+    """Hands records to the listener thread as-is, so all formatting happens off the caller's thread."""
+
+    def prepare(self, record):
+        return record
+
+# Create a TimedRotatingFileHandler, written to only by the listener thread
 handler = TimedRotatingFileHandler(
     LOG_FILE, when="D", interval=3, backupCount=3, encoding="utf-8"
 )
+handler.setFormatter(JsonFormatter())
+
+def _gzip_rotator(source, dest):
+    """Compresses the rotated log (mostly repetitive JSON and payload dumps) instead of just renaming it."""
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+# Rotated files become ytnotis.log.<date>.gz; backupCount still applies, plain backups from older versions included
+handler.namer = lambda name: name + ".gz"
+handler.rotator = _gzip_rotator
 
-# Set up logging format
-formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-handler.setFormatter(formatter)
+_log_queue = queue.SimpleQueue()
+listener = QueueListener(_log_queue, handler)
+listener.start()
+atexit.register(listener.stop)  # Flush whatever is still queued on exit
 
 # Configure root logger
 logger = logging.getLogger("YTWebhookLogger")
 logger.setLevel(logging.INFO)
-logger.addHandler(handler)
+logger.addHandler(LazyQueueHandler(_log_queue))
 
-def log_message(message, level="info"):
-    """Logs messages using the rotating logger."""
+def log_message(message, level="info", **fields):
+    """Logs messages (plus optional structured fields) through the async rotating logger."""
     level = level.lower()
-    
+
     log_levels = {
         "debug": logger.debug,
         "warning": logger.warning,
         "error": logger.error,
         "critical": logger.critical,
     }
-    
-    log_levels.get(level, logger.info)(message)
\ No newline at end of file
+
+    log_levels.get(level, logger.info)(message, extra={"fields": fields} if fields else None)
+
+def log_payload(message, payload, **fields):
+    """Logs a raw payload dump for a sample of calls (LOG_PAYLOAD_SAMPLE_RATE)."""
+    if PAYLOAD_SAMPLE_RATE <= 0 or random.random() >= PAYLOAD_SAMPLE_RATE:
+        return
+    log_message(message, payload=payload, **fields)
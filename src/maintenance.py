@@ -0,0 +1,105 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+from src.database import get_archivable_videos, delete_archived_videos, prune_outbox, prune_livestreams, prune_video_cache, compact_database, ARCHIVE_COLUMNS
+from src.video_archive import write_archive, add_to_index, get_archive_stats
+from src.discord_notifier import NOTIFY_WINDOW_DAYS
+from src.scheduler import schedule, register_handler
+from src.metrics import Counter
+from src.config import MAINTENANCE_HOUR, ARCHIVE_AFTER_DAYS, OUTBOX_RETENTION_DAYS, DATABASE_URL
+from src.logger import log_message
+
+MAINTENANCE_KIND = "maintenance"
+MAINTENANCE_TARGET = "daily"
+# Rows read or deleted per database call, so pushes never wait long on the shared connection
+ARCHIVE_PAGE = 1000
+
+_columns = [column.strip() for column in ARCHIVE_COLUMNS.split(",")]
+_last_run = {}
+_run_lock = threading.Lock()
+
+MAINTENANCE_ROWS = Counter("ytnotis_maintenance_rows_total", "Rows archived or pruned by the daily maintenance.", ("table",))
+
+def _next_run(now: float) -> float:
+    """The next MAINTENANCE_HOUR o'clock, local time."""
+    run_at = datetime.fromtimestamp(now).replace(hour=MAINTENANCE_HOUR, minute=0, second=0, microsecond=0)
+    if run_at.timestamp() <= now:
+        run_at += timedelta(days=1)
+    return run_at.timestamp()
+
+def _archivable(cutoff: float):
+    """Yields the archivable videos as records, a page at a time."""
+    after_id = ""
+    while True:
+        rows = get_archivable_videos(cutoff, after_id, ARCHIVE_PAGE)
+        for row in rows:
+            record = dict(zip(_columns, row))
+            if record["metadata"]:
+                record["metadata"] = json.loads(record["metadata"])
+            yield record
+        if len(rows) < ARCHIVE_PAGE:
+            return
+        after_id = rows[-1][0]
+
+def archive_videos(now: float) -> int:
+    """Moves finished videos untouched for ARCHIVE_AFTER_DAYS into a new archive file. Returns how many rows left the database.
+
+    The file and the ID index are written before any row is deleted, so a crash in between only archives some videos twice.
+    """
+    # Pushes about videos older than the notify window are turned away anyway, so the archive is never needed to decide one
+    cutoff = now - max(ARCHIVE_AFTER_DAYS, NOTIFY_WINDOW_DAYS + 1) * 86400
+    path, video_ids = write_archive(_archivable(cutoff))
+    if not video_ids:
+        return 0
+
+    add_to_index(video_ids)
+    deleted = 0
+    for start in range(0, len(video_ids), ARCHIVE_PAGE):
+        deleted += delete_archived_videos(video_ids[start:start + ARCHIVE_PAGE], cutoff)
+    log_message(f"🗄️ Archived {len(video_ids)} videos to {path} ({deleted} rows removed).")
+    return deleted
+
+def run_maintenance(_target: str = MAINTENANCE_TARGET):
+    """Scheduler handler: archives old videos, prunes finished outbox and livestream rows and expired cache entries, then compacts the database."""
+    if not _run_lock.acquire(blocking=False):
+        return
+    try:
+        now = time.time()
+        started = time.perf_counter()
+        retention_cutoff = now - OUTBOX_RETENTION_DAYS * 86400
+
+        # Nodes sharing Postgres have a data directory each, so the archive (and its index) would only exist on one of them
+        archived = 0 if DATABASE_URL else archive_videos(now)
+        outbox = prune_outbox(retention_cutoff)
+        livestreams = prune_livestreams(retention_cutoff)
+        # Recently expired responses still serve If-None-Match revalidations; older ones only take up space
+        cached = prune_video_cache(retention_cutoff)
+        freed = compact_database()
+
+        for table, count in (("videos", archived), ("outbox", outbox), ("livestreams", livestreams), ("video_cache", cached)):
+            MAINTENANCE_ROWS.inc(table, amount=count)
+        _last_run.update(
+            at=now, seconds=round(time.perf_counter() - started, 2),
+            archived=archived, outbox_pruned=outbox, livestreams_pruned=livestreams, video_cache_pruned=cached, freed_bytes=freed,
+        )
+        log_message(
+            f"🧹 Maintenance done in {_last_run['seconds']}s: {archived} videos archived, {outbox} outbox, "
+            f"{livestreams} livestream and {cached} video cache rows pruned, {freed // 1024} KiB freed."
+        )
+    except Exception as e:
+        log_message(f"❌ Maintenance failed: {e}", level="error")
+    finally:
+        _run_lock.release()
+        schedule(MAINTENANCE_KIND, MAINTENANCE_TARGET, _next_run(time.time()), persist=False)
+
+def start_maintenance():
+    """Schedules the next daily maintenance run. Runs on the leader."""
+    schedule(MAINTENANCE_KIND, MAINTENANCE_TARGET, _next_run(time.time()), persist=False)
+
+def get_maintenance_stats() -> dict:
+    """Returns the last maintenance run's results and the archive's size."""
+    return {"last_run": dict(_last_run), "archive": get_archive_stats()}
+
+register_handler(MAINTENANCE_KIND, run_maintenance, leader_only=True)
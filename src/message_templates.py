@@ -0,0 +1,163 @@
+import json
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from json.encoder import encode_basestring_ascii
+
+from src.channels import get_all_channels
+from src.config import TEMPLATES_FILE, DISCORD_NOTI_ROLE
+from src.logger import log_message
+
+# What a message announces
+EVENTS = ("video", "upcoming", "live", "rescheduled")
+
+# Built in messages, used unless templates.json overrides them (for every channel, or per channel)
+DEFAULT_TEMPLATES = {
+    "video": {"content": "🎬 ${role_mention} New Video: ${title}!\n🔗 ${url}"},
+    "upcoming": {"content": "⭕ Livestream Scheduled!\nStarting ${start}!\n\n🔗 ${url}"},
+    "live": {"content": "🔴 ${role_mention} Live Now: ${title}!\n🔗 ${url}"},
+    "rescheduled": {"content": "🔄 Livestream Rescheduled!\nNow starting ${start}!\n\n🔗 ${url}"},
+}
+
+# Values a template can use as ${name}
+PLACEHOLDERS = (
+    "title", "url", "video_id", "channel_id", "channel_name", "role", "role_mention",
+    "thumbnail", "duration", "start", "start_unix", "start_iso",
+)
+
+_PLACEHOLDER = re.compile(r"\$\{(\w+)\}")
+
+@dataclass(frozen=True, slots=True)
+class CompiledTemplate:
+    """A message template serialized to Discord's JSON once, split around its placeholders."""
+    parts: tuple  # Static JSON text; one more entry than names
+    names: tuple  # Placeholder between parts[i] and parts[i + 1]
+
+    def render(self, values: dict) -> str:
+        """Returns the message's JSON payload, with the values escaped into their JSON strings."""
+        out = [self.parts[0]]
+        for name, part in zip(self.names, self.parts[1:]):
+            out.append(encode_basestring_ascii(values[name])[1:-1])
+            out.append(part)
+        return "".join(out)
+
+def compile_template(template: dict) -> CompiledTemplate:
+    """Compiles a Discord message object (content and/or embeds) whose strings may hold ${placeholders}.
+
+    Raises ValueError for anything Discord wouldn't accept as a message, or unknown placeholders.
+    """
+    if not isinstance(template, dict) or not (template.get("content") or template.get("embeds")):
+        raise ValueError("a template needs a content string or an embeds list")
+    if not isinstance(template.get("embeds", []), list):
+        raise ValueError("embeds must be a list")
+
+    # ensure_ascii, like the payloads json.dumps made before, so placeholders can't meet raw multibyte text
+    serialized = json.dumps(template, ensure_ascii=True, separators=(",", ":"))
+    pieces = _PLACEHOLDER.split(serialized)
+    names = tuple(pieces[1::2])
+
+    unknown = sorted(set(names) - set(PLACEHOLDERS))
+    if unknown:
+        raise ValueError(f"unknown placeholders {unknown}")
+    return CompiledTemplate(tuple(pieces[0::2]), names)
+
+# (channel_id or None, event) -> CompiledTemplate; None is the template for channels without their own
+_compiled = {}
+
+def _read_templates_file() -> dict:
+    """Reads templates.json: {"default": {event: template}, "<channel_id>": {event: template}}. Missing is fine."""
+    if not os.path.exists(TEMPLATES_FILE):
+        return {}
+    try:
+        with open(TEMPLATES_FILE, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        log_message(f"❌ Could not read {TEMPLATES_FILE}: {e}", level="error")
+        return {}
+    if not isinstance(data, dict):
+        log_message(f"❌ {TEMPLATES_FILE} must hold an object keyed by \"default\" or channel ID.", level="error")
+        return {}
+    return data
+
+def load_templates():
+    """Compiles the built-in and operator templates once and caches them for every registered channel and event."""
+    overrides = _read_templates_file()
+    compiled = {}
+
+    def compile_or_warn(scope, event, template):
+        try:
+            return compile_template(template)
+        except ValueError as e:
+            log_message(f"⚠️ Ignoring the {scope} template for {event!r}: {e}", level="warning")
+            return None
+
+    defaults = overrides.get("default", {})
+    for event in EVENTS:
+        compiled[(None, event)] = (
+            event in defaults and compile_or_warn("default", event, defaults[event])
+        ) or compile_template(DEFAULT_TEMPLATES[event])
+
+    custom = 0
+    for channel in get_all_channels():
+        channel_templates = overrides.get(channel.channel_id, {})
+        for event in EVENTS:
+            template = event in channel_templates and compile_or_warn(channel.channel_id, event, channel_templates[event])
+            compiled[(channel.channel_id, event)] = template or compiled[(None, event)]
+            custom += bool(template)
+
+    _compiled.clear()
+    _compiled.update(compiled)
+    log_message(f"🧩 Compiled message templates ({custom} channel-specific).")
+
+@lru_cache(maxsize=1024)
+def iso_to_unix(iso: str) -> int | None:
+    """Parses an API timestamp (e.g. 2025-03-01T12:00:00Z) to unix seconds; cached, since the same ones repeat."""
+    try:
+        return int(datetime.fromisoformat(iso.replace("Z", "+00:00")).timestamp())
+    except ValueError:
+        return None
+
+_DURATION = re.compile(r"P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+
+@lru_cache(maxsize=1024)
+def format_duration(iso: str) -> str:
+    """Turns an ISO 8601 duration (PT1H2M3S) into 1:02:03; empty for none (e.g. a stream that hasn't run)."""
+    match = _DURATION.match(iso or "")
+    if not match:
+        return ""
+    days, hours, minutes, seconds = (int(value or 0) for value in match.groups())
+    hours += days * 24
+    if not (hours or minutes or seconds):
+        return ""
+    return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes}:{seconds:02}"
+
+def _context(video_data: dict, channel, video_id: str | None) -> dict:
+    """The placeholder values for one message."""
+    url = video_data.get("url") or ""
+    video_id = video_id or url.rpartition("v=")[2]
+    role = channel.discord_role if channel else DISCORD_NOTI_ROLE
+    start_iso = video_data.get("scheduledStartTime") or ""
+    start_unix = iso_to_unix(start_iso) if start_iso else None
+
+    return {
+        "title": video_data.get("title") or "",
+        "url": url,
+        "video_id": video_id,
+        "channel_id": channel.channel_id if channel else "",
+        "channel_name": video_data.get("channelTitle") or "YouTube",
+        "role": role,
+        "role_mention": f"<@&{role}>",
+        # Every video has this one, so embeds never end up with an empty (rejected) image URL
+        "thumbnail": video_data.get("thumbnail") or f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+        "duration": format_duration(video_data.get("duration") or "") or "n/a",
+        "start": f"<t:{start_unix}:R>" if start_unix else "is not known",
+        "start_unix": str(start_unix or ""),
+        "start_iso": start_iso,
+    }
+
+def render(event: str, video_data: dict, channel=None, video_id: str | None = None) -> str:
+    """Renders the channel's (or the default) template for an event into a Discord JSON payload."""
+    template = _compiled.get((channel.channel_id if channel else None, event)) or _compiled[(None, event)]
+    return template.render(_context(video_data, channel, video_id))
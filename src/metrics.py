@@ -0,0 +1,187 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond SQLite calls to slow API calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+_registry_lock = threading.Lock()
+
+# Shards a metric holds before a new thread's registration first folds in the exited threads' ones
+_MIN_FOLD_AT = 64
+
+class _ShardedMetric:
+    """Base for metrics whose hot path writes only to a per-thread shard, so updates never take a lock.
+
+    Shards of threads that have exited are folded into a base shard when the metric is collected, and whenever the
+    shard list doubles, so a thread-per-request server can't grow it without bound between scrapes.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []  # [(thread, shard)]
+        self._base = {}
+        self._fold_at = _MIN_FOLD_AT  # Shard count that triggers the next fold when a thread registers
+        self._lock = threading.Lock()  # Only for registering shards and collecting
+        with _registry_lock:
+            _registry.append(self)
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            self._local.shard = shard
+            with self._lock:
+                if len(self._shards) >= self._fold_at:
+                    self._fold_dead()
+                    self._fold_at = max(_MIN_FOLD_AT, 2 * len(self._shards))
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _fold_dead(self):
+        """Merges the shards of exited threads into the base shard. Call with the lock held."""
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                self._merge_into(self._base, dict(shard))
+        self._shards = alive
+
+    def _merge_into(self, total: dict, shard: dict):
+        raise NotImplementedError
+
+    def _collect(self) -> dict:
+        """Returns the merged values of every shard."""
+        with self._lock:
+            self._fold_dead()
+
+            total = {}
+            self._merge_into(total, self._base)
+            for _, shard in self._shards:
+                self._merge_into(total, dict(shard))
+        return total
+
+    def _label_text(self, labels, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(self.labelnames, labels)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter(_ShardedMetric):
+    """A monotonically increasing count, optionally split by label values."""
+
+    def inc(self, *labels, amount: float = 1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def _merge_into(self, total, shard):
+        for labels, value in shard.items():
+            total[labels] = total.get(labels, 0) + value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._collect().items()):
+            lines.append(f"{self.name}{self._label_text(labels)} {value}")
+        return lines
+
+class Histogram(_ShardedMetric):
+    """Bucketed observations (usually latencies in seconds), optionally split by label values."""
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        shard = self._shard()
+        counts = shard.get(labels)
+        if counts is None:
+            # One slot per bucket, then +Inf, sum and count
+            counts = [0] * (len(self.buckets) + 3)
+            shard[labels] = counts
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-3] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        """Observes how long the wrapped block took."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def _merge_into(self, total, shard):
+        for labels, counts in shard.items():
+            merged = total.setdefault(labels, [0] * len(counts))
+            for i, value in enumerate(list(counts)):
+                merged[i] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, counts in sorted(self._collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{self._label_text(labels, le)} {cumulative}")
+            cumulative += counts[-3]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{self._label_text(labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(labels)} {counts[-2]}")
+            lines.append(f"{self.name}_count{self._label_text(labels)} {counts[-1]}")
+        return lines
+
+class Gauge:
+    """A value read from a callback at scrape time, so it costs nothing on the hot path.
+
+    The callback returns a number, or a {label_values_tuple: number} dict for labelled gauges.
+    """
+
+    def __init__(self, name: str, documentation: str, callback, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+        with _registry_lock:
+            _registry.append(self)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.callback()
+        except Exception:
+            return lines  # A broken callback shouldn't take the whole endpoint down
+
+        if isinstance(value, dict):
+            for labels, sample in sorted(value.items()):
+                pairs = ",".join(f'{name}="{_escape(str(v))}"' for name, v in zip(self.labelnames, labels))
+                lines.append(f"{self.name}{{{pairs}}} {sample}")
+        elif value is not None:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def render_metrics() -> str:
+    """Renders every registered metric in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry)
+
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,185 @@
+import time
+
+from src.database import transition_video, get_videos_in_state, get_video_state, get_video_channel
+from src.channels import get_channel
+from src.youtube_api import fetch_youtube_video_data_async
+from src.discord_notifier import queue_discord_message
+from src.message_templates import render
+from src.video_rechecks import schedule_recheck
+from src.livestreams import track_stream
+from src import readiness
+from src.work_queue import timed_stage, record_stage, enqueue_job
+from src.scheduler import register_handler
+from src import inflight
+from src.logger import log_message
+
+# Unfinished videos older than this aren't resumed after a restart (matches should_notify's cutoff)
+RESUME_MAX_AGE = 7 * 24 * 3600
+
+def process_video(video_id: str, channel_id: str, attempt: int = 0, first_seen: float | None = None, fresh: bool = False):
+    """Runs the pipeline for a claimed video, then releases the claim (or reruns once for pushes merged meanwhile).
+
+    attempt/first_seen are set when this is a re-poll for metadata that wasn't ready yet. fresh bypasses the metadata cache.
+    The YouTube lookup doesn't hold the worker: the rest runs as another job once its batch call returns.
+    """
+    handed_off = False
+    try:
+        handed_off = _start_pipeline(video_id, channel_id, attempt, first_seen, fresh)
+    finally:
+        if not handed_off:
+            _finish(video_id, channel_id)
+
+def _finish(video_id: str, channel_id: str):
+    """Releases a finished run's claim, or queues it once more for pushes merged meanwhile."""
+    # The claim is kept while a metadata re-poll is pending
+    if not readiness.is_waiting(video_id) and inflight.release(video_id):
+        log_message(f"🔂 Pushes for {video_id} arrived during its run. Running once more.")
+        # The merged pushes may mean the video changed, so give a video that ended up ignored another look
+        transition_video(video_id, "seen", ("ignored", "failed"))
+        # ...and skip the cache this time
+        if not enqueue_job(process_video, video_id, channel_id, 0, None, True):
+            inflight.release(video_id, allow_rerun=False)
+
+def _start_pipeline(video_id: str, channel_id: str, attempt: int, first_seen: float | None, fresh: bool) -> bool:
+    """Starts a pushed video's YouTube lookup. Returns True once it's handed to the batcher, which continues the run."""
+    channel = get_channel(channel_id)
+    if channel is None:
+        log_message(f"❔ Channel {channel_id} is no longer registered. Skipping video {video_id}.")
+        return False
+
+    # Another push for the same video may have finished while this one was queued
+    if not transition_video(video_id, "fetching", ("seen", "fetching"), add_attempt=True):
+        log_message(f"🔁 Video {video_id} already handled while queued. Skipping.")
+        return False
+
+    if first_seen is None:
+        first_seen = time.time()
+
+    # Getting the video data from YouTube API, straight away; incomplete data is re-polled later
+    log_message(f"📩 Attempting to get video data from YouTube API for video id: {video_id}")
+    started = time.monotonic()
+    future = fetch_youtube_video_data_async(video_id, fresh=fresh)
+    args = (video_id, channel_id, attempt, first_seen, started)
+    if future.done():
+        # Answered from the cache: carry on in this job instead of queueing another
+        _continue_pipeline(future, *args)
+    else:
+        future.add_done_callback(lambda done: _on_fetched(done, *args))
+    return True
+
+def _on_fetched(future, *args):
+    """Runs on the batcher once a lookup returns: queues the rest of the run for a worker."""
+    if enqueue_job(_continue_pipeline, future, *args):
+        return
+    # Rather than dropping a claimed video, finish it here; what's left is a few database writes
+    try:
+        _continue_pipeline(future, *args)
+    except Exception as e:
+        log_message(f"❌ Pipeline run for {args[0]} failed: {e}", level="error")
+
+def _continue_pipeline(future, video_id: str, channel_id: str, attempt: int, first_seen: float, started: float):
+    """Acts on a finished lookup, then releases the video's claim."""
+    record_stage("youtube_fetch", time.monotonic() - started)
+    try:
+        _run_pipeline(video_id, channel_id, attempt, first_seen, future.result())
+    finally:
+        _finish(video_id, channel_id)
+
+def _run_pipeline(video_id: str, channel_id: str, attempt: int, first_seen: float, video_data):
+    """Notifies the channel's Discord about a pushed video's fetched data. Runs on a pipeline worker."""
+    channel = get_channel(channel_id)
+    if channel is None:
+        log_message(f"❔ Channel {channel_id} is no longer registered. Skipping video {video_id}.")
+        return
+
+    if not readiness.is_ready(video_data):
+        if not readiness.retry_later(video_id, channel_id, attempt, first_seen):
+            transition_video(video_id, "failed", ("fetching",), metadata=video_data)
+        return
+    readiness.record_ready(video_id, attempt, first_seen)
+
+    privacy_status = video_data.get("privacyStatus")
+    publish_at = video_data.get("publishAt")
+    live_broadcast = video_data.get("liveBroadcastContent")
+
+    # Case 1: Upcoming Livestream
+    if live_broadcast == "upcoming":
+        log_message(f"🎥 Upcoming Livestream detected for {video_id}")
+
+        with timed_stage("discord_queue"):
+            payload = render("upcoming", video_data, channel, video_id)
+            queued = queue_discord_message(payload, webhook_url=channel.discord_webhook_url, video_id=video_id, channel_id=channel_id)
+
+        # Followed from here on, for its go-live ping and any change of start time
+        if queued:
+            track_stream(video_id, channel_id, video_data.get("scheduledStartTime"))
+        return
+
+    # Case 1b: Stream that's already live (started without being scheduled first, or first seen now)
+    if live_broadcast == "live":
+        log_message(f"🔴 Live stream detected for {video_id}")
+
+        with timed_stage("discord_queue"):
+            payload = render("live", video_data, channel, video_id)
+            queue_discord_message(payload, webhook_url=channel.discord_webhook_url, video_id=video_id, channel_id=channel_id)
+        return
+
+    # Case 2: Members-Only Video (Will be public later)
+    if privacy_status == "public" and publish_at:
+        log_message(f"🕒 Members-only video detected, scheduling recheck for {publish_at}")
+
+        if transition_video(video_id, "scheduled", ("fetching",), publishAt=publish_at, metadata=video_data):
+            schedule_recheck(video_id, publish_at)
+        return
+
+    # Case 3: Instantly Public Video
+    if privacy_status == "public" and not publish_at:
+        log_message(f"✅ Public video detected: {video_id}")
+
+        with timed_stage("discord_queue"):
+            payload = render("video", video_data, channel, video_id)
+            queue_discord_message(payload, webhook_url=channel.discord_webhook_url, video_id=video_id, channel_id=channel_id)
+        return
+
+    # Remembered, so later pushes for it are answered from the database instead of refetched
+    log_message(f"🤷 No action taken for video {video_id} (privacy: {privacy_status}, live: {live_broadcast}).")
+    transition_video(video_id, "ignored", ("fetching",), metadata=video_data)
+
+def resume_unfinished_videos():
+    """Re-queues videos a previous run accepted but didn't finish (seen or fetching). Call once the workers run."""
+    rows = get_videos_in_state(("seen", "fetching"), since=time.time() - RESUME_MAX_AGE)
+    resumed = 0
+
+    for video_id, channel_id, _ in rows:
+        if channel_id is None or not inflight.claim(video_id):
+            continue
+        if not enqueue_job(process_video, video_id, channel_id):
+            inflight.release(video_id, allow_rerun=False)
+            log_message(f"⚠️ Work queue full; {len(rows) - resumed} unfinished videos wait for the next restart or push.", level="warning")
+            break
+        resumed += 1
+
+    if rows:
+        log_message(f"♻️ Resumed {resumed} videos left unfinished by the previous run.")
+
+def run_debounced(video_id: str):
+    """Scheduler handler: runs a video once more for the pushes debounced right after its last run."""
+    if not inflight.take_deferred(video_id):
+        return
+
+    # Settled videos (scheduled, notifying, posted) have nothing left to decide
+    state = get_video_state(video_id)
+    channel_id = get_video_channel(video_id)
+    if state not in ("seen", "fetching", "ignored", "failed") or channel_id is None:
+        return
+    if not inflight.claim(video_id):
+        return  # Another push started a run meanwhile, which covers these
+
+    # The debounced pushes may mean the video changed, so reopen it and skip the cache, like a merged-push rerun
+    transition_video(video_id, "seen", ("ignored", "failed"))
+    log_message(f"⏱️ Running {video_id} once more for pushes debounced after its last run.")
+    if not enqueue_job(process_video, video_id, channel_id, 0, None, True):
+        inflight.release(video_id, allow_rerun=False)
+
+readiness.set_retry_job(process_video)
+register_handler(inflight.DEBOUNCED_KIND, run_debounced)
@@ -0,0 +1,101 @@
+import statistics
+import threading
+import time
+from collections import deque
+
+from src.scheduler import schedule, register_handler
+from src.work_queue import enqueue_job
+from src.inflight import release
+from src.database import transition_video
+from src.config import READINESS_MAX_ATTEMPTS, READINESS_MIN_DELAY, READINESS_MAX_DELAY
+from src.logger import log_message
+
+# Videos waiting for their metadata: video_id -> (channel_id, attempt, first_seen)
+_waiting = {}
+_waiting_lock = threading.Lock()
+
+# Recent time-to-ready samples (seconds from first fetch to a complete response)
+_ready_samples = deque(maxlen=200)
+_counters = {"ready_first_try": 0, "ready_after_retry": 0, "gave_up": 0}
+
+# Set by the pipeline on import; takes (video_id, channel_id, attempt, first_seen)
+_retry_job = None
+
+def is_ready(video_data) -> bool:
+    """Returns True once YouTube returns complete metadata (item, title, privacy and broadcast state)."""
+    return bool(
+        video_data
+        and video_data.get("title")
+        and video_data.get("privacyStatus")
+        and video_data.get("liveBroadcastContent")
+    )
+
+def set_retry_job(job):
+    """Registers the pipeline function that re-polls a video."""
+    global _retry_job
+    _retry_job = job
+
+def is_waiting(video_id: str) -> bool:
+    """Returns True if a re-poll is pending for the video."""
+    with _waiting_lock:
+        return video_id in _waiting
+
+def _next_delay(attempt: int) -> float:
+    """Backoff for the given retry, starting from the median observed time-to-ready."""
+    with _waiting_lock:
+        samples = [s for s in _ready_samples if s > 0]
+    first = statistics.median(samples) if samples else READINESS_MIN_DELAY
+    delay = max(READINESS_MIN_DELAY, first) * 2 ** attempt
+    return min(READINESS_MAX_DELAY, delay)
+
+def retry_later(video_id: str, channel_id: str, attempt: int, first_seen: float) -> bool:
+    """Schedules another fetch for incomplete metadata. Returns False once the retries are used up."""
+    if attempt >= READINESS_MAX_ATTEMPTS:
+        with _waiting_lock:
+            _waiting.pop(video_id, None)
+            _counters["gave_up"] += 1
+        log_message(f"❌ Metadata for {video_id} still incomplete after {attempt} attempts. Giving up.", level="warning")
+        return False
+
+    delay = _next_delay(attempt)
+    with _waiting_lock:
+        _waiting[video_id] = (channel_id, attempt + 1, first_seen)
+
+    # Ephemeral: the wait is short and the push is re-delivered or reconciled if we restart meanwhile
+    schedule("readiness", video_id, time.time() + delay, persist=False)
+    log_message(f"⏳ Metadata for {video_id} not ready yet, re-polling in {delay:.1f}s (attempt {attempt + 1}).")
+    return True
+
+def record_ready(video_id: str, attempt: int, first_seen: float):
+    """Records how long a video took to have complete metadata."""
+    with _waiting_lock:
+        _waiting.pop(video_id, None)
+        _ready_samples.append(time.time() - first_seen if attempt else 0.0)
+        _counters["ready_after_retry" if attempt else "ready_first_try"] += 1
+
+def _on_due(video_id: str):
+    """Scheduler handler: hands the re-poll back to the pipeline workers."""
+    with _waiting_lock:
+        waiting = _waiting.get(video_id)
+    if waiting is None or _retry_job is None:
+        return
+
+    channel_id, attempt, first_seen = waiting
+    if not enqueue_job(_retry_job, video_id, channel_id, attempt, first_seen):
+        # Queue is full: try again after the next backoff step, or give up and free the video's claim
+        if not retry_later(video_id, channel_id, attempt, first_seen):
+            release(video_id, allow_rerun=False)
+            transition_video(video_id, "failed", ("fetching",))
+
+register_handler("readiness", _on_due)
+
+def get_readiness_stats() -> dict:
+    """Returns time-to-ready percentiles and outcome counters."""
+    with _waiting_lock:
+        samples = sorted(_ready_samples)
+        stats = {**_counters, "waiting": len(_waiting)}
+
+    if samples:
+        stats["time_to_ready_p50_s"] = round(samples[len(samples) // 2], 2)
+        stats["time_to_ready_p90_s"] = round(samples[min(len(samples) - 1, int(len(samples) * 0.9))], 2)
+    return stats
@@ -0,0 +1,179 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.database import save_scheduled_job, delete_scheduled_job, delete_scheduled_jobs, get_scheduled_jobs
+from src.leader import is_leader
+from src.config import SCHEDULER_CONCURRENCY
+from src.logger import log_message
+
+# Min-heap of (due_at, sequence, job_key). Cancelled or rescheduled entries are
+# left in place and skipped when they reach the top.
+_heap = []
+# Live jobs: job_key -> (kind, target, due_at, persist)
+_jobs = {}
+# Job kind -> callable(target)
+_handlers = {}
+# Kinds only the elected leader runs (see src/leader.py)
+_leader_only = set()
+# Keys of jobs running right now, so reloading persisted jobs can't queue them a second time
+_running = set()
+
+_sequence = itertools.count()
+_condition = threading.Condition()
+_slots = threading.BoundedSemaphore(SCHEDULER_CONCURRENCY)
+_executor = ThreadPoolExecutor(max_workers=SCHEDULER_CONCURRENCY, thread_name_prefix="scheduler-job")
+_scheduler_thread = None
+
+def _job_key(kind: str, target: str) -> str:
+    return f"{kind}:{target}"
+
+def register_handler(kind: str, handler, leader_only: bool = False):
+    """Registers the function that runs jobs of the given kind.
+
+    leader_only jobs run on the elected leader alone. Other processes only persist them, for the leader to load.
+    """
+    _handlers[kind] = handler
+    if leader_only:
+        _leader_only.add(kind)
+
+def _add_job(key: str, kind: str, target: str, due_at: float, persist: bool) -> bool:
+    """Puts a job on the heap, replacing any earlier entry for the same key."""
+    with _condition:
+        existing = _jobs.get(key)
+        if existing and existing[2] == due_at:
+            return False
+
+        _jobs[key] = (kind, target, due_at, persist)
+        heapq.heappush(_heap, (due_at, next(_sequence), key))
+
+        # Drop stale entries once they outnumber the live ones so memory tracks pending jobs
+        if len(_heap) > 2 * len(_jobs) + 64:
+            _heap[:] = [entry for entry in _heap if _jobs.get(entry[2], (None, None, None))[2] == entry[0]]
+            heapq.heapify(_heap)
+
+        _condition.notify()
+        return True
+
+def schedule(kind: str, target: str, due_at: float, persist: bool = True) -> bool:
+    """Schedules (or reschedules) a job at a unix timestamp. Returns False if it was already scheduled then."""
+    key = _job_key(kind, target)
+    if kind in _leader_only and not is_leader():
+        # The leader picks persisted jobs up at its next sync; ephemeral ones are its own to schedule
+        if persist:
+            save_scheduled_job(key, kind, target, due_at)
+        return True
+
+    if not _add_job(key, kind, target, due_at, persist):
+        return False
+
+    if persist:
+        save_scheduled_job(key, kind, target, due_at)
+    return True
+
+def cancel(kind: str, target: str) -> bool:
+    """Cancels a pending job. Returns False if there was nothing to cancel."""
+    key = _job_key(kind, target)
+
+    with _condition:
+        job = _jobs.pop(key, None)
+        _condition.notify()
+
+    if job and job[3]:
+        delete_scheduled_job(key)
+    return job is not None
+
+def is_scheduled(kind: str, target: str) -> bool:
+    """Returns True if a job is pending for the given kind and target."""
+    with _condition:
+        return _job_key(kind, target) in _jobs
+
+def pending_count(kind: str | None = None) -> int:
+    """Returns the number of pending jobs, optionally for a single kind."""
+    with _condition:
+        if kind is None:
+            return len(_jobs)
+        return sum(1 for job in _jobs.values() if job[0] == kind)
+
+def _next_due_job():
+    """Blocks until a job is due, then removes and returns it."""
+    with _condition:
+        while True:
+            if not _heap:
+                _condition.wait()
+                continue
+
+            due_at, _, key = _heap[0]
+            job = _jobs.get(key)
+            if job is None or job[2] != due_at:
+                heapq.heappop(_heap)  # Cancelled or superseded by a reschedule
+                continue
+
+            delay = due_at - time.time()
+            if delay > 0:
+                _condition.wait(delay)
+                continue
+
+            heapq.heappop(_heap)
+            del _jobs[key]
+            _running.add(key)
+            return key, job
+
+def _run_job(key: str, kind: str, target: str, persist: bool):
+    """Runs a single due job and releases its concurrency slot."""
+    try:
+        handler = _handlers.get(kind)
+        if kind in _leader_only and not is_leader():
+            # Lost the leadership meanwhile; a persisted job stays stored for the new leader
+            persist = False
+        elif handler is None:
+            log_message(f"⚠️ No handler registered for scheduled job {key}. Dropping.", level="warning")
+        else:
+            handler(target)
+    except Exception as e:
+        log_message(f"❌ Scheduled job {key} failed: {e}", level="error")
+    finally:
+        # The handler may have rescheduled the same job; only drop the row if it didn't
+        if persist and not is_scheduled(kind, target):
+            delete_scheduled_job(key)
+        with _condition:
+            _running.discard(key)
+        _slots.release()
+
+def _scheduler_loop():
+    """Dispatches due jobs to the bounded executor, forever."""
+    while True:
+        key, (kind, target, _, persist) = _next_due_job()
+        _slots.acquire()  # Wait for a free slot so a backlog of due jobs can't pile up threads
+        _executor.submit(_run_job, key, kind, target, persist)
+
+def load_persisted_jobs(skip=()) -> int:
+    """Loads stored jobs (from a previous run, or other processes) onto the heap. Returns how many were new.
+
+    Safe to repeat: jobs already on the heap for the same time are left alone. skip holds (kind, target) pairs to leave out.
+    """
+    skip = set(skip)
+    added = 0
+    for kind, target, due_at in get_scheduled_jobs():
+        key = _job_key(kind, target)
+        with _condition:
+            running = key in _running
+        if not running and (kind, target) not in skip and _add_job(key, kind, target, due_at, persist=True):
+            added += 1
+    return added
+
+def discard_persisted(jobs):
+    """Deletes the stored rows of (kind, target) jobs the caller handles another way, so no later load runs them."""
+    delete_scheduled_jobs([_job_key(kind, target) for kind, target in jobs])
+
+def start_scheduler():
+    """Starts the scheduler thread (only once). Persisted jobs are loaded by the leader, see resume_scheduled_tasks."""
+    global _scheduler_thread
+    if _scheduler_thread is not None:
+        return
+
+    _scheduler_thread = threading.Thread(target=_scheduler_loop, name="scheduler", daemon=True)
+    _scheduler_thread.start()
+    log_message(f"⏰ Scheduler started with {pending_count()} pending jobs.")
@@ -0,0 +1,148 @@
+import threading
+import time
+
+from src.token_manager import load_subscriptions, start_subscriptions, unsubscribe_all
+from src.video_rechecks import resume_scheduled_tasks
+from src.pipeline import resume_unfinished_videos
+from src.work_queue import start_workers, get_queue_stats
+from src.scheduler import start_scheduler, schedule, register_handler, load_persisted_jobs
+from src.leader import start_election, on_elected, is_leader, resign, NODE_ID
+from src.discord_notifier import start_discord_sender
+from src.http_client import get_http_stats
+from src.channels import load_channels, get_channel_stats
+from src.message_templates import load_templates
+from src.readiness import get_readiness_stats
+from src.video_cache import get_cache_stats
+from src.inflight import get_inflight_stats
+from src.feed_reconciler import start_reconciler, get_reconciler_stats
+from src.livestreams import start_livestreams, get_livestream_stats
+from src.maintenance import start_maintenance, get_maintenance_stats
+from src.metrics import Gauge
+from src.config import WEBSUB_UNSUBSCRIBE_ON_SHUTDOWN, FEED_RECONCILE, LIVESTREAM_TRACKING, MAINTENANCE, SHARED_DATABASE, CLUSTER_SYNC_INTERVAL
+from src.logger import log_message
+
+_started = False
+_start_lock = threading.Lock()
+
+# Startup phase -> seconds after the entry point started (see mark_startup)
+_startup_seconds = {}
+
+Gauge(
+    "ytnotis_startup_seconds", "Seconds from process start until each startup phase finished.",
+    lambda: {(phase,): seconds for phase, seconds in _startup_seconds.items()}, ("phase",)
+)
+
+def mark_startup(phase: str, started_at: float):
+    """Records a startup phase (imported, listening, ready) as finished, timed from started_at (a time.perf_counter() value)."""
+    _startup_seconds[phase] = round(time.perf_counter() - started_at, 3)
+
+def start_background_services():
+    """Starts the pipeline workers and scheduler, then campaigns for leadership (only once per process).
+
+    Every process serves /webhook; the elected leader also runs the Discord sender, rechecks, WebSub renewals,
+    feed reconciliation, livestream polls and the daily maintenance (see _start_leader_services).
+    """
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+
+    # Load the channel registry and compile the message templates the workers render with
+    load_channels()
+    load_templates()
+
+    # Start the workers that process queued webhook pushes, with the secrets needed to check their signatures
+    start_workers()
+    load_subscriptions()
+
+    # The scheduler runs everywhere for this process's own short jobs (metadata re-polls); leader-only jobs skip followers
+    start_scheduler()
+
+    # A lone process wins straight away; the leader's services then start on their own thread while the lease is renewed
+    on_elected(_start_leader_services)
+    start_election()
+
+def start_background_services_async(started_at: float) -> threading.Thread:
+    """Starts the background services on their own thread, so the caller can bind its listener right away.
+
+    Pushes and hub verifications arriving meanwhile are handled: signature checks load the subscriptions from the
+    database on a miss, pushes get a 503 (which the hub retries) until the channels are loaded, and the work queue
+    holds accepted pushes until the workers start.
+    """
+    def run():
+        try:
+            start_background_services()
+        except Exception as e:
+            log_message(f"❌ Starting the background services failed: {e}", level="error")
+            return
+        mark_startup("ready", started_at)
+        log_message(f"🏁 Background services running, {_startup_seconds['ready']}s after start.")
+
+    thread = threading.Thread(target=run, name="startup", daemon=True)
+    thread.start()
+    return thread
+
+def _start_leader_services():
+    """Runs each time this process becomes the leader. Every step is safe to repeat after losing and regaining it."""
+    # Start the sender that delivers queued Discord messages
+    start_discord_sender()
+
+    # Pick up pushes a previous run accepted but crashed or stopped before finishing
+    resume_unfinished_videos()
+
+    # Resume any scheduled rechecks from the database, and queue subscription renewals from the stored leases
+    resume_scheduled_tasks()
+    start_subscriptions()
+
+    # Backfill videos whose pushes never arrived (e.g. while this instance was down) from the channels' RSS feeds
+    if FEED_RECONCILE:
+        start_reconciler()
+
+    # Keep polling scheduled livestreams for their go-live and start time changes
+    if LIVESTREAM_TRACKING:
+        start_livestreams()
+
+    # Archive old videos, prune finished rows and compact the database once a day
+    if MAINTENANCE:
+        start_maintenance()
+
+    # Other processes store rechecks and livestreams for the leader to pick up
+    if SHARED_DATABASE:
+        schedule("cluster_sync", NODE_ID, time.time() + CLUSTER_SYNC_INTERVAL, persist=False)
+
+def _cluster_sync(target: str):
+    """Scheduler handler: loads the jobs and livestreams other processes stored since the last sync."""
+    added = load_persisted_jobs()
+    if added:
+        log_message(f"🔄 Picked up {added} jobs scheduled by other processes.")
+    if LIVESTREAM_TRACKING:
+        start_livestreams()
+    schedule("cluster_sync", target, time.time() + CLUSTER_SYNC_INTERVAL, persist=False)
+
+register_handler("cluster_sync", _cluster_sync, leader_only=True)
+
+def stop_background_services():
+    """Unsubscribes from WebSub if configured to, and hands over the leadership to another process if it has it.
+
+    By default the leases are kept so pushes resume after a restart.
+    """
+    if WEBSUB_UNSUBSCRIBE_ON_SHUTDOWN and is_leader():
+        unsubscribe_all()
+        log_message("✅ Successfully unsubscribed from WebSub.")
+    resign()
+
+def get_stats() -> dict:
+    """Returns this process's role and startup times, the pipeline work queue depth, per-stage latency, per-host HTTP stats, channel registry size, readiness, cache, in-flight, feed reconciliation, livestream and maintenance stats."""
+    return {
+        "node": {"id": NODE_ID, "leader": is_leader(), "startup_s": dict(_startup_seconds)},
+        **get_queue_stats(),
+        "http": get_http_stats(),
+        "channels": get_channel_stats(),
+        "readiness": get_readiness_stats(),
+        "video_cache": get_cache_stats(),
+        "inflight": get_inflight_stats(),
+        "reconciler": get_reconciler_stats(),
+        "livestreams": get_livestream_stats(),
+        "maintenance": get_maintenance_stats(),
+    }
@@ -1,64 +1,360 @@
 import os
+import hmac
 import time
+import random
 import hashlib
-import requests
-from urllib.parse import quote
+import threading
+from dataclasses import dataclass, astuple
 
-from src.config import TOKEN_ROTATION_PERIOD, LOCAL_WEBHOOK_URL, CHANNEL_ID
+from src import http_client
+from src.channels import get_all_channels, get_channel, channel_id_from_topic, TOPIC_PREFIX
+from src.database import get_subscription, get_subscriptions, save_subscription, delete_subscription, get_state, set_state
+from src.scheduler import schedule, cancel, register_handler
+from src.config import (
+    TOKEN_ROTATION_PERIOD, LOCAL_WEBHOOK_URL, SUBSCRIPTION_SPACING, WEBSUB_LEASE_SECONDS, WEBSUB_RENEW_BEFORE,
+    WEBSUB_RENEW_JITTER, WEBSUB_SECRET_OVERLAP, WEBSUB_RETRY_DELAY, WEBSUB_HUB_URL, SHARED_DATABASE
+)
+from src.metrics import Counter, Gauge
 from src.logger import log_message
 
-# Global variable to store the current token
-CURRENT_TOKEN = None
+# Digests a hub may sign pushes with (YouTube's hub uses sha1)
+SIGNATURE_ALGORITHMS = {"sha1", "sha256", "sha384", "sha512"}
+SECRET_STATE_KEY = "websub_secret"
+# A push signed with an unknown secret reloads the subscriptions at most this often
+RELOAD_MIN_INTERVAL = 5
 
-def generate_new_token():
-    """Generates a secure random token."""
+@dataclass(slots=True)
+class Subscription:
+    """One topic's subscription at the hub, mirrored in the subscriptions table."""
+    topic: str
+    channel_id: str
+    secret: str | None = None  # What the hub signs pushes with
+    pending_secret: str | None = None  # Sent with a (re)subscribe the hub hasn't verified yet
+    previous_secret: str | None = None  # Replaced secret, still accepted until previous_until
+    previous_until: float = 0.0
+    lease_seconds: int = 0
+    expires_at: float = 0.0
+    verified_at: float = 0.0
+    unsubscribing: bool = False
+    verify_token: str | None = None  # Part of the callback URL for the subscription's lifetime; the hub's verifications carry it
+
+# topic -> Subscription
+_subscriptions = {}
+_lock = threading.Lock()
+# (secret, created_at) used for new (re)subscriptions
+_current_secret = None
+_last_reload = 0.0
+
+WEBSUB_REQUESTS = Counter("ytnotis_websub_requests_total", "WebSub hub requests by mode and result.", ("mode", "result"))
+WEBSUB_VERIFICATIONS = Counter("ytnotis_websub_verifications_total", "Hub verification requests by mode and result.", ("mode", "result"))
+
+def _subscription_age():
+    verified = [sub.verified_at for sub in list(_subscriptions.values()) if sub.verified_at]
+    return time.time() - min(verified) if verified else None
+
+def _lease_remaining():
+    expiries = [sub.expires_at for sub in list(_subscriptions.values()) if sub.verified_at]
+    return max(0.0, min(expiries) - time.time()) if expiries else None
+
+Gauge("ytnotis_websub_subscription_age_seconds", "Seconds since the least recently verified subscription was verified.", _subscription_age)
+Gauge("ytnotis_websub_lease_remaining_seconds", "Seconds until the soonest subscription lease expires.", _lease_remaining)
+
+def generate_secret():
+    """Generates a secure random hub.secret."""
     return hashlib.sha256(os.urandom(32)).hexdigest()[:32]
 
-def get_current_token():
-    """Returns the current WebSub token."""
-    return CURRENT_TOKEN
-
-def subscribe_websub(token):
-    """Subscribes YouTube WebSub with the given token."""
-    callback_url = f"{LOCAL_WEBHOOK_URL}/webhook?token={quote(token)}"
-    log_message("Attempting to subscribe to WebSub...")
-    
-    response = requests.post("https://pubsubhubbub.appspot.com/subscribe", data={
-        "hub.mode": "subscribe",
-        "hub.topic": f"https://www.youtube.com/xml/feeds/videos.xml?channel_id={CHANNEL_ID}",
-        "hub.callback": callback_url
-    })
-    
-    log_message(f"🔔 WebSub Subscription Response: {response.status_code} {response.text}")
-
-def unsubscribe_websub(token):
-    """Unsubscribes from YouTube WebSub to prevent duplicate notifications."""
-    callback_url = f"{LOCAL_WEBHOOK_URL}/webhook?token={quote(token)}"
+def _secret_for_subscribe() -> str:
+    """Returns the secret to subscribe with, rotating it first once it's older than TOKEN_ROTATION_PERIOD."""
+    global _current_secret
+    with _lock:
+        if _current_secret is None or time.time() - _current_secret[1] >= TOKEN_ROTATION_PERIOD:
+            _current_secret = (generate_secret(), time.time())
+            set_state(SECRET_STATE_KEY, _current_secret[0])
+            log_message("🔄 WebSub secret rotated; channels pick it up as they renew.")
+        return _current_secret[0]
+
+def _accepted_secrets() -> set:
+    """Every secret the hub may currently sign a push with."""
+    now = time.time()
+    secrets = set()
+    for sub in list(_subscriptions.values()):
+        secrets.add(sub.secret)
+        secrets.add(sub.pending_secret)
+        if sub.previous_until > now:
+            secrets.add(sub.previous_secret)
+    secrets.discard(None)
+    return secrets
+
+def _from_row(row) -> Subscription:
+    sub = Subscription(*row)
+    sub.unsubscribing = bool(sub.unsubscribing)
+    return sub
+
+def load_subscriptions():
+    """Replaces the in-memory subscriptions with the stored ones (which the leader and the hub's verifications keep current)."""
+    global _last_reload
+    rows = get_subscriptions()
+    with _lock:
+        _subscriptions.clear()
+        for row in rows:
+            sub = _from_row(row)
+            _subscriptions[sub.topic] = sub
+        _last_reload = time.monotonic()
+
+def _refresh(topic: str):
+    """Re-reads one subscription, which another process may have changed. Only needed with SHARED_DATABASE."""
+    row = get_subscription(topic)
+    with _lock:
+        if row is None:
+            _subscriptions.pop(topic, None)
+        else:
+            _subscriptions[topic] = _from_row(row)
+
+def verify_signature(body: bytes, header: str | None) -> bool:
+    """Checks a push's X-Hub-Signature (algo=hexdigest) against the secrets in use."""
+    if _matches_secret(body, header):
+        return True
+
+    # Not loaded yet (startup), or the leader rotated the secret or another process saw it verified since we last loaded
+    if time.monotonic() - _last_reload >= RELOAD_MIN_INTERVAL:
+        load_subscriptions()
+        return _matches_secret(body, header)
+    return False
+
+def _matches_secret(body: bytes, header: str | None) -> bool:
+    if not header or "=" not in header:
+        return False
+
+    algorithm, _, signature = header.partition("=")
+    algorithm = algorithm.strip().lower()
+    if algorithm not in SIGNATURE_ALGORITHMS:
+        return False
+
+    signature = signature.strip().lower()
+    for secret in _accepted_secrets():
+        expected = hmac.new(secret.encode("utf-8"), body, algorithm).hexdigest()
+        if hmac.compare_digest(expected, signature):
+            return True
+    return False
+
+def _save(sub: Subscription):
+    save_subscription(astuple(sub))
+
+def _renewal_floor(sub: Subscription) -> float:
+    """The earliest time _schedule_renewal can pick for the subscription's lease."""
+    return sub.expires_at - sub.lease_seconds * WEBSUB_RENEW_BEFORE - WEBSUB_RENEW_JITTER
+
+def _schedule_renewal(sub: Subscription):
+    """Schedules a re-subscribe ahead of the lease expiry, jittered so channels don't renew in one burst."""
+    renew_at = _renewal_floor(sub) + random.uniform(0, WEBSUB_RENEW_JITTER)
+    schedule("renew", sub.channel_id, max(renew_at, time.time()), persist=False)
+
+def _schedule_retry(channel_id: str):
+    schedule("renew", channel_id, time.time() + WEBSUB_RETRY_DELAY * random.uniform(0.5, 1.0), persist=False)
+
+def _callback_url(verify_token: str | None) -> str:
+    """The subscription's callback. The hub knows a subscription by topic and callback, so it must never change."""
+    # Subscriptions made before the tokens keep the bare URL the hub has them under; "token" is redacted in the logs
+    return f"{LOCAL_WEBHOOK_URL}/webhook?token={verify_token}" if verify_token else f"{LOCAL_WEBHOOK_URL}/webhook"
+
+def _send_websub_request(mode, topic, verify_token, secret=None):
+    """Sends a single (un)subscribe request for one topic to the hub. Returns True if the hub accepted it."""
+    data = {
+        "hub.mode": mode,
+        "hub.topic": topic,
+        # The hub calls this URL, query included, to verify the request
+        "hub.callback": _callback_url(verify_token),
+    }
+    if mode == "subscribe":
+        data["hub.secret"] = secret
+        data["hub.lease_seconds"] = str(WEBSUB_LEASE_SECONDS)
+
+    try:
+        response = http_client.post(WEBSUB_HUB_URL, data=data)
+    except Exception as e:
+        WEBSUB_REQUESTS.inc(mode, "exception")
+        log_message(f"❌ WebSub {mode} for {topic} failed: {e}", level="error")
+        return False
+
+    if response.status_code >= 400:
+        WEBSUB_REQUESTS.inc(mode, "error")
+        log_message(f"⚠️ WebSub {mode} for {topic} failed: {response.status_code} {response.text}", level="warning")
+        return False
+
+    WEBSUB_REQUESTS.inc(mode, "ok")
+    return True
+
+def renew_subscription(channel_id: str):
+    """(Re)subscribes one channel. The existing subscription keeps working until the hub verifies the new one."""
+    channel = get_channel(channel_id)
+    if channel is None:
+        return
+
+    if SHARED_DATABASE:
+        # The hub may have verified the last request at another process, which stored the new lease
+        _refresh(channel.topic)
+        sub = _subscriptions.get(channel.topic)
+        if sub and sub.secret and not sub.pending_secret and not sub.unsubscribing and time.time() < _renewal_floor(sub):
+            _schedule_renewal(sub)
+            return
+
+    secret = _secret_for_subscribe()
+    started = time.time()
+    with _lock:
+        sub = _subscriptions.get(channel.topic)
+        if sub is None:
+            # Renewals and the eventual unsubscribe reuse this token, so the hub keeps seeing the same callback
+            sub = Subscription(channel.topic, channel_id, verify_token=generate_secret())
+        sub.pending_secret = secret
+        sub.unsubscribing = False
+        verify_token = sub.verify_token
+        _subscriptions[sub.topic] = sub
+    # Stored before the request, since the hub may verify synchronously while it's in flight
+    _save(sub)
+
+    if not _send_websub_request("subscribe", sub.topic, verify_token, secret):
+        _schedule_retry(channel_id)
+        return
+
+    log_message(f"🔔 WebSub subscription sent for {channel_id}")
+    # Try again if the hub never comes back to verify; verification replaces this with the real renewal time
+    with _lock:
+        if sub.verified_at < started:
+            _schedule_retry(channel_id)
+
+def _unsubscribe(sub: Subscription):
+    """Asks the hub to drop a subscription; the row is removed once the hub verifies it."""
+    with _lock:
+        sub.unsubscribing = True
+        verify_token = sub.verify_token
+    _save(sub)
+    cancel("renew", sub.channel_id)
+    if _send_websub_request("unsubscribe", sub.topic, verify_token):
+        log_message(f"🔕 WebSub unsubscription sent for {sub.channel_id}")
+
+def unsubscribe_channel(channel_id: str):
+    """Unsubscribes a channel that's no longer registered (scheduler job)."""
+    sub = _subscriptions.get(f"{TOPIC_PREFIX}{channel_id}")
+    if sub is not None:
+        _unsubscribe(sub)
+
+def unsubscribe_all():
+    """Unsubscribes every channel right away, spacing the calls out so the hub isn't hit in a burst."""
     log_message("Attempting to unsubscribe from WebSub...")
-    
-    response = requests.post("https://pubsubhubbub.appspot.com/subscribe", data={
-        "hub.mode": "unsubscribe",
-        "hub.topic": f"https://www.youtube.com/xml/feeds/videos.xml?channel_id={CHANNEL_ID}",
-        "hub.callback": callback_url
-    })
-    
-    log_message(f"🔕 WebSub Unsubscription Response: {response.status_code} {response.text}")
-
-def rotate_token():
-    """Rotates the token immediately on startup and then every rotation period."""
-    global CURRENT_TOKEN
-    
-    while True:
+    subs = list(_subscriptions.values())
+    for i, sub in enumerate(subs):
+        if i:
+            time.sleep(SUBSCRIPTION_SPACING)
+        _unsubscribe(sub)
+    log_message(f"🔕 WebSub Unsubscription sent for {len(subs)} channels")
+
+def handle_verification(args):
+    """Answers the hub's intent verification GET. Returns (challenge or error dict, status_code)."""
+    mode = args.get("hub.mode")
+    topic = args.get("hub.topic")
+    challenge = args.get("hub.challenge")
+
+    if mode == "denied":
+        WEBSUB_VERIFICATIONS.inc(mode, "ok")
+        log_message(f"⛔ Hub denied the subscription for {topic}: {args.get('hub.reason')}", level="warning")
+        channel_id = channel_id_from_topic(topic)
+        if get_channel(channel_id) is not None:
+            _schedule_retry(channel_id)
+        return "", 200
+
+    if not challenge:
+        return {"error": "Missing challenge token"}, 400
+
+    # The (un)subscribe may have been sent by the leader, from another process
+    if SHARED_DATABASE:
+        _refresh(topic)
+    sub = _subscriptions.get(topic)
+    # Only the hub has seen the subscription's callback URL, so a forged verification can't echo its token
+    token = args.get("token") or ""
+    token_matches = sub is not None and hmac.compare_digest(sub.verify_token or "", token)
+
+    if mode == "subscribe":
+        # Only confirm a subscribe this instance has in flight, for a channel it still watches
+        if not token_matches or not sub.pending_secret or get_channel(sub.channel_id) is None:
+            WEBSUB_VERIFICATIONS.inc(mode, "rejected")
+            log_message(f"🔒 Refusing to verify an unexpected subscription to {topic}.", level="warning")
+            return {"error": "Unknown subscription"}, 404
+
+        # The hub may grant less than we asked for, but never more
         try:
-            if CURRENT_TOKEN is not None:
-                unsubscribe_websub(CURRENT_TOKEN)
-            
-            CURRENT_TOKEN = generate_new_token()
-            subscribe_websub(CURRENT_TOKEN)
-            log_message("🔄 Token rotated")
-        except Exception as e:
-            log_message(f"❌ Error during token rotation: {e}", level="error")
-            time.sleep(5)  # Short delay before retrying in case of failure
-            continue  # Restart the loop immediately
-        
-        time.sleep(TOKEN_ROTATION_PERIOD)  # Sleep until next rotation
\ No newline at end of file
+            lease_seconds = int(args.get("hub.lease_seconds") or WEBSUB_LEASE_SECONDS)
+        except ValueError:
+            lease_seconds = WEBSUB_LEASE_SECONDS
+        if not 0 < lease_seconds <= WEBSUB_LEASE_SECONDS:
+            lease_seconds = WEBSUB_LEASE_SECONDS
+
+        now = time.time()
+        with _lock:
+            if sub.pending_secret and sub.pending_secret != sub.secret:
+                # Pushes the hub signed with the old secret may still be on their way
+                if sub.secret:
+                    sub.previous_secret = sub.secret
+                    sub.previous_until = now + WEBSUB_SECRET_OVERLAP
+                sub.secret = sub.pending_secret
+            sub.pending_secret = None
+            sub.lease_seconds = lease_seconds
+            sub.expires_at = now + lease_seconds
+            sub.verified_at = now
+        _save(sub)
+        _schedule_renewal(sub)
+
+        WEBSUB_VERIFICATIONS.inc(mode, "ok")
+        log_message(f"✅ WebSub subscription verified for {sub.channel_id} (lease {lease_seconds}s)")
+        return challenge, 200
+
+    if mode == "unsubscribe":
+        if not token_matches or not sub.unsubscribing:
+            WEBSUB_VERIFICATIONS.inc(mode, "rejected")
+            log_message(f"🔒 Refusing to verify an unexpected unsubscribe from {topic}.", level="warning")
+            return {"error": "Unknown subscription"}, 404
+
+        with _lock:
+            _subscriptions.pop(topic, None)
+        delete_subscription(topic)
+        WEBSUB_VERIFICATIONS.inc(mode, "ok")
+        log_message(f"✅ WebSub unsubscription verified for {sub.channel_id}")
+        return challenge, 200
+
+    return {"error": "Unknown hub.mode"}, 400
+
+def start_subscriptions():
+    """Loads persisted leases and schedules renewals; only channels without a usable lease are subscribed now. Runs on the leader."""
+    global _current_secret
+
+    state = get_state(SECRET_STATE_KEY)
+    if state:
+        _current_secret = (state[0], state[1])
+
+    load_subscriptions()
+
+    now = time.time()
+    registered = {channel.topic for channel in get_all_channels()}
+    to_subscribe = []
+
+    for channel in get_all_channels():
+        sub = _subscriptions.get(channel.topic)
+        if sub and sub.secret and not sub.unsubscribing and sub.expires_at - now > sub.lease_seconds * WEBSUB_RENEW_BEFORE:
+            _schedule_renewal(sub)
+        else:
+            to_subscribe.append(channel.channel_id)
+
+    stale = [sub.channel_id for topic, sub in _subscriptions.items() if topic not in registered]
+
+    # Spaced out through the scheduler so the hub isn't hit in a burst
+    for i, channel_id in enumerate(to_subscribe):
+        schedule("renew", channel_id, now + i * SUBSCRIPTION_SPACING, persist=False)
+    for i, channel_id in enumerate(stale, start=len(to_subscribe)):
+        schedule("unsubscribe", channel_id, now + i * SUBSCRIPTION_SPACING, persist=False)
+
+    log_message(
+        f"🔔 WebSub: {len(registered) - len(to_subscribe)} leases still valid, "
+        f"{len(to_subscribe)} channels to subscribe, {len(stale)} to unsubscribe."
+    )
+
+register_handler("renew", renew_subscription, leader_only=True)
+register_handler("unsubscribe", unsubscribe_channel, leader_only=True)
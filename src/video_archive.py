@@ -0,0 +1,132 @@
+import base64
+import bisect
+import gzip
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from array import array
+
+from src.metrics import Gauge
+from src.config import DATA_DIR
+
+# Videos moved out of the database (see src/maintenance.py), as gzip-compressed JSON Lines files
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+# Sorted 64-bit keys of every archived video, in native byte order, so duplicate checks never open the archives
+INDEX_FILE = os.path.join(ARCHIVE_DIR, "video_ids.idx")
+
+# YouTube's IDs are 11 base64url characters whose last one only carries 4 bits, so they fit 64 bits exactly
+_YOUTUBE_ID = re.compile(r"[A-Za-z0-9_-]{10}[AEIMQUYcgkosw048]")
+
+# Seconds between checks for an index another process (the leader) rewrote; its own writes update memory directly
+INDEX_RECHECK_SECONDS = 60
+
+_keys = array("Q")
+_loaded_mtime = None
+_checked_at = None
+_lock = threading.Lock()
+
+Gauge("ytnotis_archived_videos", "Videos moved from the database to the archive.", lambda: len(_keys))
+
+def video_key(video_id: str) -> int:
+    """Maps a video ID to its unsigned 64-bit key: exact for YouTube IDs, a hash for anything else."""
+    if _YOUTUBE_ID.fullmatch(video_id):
+        return int.from_bytes(base64.urlsafe_b64decode(video_id + "="), "big")
+    return int.from_bytes(hashlib.blake2b(video_id.encode(), digest_size=8).digest(), "big")
+
+def _load():
+    """(Re)reads the index if the file changed since, e.g. because the leader in another process archived more.
+
+    Looks at the file once, then at most every INDEX_RECHECK_SECONDS, so lookups stay in memory.
+    """
+    global _keys, _loaded_mtime, _checked_at
+    now = time.monotonic()
+    if _checked_at is not None and now - _checked_at < INDEX_RECHECK_SECONDS:
+        return
+    _checked_at = now
+    try:
+        mtime = os.stat(INDEX_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return
+    if mtime == _loaded_mtime:
+        return
+
+    keys = array("Q")
+    with open(INDEX_FILE, "rb") as f:
+        keys.frombytes(f.read())
+    _keys, _loaded_mtime = keys, mtime
+
+def is_archived(video_id: str) -> bool:
+    """Returns True if the video was moved to the archive (a binary search over 8 bytes per archived video)."""
+    _load()
+    keys = _keys
+    key = video_key(video_id)
+    i = bisect.bisect_left(keys, key)
+    return i < len(keys) and keys[i] == key
+
+def _unique(sorted_keys):
+    previous = None
+    for key in sorted_keys:
+        if key != previous:
+            yield key
+            previous = key
+
+def _write_durably(path: str, write):
+    """Writes through a temporary file that replaces `path` only once it's complete and on disk."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def add_to_index(video_ids):
+    """Merges the videos' keys into the index and rewrites the file."""
+    global _keys, _loaded_mtime, _checked_at
+    with _lock:
+        # Merged into what's on disk now, in case another process archived since the last check
+        _checked_at = None
+        _load()
+        merged = array("Q", _unique(heapq.merge(_keys, sorted(map(video_key, video_ids)))))
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        _write_durably(INDEX_FILE, merged.tofile)
+        _keys, _loaded_mtime = merged, os.stat(INDEX_FILE).st_mtime_ns
+
+def write_archive(records) -> tuple:
+    """Writes video records (dicts with a video_id) to a new gzip-compressed JSON Lines file in ARCHIVE_DIR.
+
+    Returns the file's path and the archived IDs, or (None, []) if there was nothing to write (no file is created then).
+    """
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return None, []
+
+    # mkstemp picks a name no other archive has, even for several runs within the same second
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=time.strftime("videos-%Y%m%d-%H%M%S-"), suffix=".jsonl.gz.tmp", dir=ARCHIVE_DIR)
+    path = tmp[:-len(".tmp")]
+    video_ids = []
+    try:
+        with os.fdopen(fd, "wb") as f:
+            with gzip.GzipFile(fileobj=f, mode="wb") as archive:
+                for record in itertools.chain((first,), records):
+                    archive.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n")
+                    video_ids.append(record["video_id"])
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return path, video_ids
+
+def get_archive_stats() -> dict:
+    """Returns how many videos are archived and the index's size on disk."""
+    _load()
+    return {"videos": len(_keys), "index_bytes": len(_keys) * _keys.itemsize}
@@ -0,0 +1,99 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from src.database import get_cached_video, save_cached_video
+from src.config import (
+    VIDEO_CACHE_SIZE, VIDEO_CACHE_TTL_UPCOMING, VIDEO_CACHE_TTL_SCHEDULED, VIDEO_CACHE_TTL_PUBLIC,
+    VIDEO_CACHE_TTL_OTHER, VIDEO_CACHE_PERSIST
+)
+
+# video_id -> (data, etag, expires_at), least recently used first
+_entries = OrderedDict()
+_lock = threading.Lock()
+_counters = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0, "revalidated": 0, "disk_hits": 0}
+
+def ttl_for(data: dict) -> float:
+    """Picks how long metadata stays fresh based on the video's state."""
+    if data.get("liveBroadcastContent") in ("upcoming", "live"):
+        return VIDEO_CACHE_TTL_UPCOMING
+    if data.get("publishAt"):
+        return VIDEO_CACHE_TTL_SCHEDULED  # Members-first; goes public at publishAt
+    if data.get("privacyStatus") == "public":
+        return VIDEO_CACHE_TTL_PUBLIC
+    return VIDEO_CACHE_TTL_OTHER
+
+def _store(video_id: str, data: dict, etag: str | None, expires_at: float):
+    """Inserts an entry as most recently used, evicting the oldest beyond the size limit."""
+    with _lock:
+        _entries[video_id] = (data, etag, expires_at)
+        _entries.move_to_end(video_id)
+        while len(_entries) > VIDEO_CACHE_SIZE:
+            _entries.popitem(last=False)
+            _counters["evictions"] += 1
+
+def _lookup(video_id: str):
+    """Returns the (data, etag, expires_at) entry from memory, falling back to the SQLite tier."""
+    with _lock:
+        entry = _entries.get(video_id)
+        if entry is not None:
+            _entries.move_to_end(video_id)
+            return entry
+
+    if not VIDEO_CACHE_PERSIST:
+        return None
+
+    row = get_cached_video(video_id)
+    if row is None:
+        return None
+
+    data_json, etag, expires_at = row
+    entry = (json.loads(data_json), etag, expires_at)
+    _store(video_id, *entry)
+    with _lock:
+        _counters["disk_hits"] += 1
+    return entry
+
+def get_fresh(video_id: str) -> dict | None:
+    """Returns cached metadata if it hasn't expired, counting a hit or miss."""
+    entry = _lookup(video_id)
+    with _lock:
+        if entry is not None and entry[2] > time.time():
+            _counters["hits"] += 1
+            return entry[0]
+        _counters["stale" if entry is not None else "misses"] += 1
+    return None
+
+def get_etag(video_id: str) -> tuple[dict, str] | None:
+    """Returns (data, etag) for an entry that can be revalidated with If-None-Match, fresh or not."""
+    entry = _lookup(video_id)
+    if entry is None or not entry[1]:
+        return None
+    return entry[0], entry[1]
+
+def put(video_id: str, data: dict, etag: str | None = None):
+    """Caches complete metadata (incomplete responses are re-polled, so they're not kept)."""
+    if not data or not data.get("title") or not data.get("liveBroadcastContent"):
+        return
+
+    expires_at = time.time() + ttl_for(data)
+    _store(video_id, data, etag, expires_at)
+    if VIDEO_CACHE_PERSIST:
+        save_cached_video(video_id, json.dumps(data), etag, expires_at)
+
+def revalidated(video_id: str) -> dict | None:
+    """Marks a cached entry as confirmed unchanged (HTTP 304) and extends its lifetime."""
+    entry = _lookup(video_id)
+    if entry is None:
+        return None
+
+    with _lock:
+        _counters["revalidated"] += 1
+    put(video_id, entry[0], entry[1])
+    return entry[0]
+
+def get_cache_stats() -> dict:
+    """Returns cache size and hit/miss/eviction counters."""
+    with _lock:
+        return {"size": len(_entries), "capacity": VIDEO_CACHE_SIZE, "persistent": VIDEO_CACHE_PERSIST, **_counters}
@@ -1,73 +1,139 @@
-import threading
-from datetime import datetime, timezone
+import time
+from datetime import datetime
 
-from src.youtube_api import fetch_youtube_video_data
-from src.discord_notifier import send_discord_message
-from src.database import store_video_id, was_posted, get_scheduled_videos
+from src.scheduler import schedule, cancel, register_handler, load_persisted_jobs, discard_persisted, pending_count
+from src.youtube_api import fetch_youtube_video_data, fetch_youtube_videos_data, MAX_IDS_PER_CALL
+from src.discord_notifier import queue_discord_message
+from src.message_templates import render, iso_to_unix
+from src.database import get_video_state, transition_video, get_scheduled_videos, get_video_channel
+from src.channels import get_channel
+from src.metrics import Gauge
 from src.logger import log_message
-from src.config import DISCORD_NOTI_ROLE
+from src.config import DISCORD_WEBHOOK_URL, RECOVERY_BATCH_INTERVAL
+
+# Marks a recovery batch being tried a second time, and how long it waits for that
+RETRY_PREFIX = "retry:"
+RECOVERY_RETRY_DELAY = 60
+
+Gauge("ytnotis_pending_rechecks", "Members-first videos waiting for their public recheck.", lambda: pending_count("recheck"))
 
 def schedule_recheck(video_id, publish_at):
   """Schedules a recheck for a members-only video expected to go public."""
   try:
     publish_time = datetime.fromisoformat(publish_at.replace("Z", "+00:00"))
-    delay = max(0, (publish_time - datetime.now(timezone.utc)).total_seconds())
+    due_at = publish_time.timestamp()
 
-    if delay <= 0:
-      log_message(f"⌛ Publish time for {video_id} is in the past. Checking immediately")
-      recheck_video(video_id)
+    # The scheduler runs past-due jobs right away, on its bounded pool rather than the caller's thread
+    if not schedule("recheck", video_id, due_at):
+      log_message(f"📅 Recheck for {video_id} already scheduled at {publish_time}.")
       return
-    
-    log_message(f"📅 Scheduling recheck for {video_id} in {delay} seconds (at {publish_time}).")
 
-    # Run recheck in a separate thread to avoid blocking the main process
-    threading.Timer(delay, recheck_video, args=[video_id]).start()
+    log_message(f"📅 Scheduled recheck for {video_id} at {publish_time}.")
 
   except Exception as e:
     log_message(f"❌ Error scheduling recheck for {video_id}: {e}")
 
-def recheck_video(video_id):
+def cancel_recheck(video_id):
+  """Cancels a pending recheck for a video, if there is one."""
+  if cancel("recheck", video_id):
+    log_message(f"🗑️ Cancelled recheck for {video_id}.")
+
+def recheck_video(video_id, video_data=None):
   """Checks if a scheduled members-only video has gone public and notifies Discord if so."""
   log_message(f"🔁 Rechecking video {video_id}")
 
-  if was_posted(video_id):
-    log_message(f"🏁 Video {video_id} was already posted; skipping.")
+  state = get_video_state(video_id)
+  if state != "scheduled":
+    log_message(f"🏁 Video {video_id} is {state or 'unknown'}, not waiting for a recheck; skipping.")
     return
   
-  video_data = fetch_youtube_video_data(video_id)
+  if video_data is None:
+    video_data = fetch_youtube_video_data(video_id, fresh=True)
   if not video_data:
     log_message(f"❌ Failed to fetch video data for {video_id}.")
     return
   
   if video_data["privacyStatus"] == "public":
-    video_url = video_data["url"]
     video_title = video_data["title"]
     publish_at = video_data.get("publishAt") # Can be none
 
     if publish_at:
-      publish_datetime = datetime.fromisoformat(publish_at.replace("Z", "+00:00"))
+      publish_unix = iso_to_unix(publish_at)
 
-      if publish_datetime > datetime.now(tz=publish_datetime.tzinfo):
+      if publish_unix and publish_unix > time.time():
         log_message(f"🕒 Video {video_id} is scheduled for {publish_at}. Rechecking later.")
+        transition_video(video_id, "scheduled", ("scheduled",), publishAt=publish_at, metadata=video_data)
         schedule_recheck(video_id, publish_at)
         return
       
-    discord_message = f"🎬 <@&{DISCORD_NOTI_ROLE}> New Video: {video_title}!\n🔗 {video_url}"
+    # Videos stored before multi-channel support have no channel and go to the default target (and templates)
+    channel = get_channel(get_video_channel(video_id))
+    webhook_url = channel.discord_webhook_url if channel else DISCORD_WEBHOOK_URL
 
-    if send_discord_message(discord_message):
-      store_video_id(video_id, discord_posted=True)
-      log_message(f'✅ Succesfully notified Discord about video with title: "{video_title}" and id: {video_id}.')
+    if queue_discord_message(render("video", video_data, channel, video_id), webhook_url=webhook_url, video_id=video_id, channel_id=channel.channel_id if channel else None):
+      log_message(f'✅ Queued Discord notification about video with title: "{video_title}" and id: {video_id}.')
     else:
-      log_message(f"🚨 Discord notification failed for {video_id}")
+      log_message(f"🚨 Discord notification could not be queued for {video_id}")
 
   else:
+    # Not rechecked again (even after a restart) unless a push shows the video changed
     log_message(f"❌ Video {video_id} is still not public.")
+    transition_video(video_id, "ignored", ("scheduled",), metadata=video_data)
+
+register_handler("recheck", recheck_video, leader_only=True)
+
+def recover_overdue(target):
+  """Scheduler handler: rechecks a batch of videos that came due while the app was down (target holds their comma-separated IDs).
+
+  A "retry:" prefix marks a batch whose first call returned nothing.
+  """
+  retry = target.startswith(RETRY_PREFIX)
+  video_ids = target.removeprefix(RETRY_PREFIX).split(",")
+  results = fetch_youtube_videos_data(video_ids)
+
+  if not any(results.values()):
+    # Most likely the call itself failed. One more try for the whole batch, rather than an API call per video
+    if not retry:
+      log_message(f"⚠️ Recovery batch of {len(video_ids)} rechecks got no data; retrying in {RECOVERY_RETRY_DELAY}s.", level="warning")
+      schedule("recovery", RETRY_PREFIX + ",".join(video_ids), time.time() + RECOVERY_RETRY_DELAY, persist=False)
+    else:
+      # Still scheduled in the database, so the next start's recovery picks them up again
+      log_message(f"❌ Recovery batch of {len(video_ids)} rechecks got no data twice; leaving them for the next start.", level="error")
+    return
+
+  for video_id, video_data in results.items():
+    cancel("recheck", video_id)
+    if video_data is None:
+      # The call worked but left this one out: deleted or made private, so there's nothing to announce
+      log_message(f"❌ Video {video_id} is gone or private; not rechecking it.")
+      transition_video(video_id, "ignored", ("scheduled",))
+      continue
+    recheck_video(video_id, video_data)
+
+register_handler("recovery", recover_overdue, leader_only=True)
 
 def resume_scheduled_tasks():
-  """Resumes any scheduled video rechecks on bot restart."""
+  """Resumes the scheduled video rechecks stored by a previous run (or another process). Runs on the leader."""
   log_message("🔎 Checking for scheduled videos to post later.")
   scheduled_videos = get_scheduled_videos()
 
+  # Overdue videos are fetched together in 50-ID batches instead of one API call each
+  overdue = []
+  now = time.time()
+  for video_id, publish_at in scheduled_videos:
+    publish_unix = iso_to_unix(publish_at)
+    if publish_unix is None:
+      log_message(f"⚠️ Invalid publishAt {publish_at!r} for {video_id}; scheduling normally.", level="warning")
+    elif publish_unix <= now:
+      overdue.append(video_id)
+
+  # The scheduler is already running, so overdue rechecks are kept off the heap rather than fired alongside the batch
+  skip = {("recheck", video_id) for video_id in overdue}
+  loaded = load_persisted_jobs(skip=skip)
+  # ...and their stored rows go too, or the next cluster sync would load them on top of the batches
+  discard_persisted(skip)
+  log_message(f"⏰ Loaded {loaded} persisted scheduler jobs.")
+
   if not scheduled_videos:
     log_message("✅ No scheduled rechecks to resume.")
     return
@@ -75,5 +141,15 @@ def resume_scheduled_tasks():
   log_message(f"⏳ Resuming {len(scheduled_videos)} scheduled rechecks...")
 
   for video_id, publish_at in scheduled_videos:
-    log_message(f"📅 Rescheduling recheck for video {video_id} at {publish_at}.")
-    schedule_recheck(video_id, publish_at)
\ No newline at end of file
+    if ("recheck", video_id) not in skip:
+      # Rechecks persisted by the scheduler are already loaded; duplicates are ignored
+      schedule_recheck(video_id, publish_at)
+
+  if overdue:
+    batches = [overdue[i:i + MAX_IDS_PER_CALL] for i in range(0, len(overdue), MAX_IDS_PER_CALL)]
+    log_message(f"⌛ {len(overdue)} rechecks are overdue. Checking them in {len(batches)} batches in the background.")
+
+    # Handed to the scheduler's pool (SCHEDULER_CONCURRENCY at once) and spaced out, so a long outage's
+    # backlog neither holds up startup nor bursts the API and Discord
+    for number, batch in enumerate(batches):
+      schedule("recovery", ",".join(batch), now + number * RECOVERY_BATCH_INTERVAL, persist=False)
@@ -1,131 +1,136 @@
 from flask import request, jsonify, make_response
-from datetime import datetime
-import time
 import xml.etree.ElementTree as ET
 
-from src.token_manager import get_current_token
-from src.database import is_video_in_db, store_video_id
-from src.youtube_api import fetch_youtube_video_data
-from src.discord_notifier import send_discord_message, should_notify
-from src.video_rechecks import schedule_recheck
-from src.logger import log_message
-from src.config import DISCORD_NOTI_ROLE
-
-def youtube_webhook():
-    """Handles YouTube WebSub webhook."""
-
-    token = get_current_token()
-
-    # Handling the Google confirmation GET when subscribing
-    if request.method == 'GET':
-        hub_challenge = request.args.get("hub.challenge")
-        if hub_challenge:
-          return make_response(hub_challenge, 200)
-        else:
-            return make_response(jsonify({"error": "Missing challenge token"}), 400)
+from src.atom_parser import parse_atom_payload, PayloadRejected, MAX_PAYLOAD_BYTES
+from src.token_manager import handle_verification, verify_signature
+from src.database import get_video_state, record_seen, transition_video, SETTLED_STATES
+from src.channels import get_channel, is_loaded as channels_loaded
+from src.discord_notifier import should_notify
+from src.pipeline import process_video
+from src.livestreams import is_tracked, poke
+from src.video_rechecks import cancel_recheck
+from src.work_queue import enqueue_job
+from src.inflight import claim, release
+from src.metrics import Counter, Histogram
+from src.logger import log_message, log_payload
+
+WEBHOOK_REQUESTS = Counter("ytnotis_webhook_requests_total", "Webhook requests by outcome.", ("outcome", "code"))
+WEBHOOK_SECONDS = Histogram("ytnotis_webhook_seconds", "Time spent handling a webhook request.", ("method",))
+
+def handle_webhook(method: str, args, body: bytes, headers):
+    """Handles a YouTube WebSub request independent of the web framework.
+
+    Returns (response, status_code), where response is the challenge string or a JSON-able dict.
+    """
+    with WEBHOOK_SECONDS.time(method):
+        response, status = _handle_webhook(method, args, body, headers)
+
+    if isinstance(response, dict):
+        outcome = response.get("status") or response.get("error")
+    else:
+        outcome = "challenge"
+    WEBHOOK_REQUESTS.inc(outcome, status)
+    return response, status
+
+def _handle_webhook(method: str, args, body: bytes, headers):
+    """Validates, parses and routes one webhook request."""
+
+    # Handling the hub's verification GET when (un)subscribing
+    if method == 'GET':
+        return handle_verification(args)
     
-    # Checking to make sure the presented token matches
-    if request.args.get("token") != token:
-        log_message(f"🔒 Invalid token presented, aborting.")
-        return make_response(jsonify({"error": "Invalid token"}), 403)
+    # Checking the push was signed with one of our hub.secrets. The hub must still get a 2xx, so it doesn't retry it
+    if not verify_signature(body, headers.get("X-Hub-Signature") or headers.get("x-hub-signature")):
+        log_message("🔒 Push with a missing or invalid signature, ignoring.")
+        return {"status": "ignored - invalid signature"}, 200
     
     try:
-        raw_data = request.data.decode("utf-8")
-        log_message(f"🔔 Incoming Webhook Request:\nHeaders: {request.headers}\nQuery Params: {request.args}\nData:\n{raw_data}")
+        log_payload("🔔 Incoming Webhook Request", body, headers=dict(headers), args=dict(args))
         
         try:
-            root = ET.fromstring(raw_data)
-            namespaces = {"atom": "http://www.w3.org/2005/Atom", "yt": "http://www.youtube.com/xml/schemas/2015", "at": "http://purl.org/atompub/tombstones/1.0"}
+            entry = parse_atom_payload(body)
             
             # Do nothing if it's a Video Deleted notification
-            if root.find(".//at:deleted-entry", namespaces):
+            if entry.deleted:
                 log_message("⚠️ Video Deletion. Ignoring.")
-                return make_response(jsonify({"status": "ignored - deleted video"}), 200)
+                # A members-first video deleted before going public no longer needs its recheck
+                if entry.video_id and transition_video(entry.video_id, "ignored", ("scheduled",)):
+                    cancel_recheck(entry.video_id)
+                return {"status": "ignored - deleted video"}, 200
             
-            # Get the video ID and Published info
-            video_id_elem = root.find(".//yt:videoId", namespaces)
-            published_elem = root.find(".//atom:published", namespaces)
-            
-            video_id = video_id_elem.text if video_id_elem is not None else None
-            published = published_elem.text if published_elem is not None else "Unknown"
+            video_id = entry.video_id
+            channel_id = entry.channel_id
+            published = entry.published or "Unknown"
             
             if not video_id:
                 log_message("⚠️ No video ID Detected. Aborting.")
-                return make_response(jsonify({"error": "No video ID found"}), 400)
+                return {"error": "No video ID found"}, 400
             
-            log_message(f"📺 Received Video ID: {video_id}, Published: {published}")
+            log_message("📺 Received Video", video_id=video_id, channel_id=channel_id, published=published)
+
+            # Route the push to the channel it belongs to
+            channel = get_channel(channel_id)
+            if channel is None and not channels_loaded():
+                # Still starting up: have the hub retry the push instead of dropping it
+                log_message(f"⏳ Push for {video_id} arrived before the channels were loaded. Asking the hub to retry.")
+                return {"error": "Starting up"}, 503
+            if channel is None:
+                log_message(f"❔ Push for unregistered channel {channel_id}. Ignoring.")
+                return {"status": "ignored - unknown channel"}, 200
             
             # Check to make sure the video is not stale (editting old content)
             if not should_notify(published):
                 log_message(f"⌛ Published {published}, which is older than the threshold. Aborting")
-                return make_response(jsonify({"status": "ignored - outdated video"}), 200)
-            
-            # If the ID is already in the database, do nothing.
-            if is_video_in_db(video_id):
-                log_message(f"🔁 Video {video_id} already posted. Skipping.")
-                return make_response(jsonify({"status": "ignored - duplicate video"}), 200)
+                return {"status": "ignored - outdated video"}, 200
             
-            # Getting the video data from YouTube API
-            log_message(f"📩 Attempting to get video data from YouTube API for video id: {video_id}")
-            time.sleep(5)
-            video_data = fetch_youtube_video_data(video_id)
-            if not video_data:
-                log_message("❌ Failed to fetch YouTube data.")
-                return make_response(jsonify({"error": "Failed to fetch video data"}), 500)
-            
-            privacy_status = video_data.get("privacyStatus")
-            publish_at = video_data.get("publishAt")
-            live_broadcast = video_data.get("liveBroadcastContent")
-            video_url = video_data.get("url")
-            video_title = video_data.get("title")
-
-            # Case 1: Upcoming Livestream
-            if live_broadcast == "upcoming":
-                log_message(f"🎥 Upcoming Livestream detected for {video_id}")
-
-                scheduled_time_iso = video_data.get("scheduledStartTime")
-                if scheduled_time_iso:
-                    dt = datetime.fromisoformat(scheduled_time_iso.replace("Z", "+00:00"))
-                    unix_timestamp = int(dt.timestamp())
-                    scheduled_time = f"<t:{unix_timestamp}:R>"
-                else:
-                    scheduled_time = "is not known"
-
-                discord_message = f"⭕ Livestream Scheduled!\nStarting {scheduled_time}!\n\n🔗 {video_url}"
-
-                if send_discord_message(discord_message):
-                    store_video_id(video_id, discord_posted=True)
-
-                return make_response(jsonify({"status": "notified - upcoming livestream"}), 200)
-        
-            # Case 2: Members-Only Video (Will be public later)
-            if privacy_status == "public" and publish_at:
-                log_message(f"🕒 Members-only video detected, scheduling recheck for {publish_at}")
+            # Answered from the video's recorded state, without refetching it
+            state = get_video_state(video_id)
+            if state in SETTLED_STATES:
+                log_message(f"🔁 Video {video_id} already {state}. Skipping.")
+                # A push about a followed stream usually means its start time changed or it went live
+                if is_tracked(video_id):
+                    poke(video_id)
+                return {"status": "ignored - duplicate video"}, 200
+
+            # Merge bursts of pushes about the same video into a single pipeline run.
+            # Claimed before recording, so a merged push never leaves an ignored/failed video in `seen` with no run for it
+            if not claim(video_id):
+                log_message(f"🧲 Video {video_id} already in flight or just handled. Merging push.")
+                return {"status": "ignored - coalesced"}, 200
+
+            # Seen/fetching videos were accepted before (e.g. by a run that crashed) and only need the claim above.
+            # New videos are recorded first; ignored/failed ones only reopen when the push is a newer update.
+            if state not in ("seen", "fetching") and not record_seen(video_id, channel.channel_id, entry.updated):
+                release(video_id, allow_rerun=False, debounce=False)
+                log_message(f"🙈 Video {video_id} was already {state} and hasn't been updated since. Skipping.")
+                return {"status": "ignored - already handled"}, 200
+
+            # A reopened video changed since its cached metadata made it ignored/failed, so that entry must not answer
+            reopened = state in ("ignored", "failed")
+
+            # Hand the slow fetch/notify work to the worker pool and acknowledge the hub right away
+            if not enqueue_job(process_video, video_id, channel.channel_id, 0, None, reopened):
+                release(video_id, allow_rerun=False)
+                return {"error": "Work queue full"}, 503
+
+            return {"status": "queued"}, 202
+
+        except PayloadRejected as e:
+            log_message(f"🚫 Rejected Webhook Payload: {e}")
+            return {"error": "Payload rejected"}, 413 if len(body) > MAX_PAYLOAD_BYTES else 400
 
-                store_video_id(video_id, publish_at=publish_at, discord_posted=False)
-                schedule_recheck(video_id, publish_at)
-
-                return make_response(jsonify({"status": "scheduled - future public video"}), 200)
-            
-            # Case 3: Instantly Public Video
-            if privacy_status == "public" and not publish_at:
-                log_message(f"✅ Public video detected: {video_id}")
-
-                discord_message = f"🎬 <@&{DISCORD_NOTI_ROLE}> New Video: {video_title}!\n🔗 {video_url}"
-
-                if send_discord_message(discord_message):
-                    store_video_id(video_id, discord_posted=True)
-
-                return make_response(jsonify({"status": "notified - public video"}), 200)     
-        
         except ET.ParseError:
             log_message("❌ XML Parse Error: Invalid Webhook Payload")
-            return make_response(jsonify({"error": "Invalid XML"}), 400)
+            return {"error": "Invalid XML"}, 400
     
     except Exception as e:
         log_message(f"❌ ERROR: {str(e)}")
-        return make_response(jsonify({"error": "Server Error"}), 500)
+        return {"error": "Server Error"}, 500
 
-    # Default response if no specific case matched
-    return make_response(jsonify({"status": "ignored - no action taken"}), 200)
+def youtube_webhook():
+    """Handles YouTube WebSub webhook (Flask view)."""
+    response, status = handle_webhook(request.method, request.args, request.get_data(), request.headers)
 
+    if isinstance(response, dict):
+        return make_response(jsonify(response), status)
+    return make_response(response, status)
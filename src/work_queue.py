@@ -0,0 +1,111 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from src.config import WORKER_COUNT, WORK_QUEUE_SIZE
+from src.metrics import Gauge, Histogram
+from src.logger import log_message
+
+# Jobs waiting for a worker: (handler, args, enqueued_at)
+_job_queue = queue.Queue(maxsize=WORK_QUEUE_SIZE)
+_workers = []
+# Workers running a job right now, and what to call once none are and the queue is empty
+_busy = 0
+_busy_lock = threading.Lock()
+_idle_callback = None
+
+# Per-stage latency stats: stage -> [count, total_seconds, max_seconds]
+_stage_stats = {}
+_stats_lock = threading.Lock()
+
+STAGE_SECONDS = Histogram("ytnotis_pipeline_stage_seconds", "Latency of each pipeline stage.", ("stage",))
+Gauge("ytnotis_work_queue_depth", "Jobs waiting for a pipeline worker.", lambda: _job_queue.qsize())
+
+def record_stage(stage: str, seconds: float):
+    """Adds a latency sample for a pipeline stage."""
+    STAGE_SECONDS.observe(seconds, stage)
+    with _stats_lock:
+        stats = _stage_stats.setdefault(stage, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+
+@contextmanager
+def timed_stage(stage: str):
+    """Times the wrapped block and records it under the given stage name."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.monotonic() - start)
+
+def enqueue_job(handler, *args) -> bool:
+    """Queues a job for the worker pool. Returns False if the queue is full."""
+    try:
+        _job_queue.put_nowait((handler, args, time.monotonic()))
+        return True
+    except queue.Full:
+        log_message(f"🚧 Work queue is full ({WORK_QUEUE_SIZE} jobs), rejecting job.", level="warning")
+        return False
+
+def set_idle_callback(callback):
+    """Registers a function called whenever the pool runs out of work (e.g. to flush a batch its jobs filled)."""
+    global _idle_callback
+    _idle_callback = callback
+
+def is_idle() -> bool:
+    """Returns True if no job is queued or running, so no job is about to submit more work."""
+    with _busy_lock:
+        return _busy == 0 and _job_queue.empty()
+
+def _worker_loop():
+    """Pulls jobs off the queue and runs them until the process exits."""
+    global _busy
+    while True:
+        handler, args, enqueued_at = _job_queue.get()
+        with _busy_lock:
+            _busy += 1
+        record_stage("queue_wait", time.monotonic() - enqueued_at)
+        try:
+            with timed_stage("job_total"):
+                handler(*args)
+        except Exception as e:
+            log_message(f"❌ Worker job {getattr(handler, '__name__', handler)} failed: {e}", level="error")
+        finally:
+            _job_queue.task_done()
+            with _busy_lock:
+                _busy -= 1
+            if _idle_callback is not None and is_idle():
+                _idle_callback()
+
+def start_workers():
+    """Starts the bounded worker pool (only once)."""
+    if _workers:
+        return
+
+    for i in range(WORKER_COUNT):
+        worker = threading.Thread(target=_worker_loop, name=f"pipeline-worker-{i}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+
+    log_message(f"👷 Started {WORKER_COUNT} pipeline workers (queue size {WORK_QUEUE_SIZE}).")
+
+def get_queue_stats() -> dict:
+    """Returns the current queue depth and per-stage latency stats."""
+    with _stats_lock:
+        stages = {
+            stage: {
+                "count": count,
+                "avg_ms": round(total / count * 1000, 2) if count else 0.0,
+                "max_ms": round(longest * 1000, 2),
+            }
+            for stage, (count, total, longest) in _stage_stats.items()
+        }
+
+    return {
+        "queue_depth": _job_queue.qsize(),
+        "queue_capacity": WORK_QUEUE_SIZE,
+        "workers": len(_workers),
+        "stages": stages,
+    }
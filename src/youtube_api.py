@@ -1,31 +1,182 @@
+import threading
+import time
 import requests
+from concurrent.futures import Future
 
+from src import http_client, video_cache
+from src.work_queue import is_idle, set_idle_callback
+from src.metrics import Counter, Histogram
 from src.logger import log_message
-from src.config import YOUTUBE_API_KEY
-
-def fetch_youtube_video_data(video_id):
-    """Call YouTube API to determine if it's a video or livestream."""
-    url = f"https://www.googleapis.com/youtube/v3/videos?part=snippet,liveStreamingDetails,status&id={video_id}&key={YOUTUBE_API_KEY}"
-    
-    try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an error for non-200 responses
-        data = response.json()
-        
-        if "items" not in data or not data["items"]:
-            log_message(f"⚠️ No data found for video ID: {video_id}")
-            return None
-        
-        video = data["items"][0]
-        return {
-            "title": video["snippet"]["title"],
-            "url": f"https://www.youtube.com/watch?v={video_id}",
-            "liveBroadcastContent": video["snippet"].get("liveBroadcastContent", "none"),
-            "scheduledStartTime": video.get("liveStreamingDetails", {}).get("scheduledStartTime"),
-            "privacyStatus": video["status"].get("privacyStatus"), # Public, Private, or Unlisted
-            "publishAt": video["status"].get("publishAt") # Timestamp for scheduled public release
-        }
-    
-    except requests.exceptions.RequestException as e:
-        log_message(f"❌ YouTube API Error: {e}", level="error")
-        return None
\ No newline at end of file
+from src.config import YOUTUBE_API_KEY, YOUTUBE_BATCH_WINDOW, YOUTUBE_API_BASE
+
+# videos.list accepts at most 50 comma-separated IDs per call
+MAX_IDS_PER_CALL = 50
+# Largest thumbnail first; maxres only exists for HD uploads
+THUMBNAIL_SIZES = ("maxres", "standard", "high", "medium", "default")
+
+# IDs waiting for the next batch call: video_id -> Future shared by every caller asking for it
+_pending = {}
+# IDs whose batch call is on the wire; later callers join it instead of fetching again (single-flight)
+_in_progress = {}
+_pending_condition = threading.Condition()
+_batch_thread = None
+# Set when nothing else is about to join the pending batch, so it goes out without waiting the window
+_flush = False
+
+FETCH_SECONDS = Histogram("ytnotis_youtube_fetch_seconds", "fetch_youtube_video_data latency, by where the answer came from.", ("source",))
+API_CALL_SECONDS = Histogram("ytnotis_youtube_api_call_seconds", "Latency of single videos.list calls.")
+API_ERRORS = Counter("ytnotis_youtube_api_errors_total", "Failed videos.list calls and IDs that came back without data.", ("kind",))
+
+def _parse_video(video):
+    """Turns a videos.list item into the dict the rest of the app works with."""
+    video_id = video["id"]
+    video.setdefault("snippet", {})
+    video.setdefault("status", {})
+    thumbnails = video["snippet"].get("thumbnails") or {}
+    thumbnail = next((thumbnails[size]["url"] for size in THUMBNAIL_SIZES if size in thumbnails), None)
+    return {
+        "title": video["snippet"].get("title"),
+        "channelTitle": video["snippet"].get("channelTitle"),
+        "thumbnail": thumbnail,
+        "duration": video.get("contentDetails", {}).get("duration"), # ISO 8601, e.g. PT4M13S
+
+        "url": f"https://www.youtube.com/watch?v={video_id}",
+        "liveBroadcastContent": video["snippet"].get("liveBroadcastContent"), # None until YouTube has decided
+        "scheduledStartTime": video.get("liveStreamingDetails", {}).get("scheduledStartTime"),
+        "actualStartTime": video.get("liveStreamingDetails", {}).get("actualStartTime"), # Set once a stream is live
+        "actualEndTime": video.get("liveStreamingDetails", {}).get("actualEndTime"),
+        "privacyStatus": video["status"].get("privacyStatus"), # Public, Private, or Unlisted
+        "publishAt": video["status"].get("publishAt") # Timestamp for scheduled public release
+    }
+
+def fetch_youtube_videos_data(video_ids) -> dict:
+    """Fetches many videos with as few API calls as possible. Returns {video_id: data or None}."""
+    video_ids = list(dict.fromkeys(video_ids))  # De-duplicate, keep order
+    results = {video_id: None for video_id in video_ids}
+
+    for start in range(0, len(video_ids), MAX_IDS_PER_CALL):
+        chunk = video_ids[start:start + MAX_IDS_PER_CALL]
+        url = f"{YOUTUBE_API_BASE}/videos?part=snippet,contentDetails,liveStreamingDetails,status&id={','.join(chunk)}&key={YOUTUBE_API_KEY}"
+
+        # A response's ETag only covers that exact ID list, so conditional requests work for single lookups
+        headers = {}
+        cached = video_cache.get_etag(chunk[0]) if len(chunk) == 1 else None
+        if cached:
+            headers["If-None-Match"] = cached[1]
+
+        try:
+            with API_CALL_SECONDS.time():
+                response = http_client.get(url, headers=headers)
+
+            if response.status_code == 304:
+                results[chunk[0]] = video_cache.revalidated(chunk[0])
+                continue
+
+            response.raise_for_status()  # Raise an error for non-200 responses
+            data = response.json()
+            etag = data.get("etag") if len(chunk) == 1 else None
+
+            for video in data.get("items", []):
+                if video.get("id") in results:
+                    results[video["id"]] = _parse_video(video)
+                    video_cache.put(video["id"], results[video["id"]], etag)
+
+        except requests.exceptions.RequestException as e:
+            log_message(f"❌ YouTube API Error for {len(chunk)} video(s): {e}", level="error")
+            API_ERRORS.inc("request")
+            continue
+
+        for video_id in chunk:
+            if results[video_id] is None:
+                API_ERRORS.inc("missing")
+                log_message(f"⚠️ No data found for video ID: {video_id}")
+
+    return results
+
+def _batch_loop():
+    """Collects IDs for one coalescing window, then resolves them all with a single call."""
+    global _flush
+    while True:
+        with _pending_condition:
+            while not _pending:
+                _pending_condition.wait()
+
+            # Give other callers a short window to join this batch, unless it's full or nobody else is about to
+            deadline = time.monotonic() + YOUTUBE_BATCH_WINDOW
+            while len(_pending) < MAX_IDS_PER_CALL and not _flush:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                _pending_condition.wait(remaining)
+
+            _flush = False
+            batch = dict(list(_pending.items())[:MAX_IDS_PER_CALL])
+            for video_id in batch:
+                del _pending[video_id]
+            _in_progress.update(batch)
+
+        try:
+            results = fetch_youtube_videos_data(batch.keys())
+        except Exception as e:
+            log_message(f"❌ YouTube batch fetch failed: {e}", level="error")
+            results = {}
+
+        with _pending_condition:
+            for video_id in batch:
+                _in_progress.pop(video_id, None)
+
+        for video_id, future in batch.items():
+            future.set_result(results.get(video_id))
+
+def _submit(video_id) -> Future:
+    """Adds a video ID to the next batch, sharing the Future with any caller already waiting on it."""
+    global _batch_thread
+
+    with _pending_condition:
+        if _batch_thread is None:
+            _batch_thread = threading.Thread(target=_batch_loop, name="youtube-batcher", daemon=True)
+            _batch_thread.start()
+
+        future = _pending.get(video_id) or _in_progress.get(video_id)
+        if future is None:
+            future = Future()
+            _pending[video_id] = future
+            # Wake the batcher early once a full batch is waiting
+            if len(_pending) == 1 or len(_pending) >= MAX_IDS_PER_CALL:
+                _pending_condition.notify()
+        # A lookup from outside the pipeline workers (e.g. a recheck) while they're idle has nobody to wait for
+        if is_idle():
+            _flush_batch()
+        return future
+
+def _flush_batch():
+    """Sends the pending batch now: the pipeline workers that could add to it have all submitted."""
+    global _flush
+    with _pending_condition:
+        if _pending:
+            _flush = True
+            _pending_condition.notify()
+
+def fetch_youtube_video_data_async(video_id, fresh: bool = False) -> Future:
+    """Like fetch_youtube_video_data, but returns a Future instead of blocking the caller until the batch call."""
+    start = time.perf_counter()
+    if not fresh:
+        cached = video_cache.get_fresh(video_id)
+        if cached is not None:
+            FETCH_SECONDS.observe(time.perf_counter() - start, "cache")
+            future = Future()
+            future.set_result(cached)
+            return future
+
+    future = _submit(video_id)
+    future.add_done_callback(lambda _: FETCH_SECONDS.observe(time.perf_counter() - start, "api"))
+    return future
+
+def fetch_youtube_video_data(video_id, fresh: bool = False):
+    """Call YouTube API to determine if it's a video or livestream. Coalesced with other lookups in flight.
+
+    Served from the metadata cache while it's fresh, unless fresh=True (e.g. a recheck waiting for a state change).
+    """
+    return fetch_youtube_video_data_async(video_id, fresh).result()
+
+set_idle_callback(_flush_batch)